@@ -0,0 +1,312 @@
+"""Archive methods for DB Entities.
+
+Archiving marks an entity archived in its AuditState. Once archived for a while, assets and reservations (and the rows
+that hang off them) can be moved to the <table>_archive cold tables in batches, which keeps the hot tables and their
+indexes sized to live inventory, and restored from there.
+"""
+from database import model
+from database import create
+from database import availability
+from database import category_counts
+from database import scan
+from database import kits
+from database import loaders
+
+from typing import Dict, Iterable, List, Optional
+from datetime import datetime, timedelta
+from sqlalchemy import text
+
+
+
+
+# ARCHIVE
+
+
+
+
+def entity(auditable_entity_type: model.AuditableEntityTypes,
+           related_entity_id: int,
+           archived_by_user_id: int,
+           related_composite_id: Optional[int] = None,
+           audit_details: Optional[str] = None,
+           commit: bool = True):
+    """Archive an entity by recording an ARCHIVE AuditEntry, which also marks its AuditState as archived."""
+
+    # Move an asset from its category's available count to its archived count, once
+    if auditable_entity_type == model.AuditableEntityTypes.ASSET.value and not category_counts.is_asset_archived(related_entity_id):
+        asset = model.db.session.query(model.Asset).filter_by(id=related_entity_id).first()
+        if asset:
+            category_counts.adjust(asset.category_id,
+                                   available_count=-1 if asset.is_available else 0,
+                                   archived_count=1)
+
+    # The kit an asset is in, looked up while the asset is still live
+    if auditable_entity_type == model.AuditableEntityTypes.ASSET.value:
+        kit_root_ids = kits.kit_root_ids([related_entity_id]).values()
+
+    archive_audit_entry = create.audit_entry(operation_type=model.OperationType.ARCHIVE.value,
+                                             auditable_entity_type=auditable_entity_type,
+                                             related_entity_id=related_entity_id,
+                                             related_composite_id=related_composite_id,
+                                             created_by_user_id=archived_by_user_id,
+                                             audit_details=audit_details,
+                                             commit=False)
+
+    # Archived reservations no longer hold their assets
+    if auditable_entity_type == model.AuditableEntityTypes.RESERVATION.value:
+        availability.release(related_entity_id)
+    elif auditable_entity_type == model.AuditableEntityTypes.RESERVATION_ASSET.value:
+        availability.release(related_entity_id, asset_id=related_composite_id)
+
+    # Archived assets drop out of their kit, along with everything attached below them
+    if auditable_entity_type == model.AuditableEntityTypes.ASSET.value:
+        kits.invalidate(kit_root_ids)
+
+    # The ARCHIVE entry is written through Core, so nothing flushes, and by_id lookups made earlier this request would
+    # still return the entity as live
+    loaders.clear()
+
+    # Archived tags stop resolving
+    if auditable_entity_type == model.AuditableEntityTypes.ASSET_TAG.value:
+        asset_tag = model.db.session.query(model.AssetTag).filter_by(id=related_entity_id).first()
+        if asset_tag:
+            scan.invalidate(asset_tag.code_type, asset_tag.data)
+
+    # Commit only if commit=True
+    if commit:
+        model.db.session.commit()
+
+    return archive_audit_entry
+
+
+
+
+# COLD STORAGE
+
+
+
+
+# Archived rows are only moved once they've been archived this long, so a mistaken archive is still cheap to undo
+COLD_STORAGE_GRACE_DAYS = 30
+
+# Entities moved per batch. Each batch is a handful of set-based statements and is committed on its own.
+COLD_STORAGE_BATCH_SIZE = 1000
+
+# Tables that hang off assets and move with them
+_ASSET_DEPENDENT_TABLES = [model.AssetTag.__table__,
+                           model.AssetFlag.__table__,
+                           model.AssetCustomProperty.__table__,
+                           model.AssetLocationLog.__table__]
+
+# Archived assets that still have a child asset or a reservation line stay hot until those are gone
+_COLD_ASSET_BATCH = text("""
+    SELECT a.id, a.category_id
+    FROM assets AS a
+    JOIN audit_states AS s
+      ON s.auditable_entity_type = 'ASSET'
+     AND s.related_entity_id = a.id
+     AND s.related_composite_id = 0
+    WHERE s.is_archived
+      AND s.archived_at < :archived_before
+      AND NOT EXISTS (SELECT 1 FROM assets AS child WHERE child.parent_asset_id = a.id)
+      AND NOT EXISTS (SELECT 1 FROM reservation_assets AS ra WHERE ra.asset_id = a.id)
+    ORDER BY a.id
+    LIMIT :batch_size
+    FOR UPDATE OF a SKIP LOCKED;
+""")
+
+_COLD_RESERVATION_BATCH = text("""
+    SELECT r.id
+    FROM reservations AS r
+    JOIN audit_states AS s
+      ON s.auditable_entity_type = 'RESERVATION'
+     AND s.related_entity_id = r.id
+     AND s.related_composite_id = 0
+    WHERE s.is_archived
+      AND s.archived_at < :archived_before
+    ORDER BY r.id
+    LIMIT :batch_size
+    FOR UPDATE OF r SKIP LOCKED;
+""")
+
+# Reservation lines archived on their own, inside a reservation that is still live
+_COLD_RESERVATION_ASSET_BATCH = """
+    (reservation_id, asset_id) IN (
+        SELECT ra.reservation_id, ra.asset_id
+        FROM reservation_assets AS ra
+        JOIN audit_states AS s
+          ON s.auditable_entity_type = 'RESERVATION_ASSET'
+         AND s.related_entity_id = ra.reservation_id
+         AND s.related_composite_id = ra.asset_id
+        WHERE s.is_archived
+          AND s.archived_at < :archived_before
+        ORDER BY ra.reservation_id, ra.asset_id
+        LIMIT :batch_size
+        FOR UPDATE OF ra SKIP LOCKED
+    )
+"""
+
+
+def _move_rows(hot_table, where: str, params: dict, to_cold: bool = True, returning: str = "1") -> list:
+    """Move the rows matching `where` between a hot table and its cold table in one DELETE ... INSERT statement."""
+
+    cold_table = model.COLD_TABLES[hot_table.name]
+    columns = ", ".join(column.name for column in hot_table.columns if column.computed is None)
+    source, target = (hot_table, cold_table) if to_cold else (cold_table, hot_table)
+
+    if to_cold:
+        insert = f"INSERT INTO {target.name} ({columns}, moved_at) SELECT {columns}, :moved_at FROM moved"
+        params = dict(params, moved_at=datetime.utcnow())
+    else:
+        insert = f"INSERT INTO {target.name} ({columns}) SELECT {columns} FROM moved"
+
+    statement = text(f"WITH moved AS (DELETE FROM {source.name} WHERE {where} RETURNING {columns}) {insert} RETURNING {returning};")
+    return model.db.session.execute(statement, params).all()
+
+
+def _adjust_archived_counts(category_ids: List[Optional[int]], sign: int):
+    """Add (sign=1) or take away (sign=-1) archived assets from their categories' counts with one upsert."""
+
+    category_deltas = {}
+    for category_id in category_ids:
+        totals = category_deltas.get(category_id, (0, 0, 0))
+        category_deltas[category_id] = (totals[0] + sign, totals[1], totals[2] + sign)
+    category_counts.adjust_many(category_deltas)
+
+
+def _archived_before(grace_days: int) -> datetime:
+    return datetime.utcnow() - timedelta(days=grace_days)
+
+
+def move_reservations_to_cold(grace_days: int = COLD_STORAGE_GRACE_DAYS, batch_size: int = COLD_STORAGE_BATCH_SIZE) -> int:
+    """Move one batch of archived reservations, with their reservation lines, to cold storage. Returns how many moved."""
+
+    params = {"archived_before": _archived_before(grace_days), "batch_size": batch_size}
+    reservation_ids = [reservation_id for reservation_id, in model.db.session.execute(_COLD_RESERVATION_BATCH, params)]
+
+    if reservation_ids:
+        _move_rows(model.ReservationAsset.__table__, "reservation_id = ANY(:ids)", {"ids": reservation_ids})
+        _move_rows(model.Reservation.__table__, "id = ANY(:ids)", {"ids": reservation_ids})
+
+    return len(reservation_ids)
+
+
+def move_reservation_assets_to_cold(grace_days: int = COLD_STORAGE_GRACE_DAYS, batch_size: int = COLD_STORAGE_BATCH_SIZE) -> int:
+    """Move one batch of reservation lines archived on their own to cold storage. Their reservation stays hot."""
+
+    params = {"archived_before": _archived_before(grace_days), "batch_size": batch_size}
+    moved = _move_rows(model.ReservationAsset.__table__, _COLD_RESERVATION_ASSET_BATCH, params, returning="asset_id")
+    availability.invalidate(asset_id for asset_id, in moved)
+
+    return len(moved)
+
+
+def move_assets_to_cold(grace_days: int = COLD_STORAGE_GRACE_DAYS, batch_size: int = COLD_STORAGE_BATCH_SIZE) -> int:
+    """Move one batch of archived assets, with their tags, flags, properties and location logs, to cold storage.
+
+    Leaf assets go first, so a kit moves over successive batches. Returns how many assets moved.
+    """
+
+    rows = model.db.session.execute(_COLD_ASSET_BATCH, {"archived_before": _archived_before(grace_days), "batch_size": batch_size}).all()
+    if not rows:
+        return 0
+
+    asset_ids = [row.id for row in rows]
+    for table in _ASSET_DEPENDENT_TABLES:
+        _move_rows(table, "asset_id = ANY(:ids)", {"ids": asset_ids})
+    _move_rows(model.Asset.__table__, "id = ANY(:ids)", {"ids": asset_ids})
+
+    # Category counts only cover the hot table, which these archived assets have now left
+    _adjust_archived_counts([row.category_id for row in rows], sign=-1)
+
+    availability.invalidate(asset_ids)
+    kits.invalidate()
+    scan.invalidate()
+
+    return len(asset_ids)
+
+
+def move_to_cold_storage(grace_days: int = COLD_STORAGE_GRACE_DAYS,
+                         batch_size: int = COLD_STORAGE_BATCH_SIZE,
+                         max_batches: Optional[int] = None) -> Dict[str, int]:
+    """Move everything archived more than grace_days ago to cold storage, committing after every batch.
+
+    Reservations and their lines go first, since an asset can't leave while a reservation line still points at it.
+    """
+
+    moved = {"reservations": 0, "reservation_assets": 0, "assets": 0}
+    for key, move in (("reservations", move_reservations_to_cold),
+                      ("reservation_assets", move_reservation_assets_to_cold),
+                      ("assets", move_assets_to_cold)):
+        batches = 0
+        while max_batches is None or batches < max_batches:
+            count = move(grace_days, batch_size)
+            model.db.session.commit()
+            batches += 1
+            moved[key] += count
+            if count < batch_size:
+                break
+
+    return moved
+
+
+def restore_assets(asset_ids: Iterable[int], commit: bool = True) -> List[int]:
+    """Move assets, their cold ancestors and their dependent rows back to the hot tables. They stay archived.
+
+    Returns the restored asset ids. Raises IntegrityError if one of their tag payloads has been reused meanwhile.
+    """
+
+    asset_ids = list(asset_ids)
+    restored_ids = [asset_id for asset_id, in model.db.session.execute(text("""
+        WITH RECURSIVE restored(id, parent_asset_id) AS (
+            SELECT id, parent_asset_id FROM assets_archive WHERE id = ANY(:asset_ids)
+            UNION
+            SELECT parent.id, parent.parent_asset_id
+            FROM assets_archive AS parent
+            JOIN restored ON parent.id = restored.parent_asset_id
+        )
+        SELECT id FROM restored;
+    """), {"asset_ids": asset_ids})]
+
+    if not restored_ids:
+        return []
+
+    # Parents and children go back in the same statement, foreign keys are checked once it finishes
+    rows = _move_rows(model.Asset.__table__, "id = ANY(:ids)", {"ids": restored_ids}, to_cold=False, returning="category_id")
+    for table in _ASSET_DEPENDENT_TABLES:
+        _move_rows(table, "asset_id = ANY(:ids)", {"ids": restored_ids}, to_cold=False)
+
+    _adjust_archived_counts([category_id for category_id, in rows], sign=1)
+
+    kits.invalidate()
+    scan.invalidate()
+
+    # Commit only if commit=True
+    if commit:
+        model.db.session.commit()
+
+    return restored_ids
+
+
+def restore_reservations(reservation_ids: Iterable[int], commit: bool = True) -> List[int]:
+    """Move reservations and their cold reservation lines back to the hot tables, restoring any cold assets they
+    point at first. They stay archived. Returns the restored reservation ids."""
+
+    reservation_ids = list(reservation_ids)
+    params = {"ids": reservation_ids}
+
+    asset_ids = [asset_id for asset_id, in model.db.session.execute(text("""
+        SELECT DISTINCT asset_id FROM reservation_assets_archive WHERE reservation_id = ANY(:ids);
+    """), params)]
+    restore_assets(asset_ids, commit=False)
+
+    restored = _move_rows(model.Reservation.__table__, "id = ANY(:ids)", params, to_cold=False, returning="id")
+    _move_rows(model.ReservationAsset.__table__, "reservation_id = ANY(:ids)", params, to_cold=False)
+
+    availability.invalidate(asset_ids)
+
+    # Commit only if commit=True
+    if commit:
+        model.db.session.commit()
+
+    return [reservation_id for reservation_id, in restored]
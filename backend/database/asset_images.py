@@ -0,0 +1,82 @@
+"""Per-asset image variant map, kept on Asset.image_variants so reads never touch the attachment tables.
+
+The map is {size label: {"file_attachment_id", "path", "hash"}} for every image size stored for the asset. It is written
+whenever an image is attached to an asset, and can be rebuilt from file_attachment_associations at any time.
+"""
+import re
+
+from typing import Optional
+from sqlalchemy import func, text
+
+from database import model
+
+
+# Variation files are named <base name>_<size label>.<extension>
+_LABEL_PATTERN = re.compile(r"_(\d-[a-z]+)\.[A-Za-z0-9]+$")
+
+# Best source to derive other sizes from: the original, then the largest stored size
+SOURCE_PREFERENCE = [model.ImageSize.ORIGINAL.value] + [size.value for size in reversed(model.ImageSize) if size != model.ImageSize.ORIGINAL]
+
+
+
+
+def variant_label(file_path: str) -> Optional[str]:
+    """The size label in a variation's file name, or None if it doesn't follow the naming scheme."""
+
+    match = _LABEL_PATTERN.search(file_path)
+    return match.group(1) if match else None
+
+
+def source_variant(image_variants: Optional[dict]) -> Optional[dict]:
+    """Pick the variant to serve or resize from, or None if the asset has no image."""
+
+    if not image_variants:
+        return None
+
+    for label in SOURCE_PREFERENCE:
+        if label in image_variants:
+            return image_variants[label]
+
+    return next(iter(image_variants.values()))
+
+
+def record_variant(asset_id: int, file_attachment: model.FileAttachment):
+    """Add an image attachment to the asset's map in one UPDATE, without loading the asset."""
+
+    if file_attachment.file_category != model.FileCategory.IMAGE.value:
+        return
+
+    label = variant_label(file_attachment.file_path) or model.ImageSize.ORIGINAL.value
+    variant = func.jsonb_build_object("file_attachment_id", file_attachment.id,
+                                      "path", file_attachment.file_path,
+                                      "hash", file_attachment.file_hash)
+
+    model.db.session.query(model.Asset) \
+                    .filter(model.Asset.id == asset_id) \
+                    .update({model.Asset.image_variants: model.Asset.image_variants.op('||')(func.jsonb_build_object(label, variant))},
+                            synchronize_session=False)
+
+
+def rebuild(commit: bool = True):
+    """Recompute every asset's map from its image attachments, e.g. after attachments were written some other way."""
+
+    model.db.session.execute(text("""
+        UPDATE assets AS a
+        SET image_variants = COALESCE(v.image_variants, '{}'::jsonb)
+        FROM assets AS base
+        LEFT JOIN (
+            SELECT fa_assoc.entity_id AS asset_id,
+                   jsonb_object_agg(COALESCE(substring(fa.file_path FROM '_([0-9]-[a-z]+)\\.[A-Za-z0-9]+$'), '0-original'),
+                                    jsonb_build_object('file_attachment_id', fa.id, 'path', fa.file_path, 'hash', fa.file_hash)
+                                    ORDER BY fa.id) AS image_variants
+            FROM file_attachment_associations AS fa_assoc
+            JOIN file_attachments AS fa ON fa.id = fa_assoc.file_attachment_id
+            WHERE fa_assoc.attachable_entity_type = 'ASSET'
+              AND fa.file_category = 'IMAGE'
+            GROUP BY fa_assoc.entity_id
+        ) AS v ON v.asset_id = base.id
+        WHERE a.id = base.id;
+    """))
+
+    if commit:
+        model.db.session.commit()
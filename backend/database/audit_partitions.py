@@ -0,0 +1,301 @@
+"""Monthly partitions, compaction and retention for audit_entries.
+
+audit_entries is range partitioned on created_at, one partition per month (audit_entries_y2024m06), with a DEFAULT
+partition catching anything outside them. Inserts and per-month scans only touch the current partition's indexes, so
+their cost doesn't grow with history. Maintenance, run regularly (e.g. daily through tools/audit_maintenance.py):
+
+    ensure_partitions()   create this month's and the next few months' partitions ahead of time
+    compact()             collapse each entity's UPDATE chain in months older than AUDIT_COMPACT_AFTER_MONTHS into one
+                          summary entry
+    detach_expired()      detach the partitions older than AUDIT_RETENTION_MONTHS, leaving them as standalone tables
+                          to export or drop
+
+CREATE, ARCHIVE and other entries are never compacted, and audit_states (the latest state per entity) is not touched.
+"""
+import re
+
+from datetime import datetime
+from typing import Dict, List, NamedTuple, Optional
+from sqlalchemy import text
+
+from database import model
+
+
+# Partitions created ahead of the current month
+AUDIT_PARTITIONS_AHEAD = 3
+
+# UPDATE chains in months older than this are collapsed into one entry per entity
+AUDIT_COMPACT_AFTER_MONTHS = 3
+
+# Partitions older than this are detached
+AUDIT_RETENTION_MONTHS = 36
+
+_PARENT_TABLE = model.AuditEntry.__tablename__
+_DEFAULT_PARTITION = f"{_PARENT_TABLE}_default"
+_PARTITION_NAME_PATTERN = re.compile(rf"^{_PARENT_TABLE}_y(\d{{4}})m(\d{{2}})$")
+
+
+
+
+class Partition(NamedTuple):
+    name: str
+    starts: datetime
+    ends: datetime
+
+
+
+
+def month_start(moment: datetime, months_offset: int = 0) -> datetime:
+    """The first instant of the month `months_offset` months away from moment's month."""
+
+    month_index = moment.year * 12 + moment.month - 1 + months_offset
+    return datetime(month_index // 12, month_index % 12 + 1, 1)
+
+
+def partition_for(moment: datetime) -> Partition:
+    """The monthly partition a created_at falls into."""
+
+    starts = month_start(moment)
+    return Partition(name=f"{_PARENT_TABLE}_y{starts.year:04d}m{starts.month:02d}", starts=starts, ends=month_start(starts, 1))
+
+
+def partitions() -> List[Partition]:
+    """Every monthly partition currently attached, oldest first. The DEFAULT partition isn't included."""
+
+    names = model.db.session.execute(text("""
+        SELECT child.relname
+        FROM pg_inherits
+        JOIN pg_class AS child ON child.oid = pg_inherits.inhrelid
+        WHERE pg_inherits.inhparent = CAST(:parent AS regclass);
+    """), {"parent": _PARENT_TABLE}).scalars().all()
+
+    attached = []
+    for name in names:
+        match = _PARTITION_NAME_PATTERN.match(name)
+        if match:
+            attached.append(partition_for(datetime(int(match.group(1)), int(match.group(2)), 1)))
+
+    return sorted(attached, key=lambda partition: partition.starts)
+
+
+
+
+# PARTITIONS
+
+
+
+
+def _create_partition(partition: Partition):
+    """Attach one monthly partition, first moving any of its rows out of the DEFAULT partition."""
+
+    bounds = f"FROM ('{partition.starts.isoformat()}') TO ('{partition.ends.isoformat()}')"
+    params = {"starts": partition.starts, "ends": partition.ends}
+
+    has_default_rows = model.db.session.execute(text(f"""
+        SELECT EXISTS (SELECT 1 FROM {_DEFAULT_PARTITION} WHERE created_at >= :starts AND created_at < :ends);
+    """), params).scalar()
+
+    if not has_default_rows:
+        model.db.session.execute(text(f"CREATE TABLE {partition.name} PARTITION OF {_PARENT_TABLE} FOR VALUES {bounds};"))
+        return
+
+    # PostgreSQL won't create a partition whose rows are still in the DEFAULT one, so build it standalone and attach it
+    model.db.session.execute(text(f"CREATE TABLE {partition.name} (LIKE {_PARENT_TABLE} INCLUDING DEFAULTS INCLUDING CONSTRAINTS);"))
+    model.db.session.execute(text(f"""
+        WITH moved AS (
+            DELETE FROM {_DEFAULT_PARTITION} WHERE created_at >= :starts AND created_at < :ends RETURNING *
+        )
+        INSERT INTO {partition.name} SELECT * FROM moved;
+    """), params)
+    model.db.session.execute(text(f"ALTER TABLE {_PARENT_TABLE} ATTACH PARTITION {partition.name} FOR VALUES {bounds};"))
+
+
+def ensure_partitions(months_ahead: int = AUDIT_PARTITIONS_AHEAD,
+                      since: Optional[datetime] = None,
+                      commit: bool = True) -> List[str]:
+    """Create the monthly partitions from since (default: this month) to months_ahead months from now that don't
+    exist yet. Returns the names created."""
+
+    now = datetime.utcnow()
+    existing = {partition.name for partition in partitions()}
+
+    created = []
+    moment = month_start(since or now)
+    while moment <= month_start(now, months_ahead):
+        partition = partition_for(moment)
+        if partition.name not in existing:
+            _create_partition(partition)
+            created.append(partition.name)
+        moment = partition.ends
+
+    # Commit only if commit=True
+    if commit:
+        model.db.session.commit()
+
+    return created
+
+
+
+
+# COMPACTION AND RETENTION
+
+
+
+
+def compact_partition(partition: Partition) -> int:
+    """Collapse each entity's UPDATE entries in one partition into a single summary entry. Returns the entries removed.
+
+    The summary keeps the last update's time and editor, so it stays in the same partition and still sorts as the
+    entity's latest update. Its details record how many entries it replaced and the first one's time and editor.
+    """
+
+    removed = model.db.session.execute(text(f"""
+        WITH chains AS (
+            SELECT auditable_entity_type, related_entity_id, related_entity_hash, related_composite_id
+            FROM {partition.name}
+            WHERE operation_type = 'UPDATE'
+            GROUP BY auditable_entity_type, related_entity_id, related_entity_hash, related_composite_id
+            HAVING COUNT(*) > 1
+        ),
+        removed AS (
+            DELETE FROM {partition.name} AS entry
+            USING chains
+            WHERE entry.operation_type = 'UPDATE'
+              AND entry.auditable_entity_type = chains.auditable_entity_type
+              AND entry.related_entity_id IS NOT DISTINCT FROM chains.related_entity_id
+              AND entry.related_entity_hash IS NOT DISTINCT FROM chains.related_entity_hash
+              AND entry.related_composite_id IS NOT DISTINCT FROM chains.related_composite_id
+            RETURNING entry.*
+        ),
+        summaries AS (
+            INSERT INTO {_PARENT_TABLE} (operation_type, auditable_entity_type, related_entity_id, related_entity_hash,
+                                         related_composite_id, details, created_by, created_at, last_edited_by,
+                                         last_edited_at, is_archived, archived_at)
+            SELECT 'UPDATE', auditable_entity_type, related_entity_id, related_entity_hash, related_composite_id,
+                   format('Compacted %s updates, the first at %s by user %s.',
+                          COUNT(*),
+                          MIN(created_at),
+                          (ARRAY_AGG(created_by ORDER BY created_at, id))[1]),
+                   (ARRAY_AGG(created_by ORDER BY created_at DESC, id DESC))[1],
+                   MAX(created_at),
+                   (ARRAY_AGG(last_edited_by ORDER BY created_at DESC, id DESC))[1],
+                   MAX(created_at),
+                   FALSE,
+                   NULL
+            FROM removed
+            GROUP BY auditable_entity_type, related_entity_id, related_entity_hash, related_composite_id
+            RETURNING 1
+        )
+        SELECT (SELECT COUNT(*) FROM removed) - (SELECT COUNT(*) FROM summaries);
+    """)).scalar()
+
+    return removed or 0
+
+
+def compact(older_than_months: int = AUDIT_COMPACT_AFTER_MONTHS, commit: bool = True) -> Dict[str, int]:
+    """Compact every partition that ended more than older_than_months ago, committing after each one.
+
+    Returns {partition name: entries removed}. Compacting an already compacted partition removes nothing.
+    """
+
+    cutoff = month_start(datetime.utcnow(), -older_than_months)
+
+    removed = {}
+    for partition in partitions():
+        if partition.ends > cutoff:
+            break
+        removed[partition.name] = compact_partition(partition)
+
+        # Commit only if commit=True
+        if commit:
+            model.db.session.commit()
+
+    return removed
+
+
+def detach_expired(retention_months: int = AUDIT_RETENTION_MONTHS, drop: bool = False, commit: bool = True) -> List[str]:
+    """Detach the partitions that ended more than retention_months ago. They are kept as standalone tables unless
+    drop=True. Returns their names."""
+
+    cutoff = month_start(datetime.utcnow(), -retention_months)
+
+    expired = [partition.name for partition in partitions() if partition.ends <= cutoff]
+    for name in expired:
+        model.db.session.execute(text(f"ALTER TABLE {_PARENT_TABLE} DETACH PARTITION {name};"))
+        if drop:
+            model.db.session.execute(text(f"DROP TABLE {name};"))
+
+    # Commit only if commit=True
+    if commit:
+        model.db.session.commit()
+
+    return expired
+
+
+def run_maintenance(drop_expired: bool = False) -> dict:
+    """Create upcoming partitions, compact old ones and detach expired ones."""
+
+    return {"created": ensure_partitions(),
+            "compacted": compact(),
+            "detached": detach_expired(drop=drop_expired)}
+
+
+
+
+# MIGRATION
+
+
+
+
+def partition_existing_table(commit: bool = True) -> int:
+    """Turn an audit_entries table created before partitioning into the partitioned layout, keeping every row and id.
+
+    Takes an exclusive lock on audit_entries for the copy. Returns the number of rows copied.
+    """
+
+    is_partitioned = model.db.session.execute(text("""
+        SELECT EXISTS (SELECT 1 FROM pg_partitioned_table WHERE partrelid = CAST(:parent AS regclass));
+    """), {"parent": _PARENT_TABLE}).scalar()
+    if is_partitioned:
+        return 0
+
+    # Move the old table and everything named after it out of the way
+    old_table = f"{_PARENT_TABLE}_unpartitioned"
+    model.db.session.execute(text(f"ALTER TABLE {_PARENT_TABLE} RENAME TO {old_table};"))
+    model.db.session.execute(text(f"ALTER TABLE {old_table} RENAME CONSTRAINT {_PARENT_TABLE}_pkey TO {old_table}_pkey;"))
+    model.db.session.execute(text(f"ALTER SEQUENCE {_PARENT_TABLE}_id_seq RENAME TO {old_table}_id_seq;"))
+    model.db.session.execute(text(f"""
+        DO $$
+        DECLARE index_name text;
+        BEGIN
+            FOR index_name IN SELECT indexname FROM pg_indexes WHERE tablename = '{old_table}' AND indexname LIKE 'idx_%' LOOP
+                EXECUTE format('DROP INDEX %I', index_name);
+            END LOOP;
+        END $$;
+    """))
+
+    model.AuditEntry.__table__.create(bind=model.db.session.connection())
+
+    oldest = model.db.session.execute(text(f"SELECT MIN(created_at) FROM {old_table};")).scalar()
+    ensure_partitions(since=oldest, commit=False)
+
+    copied = model.db.session.execute(text(f"""
+        INSERT INTO {_PARENT_TABLE} (id, operation_type, auditable_entity_type, related_entity_id, related_entity_hash,
+                                     related_composite_id, details, created_by, created_at, last_edited_by,
+                                     last_edited_at, is_archived, archived_at)
+        SELECT id, operation_type, auditable_entity_type, related_entity_id, related_entity_hash,
+               related_composite_id, details, created_by, created_at, last_edited_by,
+               last_edited_at, is_archived, archived_at
+        FROM {old_table};
+    """)).rowcount
+
+    model.db.session.execute(text(f"""
+        SELECT setval(pg_get_serial_sequence('{_PARENT_TABLE}', 'id'), COALESCE((SELECT MAX(id) FROM {old_table}), 0) + 1, false);
+    """))
+    model.db.session.execute(text(f"DROP TABLE {old_table};"))
+
+    # Commit only if commit=True
+    if commit:
+        model.db.session.commit()
+
+    return copied
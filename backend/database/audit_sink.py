@@ -0,0 +1,193 @@
+"""Collects the audit trail of a unit of work and writes it with one multi-row INSERT per table.
+
+create.audit_entry queues an audit_entries row, and the matching audit_states change, on the session instead of adding
+an AuditEntry and upserting its state straight away. The queue is written when the session commits, so a commit that
+creates a hundred entities costs two audit statements instead of two hundred. It is also written before any statement
+that reads audit_entries or audit_states, so queries inside the same transaction still see every audit so far, and a
+rollback discards it along with the rest of the transaction.
+
+Writes stay in the business transaction on purpose: an entity is never committed without its audit, or the other way
+round.
+"""
+import re
+
+from datetime import datetime
+from typing import Dict, List, Optional
+from sqlalchemy import event
+from sqlalchemy.dialects import postgresql
+from sqlalchemy.orm import Session
+from sqlalchemy.sql import ClauseElement
+from sqlalchemy.sql.elements import TextClause
+from sqlalchemy.sql.util import find_tables
+
+from database import model
+
+
+# Rows per multi-row INSERT. Audit entries have 13 columns, well under PostgreSQL's 65535 bind parameter limit.
+AUDIT_CHUNK_SIZE = 1000
+
+_AUDIT_TABLES = frozenset((model.AuditEntry.__tablename__, model.AuditState.__tablename__))
+_AUDIT_TABLE_PATTERN = re.compile(r"\b(?:" + "|".join(_AUDIT_TABLES) + r")\b")
+
+# Columns the audit_states upsert overwrites, depending on whether the change archives (or restores) the entity
+_STATE_KEY = ("auditable_entity_type", "related_entity_id", "related_composite_id")
+_STATE_LAST_EDIT_COLUMNS = ["last_operation_type", "last_edited_by", "last_edited_at"]
+_STATE_ARCHIVE_COLUMNS = _STATE_LAST_EDIT_COLUMNS + ["is_archived", "archived_at"]
+
+
+
+
+# ROWS
+
+
+
+
+def entry_row(operation_type: model.OperationType,
+              auditable_entity_type: model.AuditableEntityTypes,
+              created_by_user_id: int,
+              time_stamp: datetime,
+              related_entity_id: Optional[int] = None,
+              related_entity_hash: Optional[str] = None,
+              related_composite_id: Optional[int] = None,
+              audit_details: Optional[str] = None) -> dict:
+    """The audit_entries row for one operation."""
+
+    is_archiving = operation_type == model.OperationType.ARCHIVE.value
+
+    return {"operation_type": operation_type,
+            "auditable_entity_type": auditable_entity_type,
+            "related_entity_id": related_entity_id,
+            "related_entity_hash": related_entity_hash,
+            "related_composite_id": related_composite_id,
+            "details": audit_details,
+            "created_by": created_by_user_id,
+            "created_at": time_stamp,
+            "last_edited_by": created_by_user_id,
+            "last_edited_at": time_stamp,
+            "is_archived": is_archiving,
+            "archived_at": time_stamp if is_archiving else None}
+
+
+def state_row(operation_type: model.OperationType,
+              auditable_entity_type: model.AuditableEntityTypes,
+              related_entity_id: int,
+              edited_by_user_id: int,
+              edited_at: datetime,
+              related_composite_id: Optional[int] = None,
+              is_archived: Optional[bool] = None) -> dict:
+    """The audit_states row for one operation. is_archived=None leaves an existing archived flag untouched."""
+
+    return {"auditable_entity_type": auditable_entity_type,
+            "related_entity_id": related_entity_id,
+            "related_composite_id": related_composite_id or 0,
+            "last_operation_type": operation_type,
+            "last_edited_by": edited_by_user_id,
+            "last_edited_at": edited_at,
+            "is_archived": is_archived,
+            "archived_at": edited_at if is_archived else None}
+
+
+
+
+# QUEUE
+
+
+
+
+def _queue(session: Session) -> dict:
+    return session.info.setdefault('pending_audit', {'entries': [], 'states': []})
+
+
+def enqueue(entry: dict, state: Optional[dict] = None, session: Optional[Session] = None):
+    """Queue an audit_entries row, and optionally its audit_states change, until the session commits."""
+
+    queue = _queue(session or model.db.session())
+    queue['entries'].append(entry)
+    if state is not None:
+        queue['states'].append(state)
+
+
+def pending_count(session: Optional[Session] = None) -> int:
+    """How many audit entries are queued on the session."""
+
+    return len(_queue(session or model.db.session())['entries'])
+
+
+def discard(session: Optional[Session] = None):
+    """Drop everything queued on the session without writing it."""
+
+    (session or model.db.session()).info.pop('pending_audit', None)
+
+
+def _merge_states(states: List[dict]) -> List[dict]:
+    """One row per entity, as if the changes had been applied in order. A single upsert can't touch a row twice."""
+
+    merged: Dict[tuple, dict] = {}
+    for state in states:
+        key = tuple(state[column] for column in _STATE_KEY)
+        previous = merged.get(key)
+        if previous is not None and state["is_archived"] is None:
+            state = dict(state, is_archived=previous["is_archived"], archived_at=previous["archived_at"])
+        merged[key] = state
+
+    return list(merged.values())
+
+
+def _upsert_states(session: Session, states: List[dict], update_columns: List[str]):
+    for start in range(0, len(states), AUDIT_CHUNK_SIZE):
+        rows = [dict(state, is_archived=bool(state["is_archived"])) for state in states[start:start + AUDIT_CHUNK_SIZE]]
+        statement = postgresql.insert(model.AuditState).values(rows)
+        statement = statement.on_conflict_do_update(index_elements=list(_STATE_KEY),
+                                                    set_={column: statement.excluded[column] for column in update_columns})
+        session.execute(statement)
+
+
+def flush(session: Optional[Session] = None):
+    """Write everything queued on the session: one INSERT per chunk of entries, and up to two audit_states upserts."""
+
+    session = session or model.db.session()
+
+    # Take the queue first, the statements below come back through _flush_before_audit_reads
+    queue = session.info.pop('pending_audit', None)
+    if not queue or not queue['entries']:
+        return
+
+    entries = queue['entries']
+    for start in range(0, len(entries), AUDIT_CHUNK_SIZE):
+        session.execute(model.AuditEntry.__table__.insert().values(entries[start:start + AUDIT_CHUNK_SIZE]))
+
+    states = _merge_states(queue['states'])
+    _upsert_states(session, [state for state in states if state["is_archived"] is None], _STATE_LAST_EDIT_COLUMNS)
+    _upsert_states(session, [state for state in states if state["is_archived"] is not None], _STATE_ARCHIVE_COLUMNS)
+
+
+
+
+# SESSION EVENTS
+
+
+
+
+def _reads_audit_tables(statement) -> bool:
+    if isinstance(statement, TextClause):
+        return bool(_AUDIT_TABLE_PATTERN.search(statement.text))
+    if isinstance(statement, ClauseElement):
+        return any(getattr(table, 'name', None) in _AUDIT_TABLES for table in find_tables(statement, include_crud=True))
+    return False
+
+
+@event.listens_for(Session, 'do_orm_execute')
+def _flush_before_audit_reads(orm_execute_state):
+    session = orm_execute_state.session
+    if session.info.get('pending_audit') and _reads_audit_tables(orm_execute_state.statement):
+        flush(session)
+
+
+@event.listens_for(Session, 'before_commit')
+def _flush_before_commit(session):
+    flush(session)
+
+
+@event.listens_for(Session, 'after_rollback')
+def _discard_after_rollback(session):
+    discard(session)
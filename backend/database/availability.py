@@ -0,0 +1,259 @@
+"""Reservation availability: is an asset free over [start, end)?
+
+Every ReservationAsset carries a copy of its reservation's planned window in reserved_during (a TSRANGE).
+An exclusion constraint stops two of them overlapping for the same asset, and the same column drives both lookup paths:
+
+    - The in-memory path keeps a sorted interval index per asset, loaded lazily and kept warm in a ProcessCache.
+      Free/busy checks for hundreds of assets are then a bisect per asset.
+    - The *_db path asks PostgreSQL directly with the range overlap operator, served by the exclusion constraint's GiST index.
+      It is the authoritative check used before writing.
+"""
+from database import model
+from database import cache
+
+from bisect import bisect_left
+from datetime import datetime, timezone
+from typing import Optional, Dict, List, Iterable, Tuple
+from sqlalchemy import func, text
+
+
+# Seconds a warm per-asset index may be served before it is reloaded. Writes made through this process invalidate it
+# straight away, the TTL only bounds how long other processes' writes go unseen.
+AVAILABILITY_CACHE_TTL_SECONDS = 60
+
+# Open-ended (indefinite) reservations end at the end of time
+UNBOUNDED = datetime.max
+
+_interval_cache = cache.ProcessCache(ttl_seconds=AVAILABILITY_CACHE_TTL_SECONDS)
+
+
+
+
+class AssetIntervals:
+    """The reserved windows of a single asset, sorted by start, with a running max of end times for overlap queries."""
+
+    __slots__ = ("starts", "ends", "reservation_ids", "max_end_through")
+
+    def __init__(self, intervals: Iterable[Tuple[datetime, datetime, int]]):
+        intervals = sorted(intervals)
+
+        self.starts = [start for start, _, _ in intervals]
+        self.ends = [end for _, end, _ in intervals]
+        self.reservation_ids = [reservation_id for _, _, reservation_id in intervals]
+
+        # max_end_through[i] is the latest end among the first i+1 intervals
+        self.max_end_through = []
+        latest_end = None
+        for end in self.ends:
+            latest_end = end if latest_end is None or end > latest_end else latest_end
+            self.max_end_through.append(latest_end)
+
+
+    def is_free(self, start: datetime, end: datetime) -> bool:
+        """True if no interval overlaps [start, end)."""
+
+        # Only intervals starting before `end` can overlap, and one of them does iff the latest of their ends is after `start`
+        candidates = bisect_left(self.starts, end)
+        return candidates == 0 or self.max_end_through[candidates - 1] <= start
+
+
+    def conflicts(self, start: datetime, end: datetime) -> List[int]:
+        """Return the reservation ids whose windows overlap [start, end)."""
+
+        candidates = bisect_left(self.starts, end)
+        return [self.reservation_ids[i] for i in range(candidates) if self.ends[i] > start]
+
+
+
+
+def _naive_utc(moment: datetime) -> datetime:
+    """Stored windows are naive UTC, so convert offset-aware datetimes (e.g. parsed from "...Z") to match."""
+
+    if moment.tzinfo is None:
+        return moment
+
+    return moment.astimezone(timezone.utc).replace(tzinfo=None)
+
+
+def _check_window(start: datetime, end: Optional[datetime]) -> Tuple[datetime, datetime]:
+    """Validate a requested window and return it as naive UTC, with an end of None meaning open-ended."""
+
+    start = _naive_utc(start)
+    end = UNBOUNDED if end is None else _naive_utc(end)
+    if start >= end:
+        raise ValueError(f"Invalid window: start {start} must be before end {end}")
+
+    return start, end
+
+
+def reserved_window(reservation: model.Reservation) -> Optional[Tuple[datetime, Optional[datetime]]]:
+    """Return the [start, end) window a reservation holds its assets for, or None if it isn't scheduled yet."""
+
+    if reservation.planned_checkout_time is None:
+        return None
+
+    if reservation.is_indefinite or reservation.planned_checkin_time is None:
+        return reservation.planned_checkout_time, None
+
+    return reservation.planned_checkout_time, reservation.planned_checkin_time
+
+
+def reserved_range(reservation: model.Reservation):
+    """SQL tsrange expression for a reservation's window, suitable for ReservationAsset.reserved_during."""
+
+    window = reserved_window(reservation)
+    if window is None:
+        return None
+
+    start, end = window
+    return func.tsrange(start, end, '[)')
+
+
+def _load_intervals(asset_ids: List[int]) -> Dict[int, AssetIntervals]:
+    """Load the interval index for each asset in one query. Assets with no reservations get an empty index."""
+
+    rows = model.db.session.query(model.ReservationAsset.asset_id,
+                                  func.lower(model.ReservationAsset.reserved_during),
+                                  func.upper(model.ReservationAsset.reserved_during),
+                                  model.ReservationAsset.reservation_id) \
+                           .filter(model.ReservationAsset.asset_id.in_(asset_ids),
+                                   model.ReservationAsset.reserved_during.isnot(None)) \
+                           .all()
+
+    intervals_by_asset = {asset_id: [] for asset_id in asset_ids}
+    for asset_id, start, end, reservation_id in rows:
+        intervals_by_asset[asset_id].append((start, UNBOUNDED if end is None else end, reservation_id))
+
+    return {asset_id: AssetIntervals(intervals) for asset_id, intervals in intervals_by_asset.items()}
+
+
+
+
+# IN-MEMORY
+
+
+
+
+def is_free(asset_id: int, start: datetime, end: Optional[datetime] = None) -> bool:
+    """True if the asset has no reservation overlapping [start, end). end=None means open-ended."""
+
+    start, end = _check_window(start, end)
+    return _interval_cache.get_many([asset_id], _load_intervals)[asset_id].is_free(start, end)
+
+
+def free_assets(asset_ids: Iterable[int], start: datetime, end: Optional[datetime] = None) -> List[int]:
+    """Return the subset of asset_ids that are free over [start, end), in the order given."""
+
+    start, end = _check_window(start, end)
+    asset_ids = list(dict.fromkeys(asset_ids))
+    intervals = _interval_cache.get_many(asset_ids, _load_intervals)
+
+    return [asset_id for asset_id in asset_ids if intervals[asset_id].is_free(start, end)]
+
+
+def conflicts(asset_id: int, start: datetime, end: Optional[datetime] = None) -> List[int]:
+    """Return the ids of reservations holding the asset during [start, end)."""
+
+    start, end = _check_window(start, end)
+    return _interval_cache.get_many([asset_id], _load_intervals)[asset_id].conflicts(start, end)
+
+
+def invalidate(asset_ids: Optional[Iterable[int]] = None):
+    """Drop the warm index for the given assets, or for every asset when asset_ids is None."""
+
+    if asset_ids is None:
+        _interval_cache.invalidate()
+        return
+
+    for asset_id in asset_ids:
+        _interval_cache.invalidate(asset_id)
+
+
+
+
+# DATABASE
+
+
+
+
+def _overlapping(start: datetime, end: datetime):
+    """Filter clause for reservation_assets rows whose window overlaps [start, end)."""
+
+    requested = func.tsrange(start, None if end is UNBOUNDED else end, '[)')
+    return model.ReservationAsset.reserved_during.op('&&')(requested)
+
+
+def conflicts_db(asset_id: int, start: datetime, end: Optional[datetime] = None,
+                 exclude_reservation_id: Optional[int] = None) -> List[int]:
+    """Return the ids of reservations holding the asset during [start, end), straight from the database."""
+
+    start, end = _check_window(start, end)
+    query = model.db.session.query(model.ReservationAsset.reservation_id) \
+                            .filter(model.ReservationAsset.asset_id == asset_id, _overlapping(start, end))
+
+    if exclude_reservation_id is not None:
+        query = query.filter(model.ReservationAsset.reservation_id != exclude_reservation_id)
+
+    return [reservation_id for reservation_id, in query.all()]
+
+
+def free_assets_db(asset_ids: Iterable[int], start: datetime, end: Optional[datetime] = None) -> List[int]:
+    """Return the subset of asset_ids that are free over [start, end), straight from the database."""
+
+    start, end = _check_window(start, end)
+    asset_ids = list(dict.fromkeys(asset_ids))
+
+    busy = model.db.session.query(model.ReservationAsset.asset_id) \
+                           .filter(model.ReservationAsset.asset_id.in_(asset_ids), _overlapping(start, end)) \
+                           .distinct() \
+                           .all()
+    busy = {asset_id for asset_id, in busy}
+
+    return [asset_id for asset_id in asset_ids if asset_id not in busy]
+
+
+
+
+# MAINTENANCE
+
+
+
+
+def release(reservation_id: int, asset_id: Optional[int] = None):
+    """Free the assets held by a reservation (or a single asset of it), e.g. when it is archived."""
+
+    query = model.db.session.query(model.ReservationAsset).filter_by(reservation_id=reservation_id)
+    if asset_id is not None:
+        query = query.filter_by(asset_id=asset_id)
+
+    released_asset_ids = [reservation_asset.asset_id for reservation_asset in query.all()]
+    query.update({model.ReservationAsset.reserved_during: None}, synchronize_session=False)
+
+    invalidate(released_asset_ids)
+
+
+def rebuild_reserved_ranges(commit: bool = True):
+    """Recompute reserved_during for every ReservationAsset from its reservation, leaving archived ones released."""
+
+    model.db.session.execute(text("""
+        UPDATE reservation_assets AS ra
+        SET reserved_during = CASE
+                WHEN EXISTS (SELECT 1 FROM audit_states AS s
+                             WHERE s.is_archived
+                               AND ((s.auditable_entity_type = 'RESERVATION'
+                                     AND s.related_entity_id = r.id)
+                                 OR (s.auditable_entity_type = 'RESERVATION_ASSET'
+                                     AND s.related_entity_id = ra.reservation_id
+                                     AND s.related_composite_id = ra.asset_id))) THEN NULL
+                WHEN r.planned_checkout_time IS NULL THEN NULL
+                WHEN r.is_indefinite OR r.planned_checkin_time IS NULL THEN tsrange(r.planned_checkout_time, NULL, '[)')
+                ELSE tsrange(r.planned_checkout_time, r.planned_checkin_time, '[)')
+            END
+        FROM reservations AS r
+        WHERE r.id = ra.reservation_id;
+    """))
+
+    invalidate()
+
+    if commit:
+        model.db.session.commit()
@@ -0,0 +1,220 @@
+"Bulk create methods for importing many DB Entities at once"
+from database import model
+from database import category_counts
+from database import category_tree
+from database import search
+from database import audit_sink
+from database import loaders
+
+from typing import Optional, List, Dict, Iterable, NamedTuple
+from datetime import datetime
+from sqlalchemy import func, select
+
+
+
+
+# Rows per multi-row INSERT. Assets have ~20 columns, so this stays well under PostgreSQL's 65535 bind parameter limit.
+BULK_CHUNK_SIZE = 1000
+
+
+
+
+class AssetImportRow(NamedTuple):
+    """One asset to import, with the related rows create.asset would otherwise need separate calls for."""
+
+    model_name: str
+    inventory_number: int
+    manufacturer_name: Optional[str] = None
+    model_number: Optional[str] = None
+    category_id: Optional[int] = None
+    online_item_page: Optional[str] = None
+    description: Optional[str] = None
+    purchase_price: Optional[float] = None
+    msrp: Optional[float] = None
+    residual_value: Optional[float] = None
+    latitude: Optional[float] = None
+    longitude: Optional[float] = None
+
+
+
+
+def _chunks(rows: List, chunk_size: int):
+    for start in range(0, len(rows), chunk_size):
+        yield rows[start:start + chunk_size]
+
+
+def allocate_ids(entity: type, count: int) -> List[int]:
+    """Reserve `count` ids from an entity's id sequence in one round trip."""
+
+    if count == 0:
+        return []
+
+    table_name = entity.__tablename__
+    sequence = func.pg_get_serial_sequence(table_name, 'id')
+    ids = model.db.session.execute(select(func.nextval(sequence)).select_from(func.generate_series(1, count))).scalars().all()
+
+    return list(ids)
+
+
+def insert_rows(entity: type, rows: List[dict], chunk_size: int = BULK_CHUNK_SIZE):
+    """Write rows to an entity's table with one multi-row INSERT per chunk. Every row must have the same keys."""
+
+    for chunk in _chunks(rows, chunk_size):
+        model.db.session.execute(entity.__table__.insert().values(chunk))
+
+    # Core inserts don't flush, so drop anything this request's loaders remembered as missing
+    loaders.clear()
+
+
+def audit_entries(auditable_entity_type: model.AuditableEntityTypes,
+                  related_entity_ids: List[int],
+                  created_by_user_id: int,
+                  audit_details: Optional[str] = None,
+                  chunk_size: int = BULK_CHUNK_SIZE):
+    """Write a CREATE AuditEntry and AuditState for each newly inserted entity id."""
+
+    time_stamp = datetime.utcnow()
+    operation_type = model.OperationType.CREATE.value
+
+    insert_rows(model.AuditEntry,
+                [audit_sink.entry_row(operation_type, auditable_entity_type, created_by_user_id, time_stamp,
+                                      related_entity_id=related_entity_id,
+                                      audit_details=audit_details) for related_entity_id in related_entity_ids],
+                chunk_size)
+
+    insert_rows(model.AuditState,
+                [dict(audit_sink.state_row(operation_type, auditable_entity_type, related_entity_id, created_by_user_id, time_stamp),
+                      is_archived=False) for related_entity_id in related_entity_ids],
+                chunk_size)
+
+
+
+
+# IMPORT
+
+
+
+
+def manufacturers(names: Iterable[str],
+                  created_by_user_id: int,
+                  audit_details: Optional[str] = None,
+                  chunk_size: int = BULK_CHUNK_SIZE) -> Dict[str, int]:
+    """Return {name: manufacturer_id} for every name, creating the ones that don't exist yet."""
+
+    names = list(dict.fromkeys(name for name in names if name))
+    if not names:
+        return {}
+
+    # Resolve every existing manufacturer in one query
+    existing = model.db.session.query(model.Manufacturer.name, model.Manufacturer.id) \
+                               .filter(model.Manufacturer.name.in_(names)) \
+                               .all()
+    manufacturer_ids = dict(existing)
+
+    missing_names = [name for name in names if name not in manufacturer_ids]
+    new_ids = allocate_ids(model.Manufacturer, len(missing_names))
+
+    insert_rows(model.Manufacturer,
+                [{"id": manufacturer_id, "name": name, "manufacturer_area_id": None, "website": None}
+                 for manufacturer_id, name in zip(new_ids, missing_names)],
+                chunk_size)
+    audit_entries(model.CLASS_TO_ENUM_MAP['Manufacturer'], new_ids, created_by_user_id, audit_details, chunk_size)
+
+    manufacturer_ids.update(zip(missing_names, new_ids))
+    return manufacturer_ids
+
+
+def assets(rows: Iterable[AssetImportRow],
+           created_by_user_id: int,
+           default_manufacturer_id: int,
+           currency_id: int = 1,
+           audit_details: Optional[str] = None,
+           chunk_size: int = BULK_CHUNK_SIZE,
+           commit: bool = True) -> List[int]:
+    """Import assets along with their manufacturers, financial entries, location logs and audit entries.
+
+    Returns the new asset ids in the same order as rows. Rows without a manufacturer name get default_manufacturer_id.
+    """
+
+    rows = list(rows)
+    manufacturer_ids = manufacturers((row.manufacturer_name for row in rows), created_by_user_id, audit_details, chunk_size)
+
+    manufacturer_names = {manufacturer_id: name for name, manufacturer_id in manufacturer_ids.items()}
+    if default_manufacturer_id not in manufacturer_names:
+        manufacturer_names[default_manufacturer_id] = model.db.session.query(model.Manufacturer.name).filter_by(id=default_manufacturer_id).scalar()
+    categories = category_tree.category_tree().nodes
+
+    asset_ids = []
+    for chunk in _chunks(rows, chunk_size):
+        chunk_asset_ids = allocate_ids(model.Asset, len(chunk))
+
+        # Financial entries, in the order they are referenced by the chunk's assets
+        amounts = [amount for row in chunk for amount in (row.purchase_price, row.msrp, row.residual_value) if amount is not None]
+        financial_entry_ids = iter(allocate_ids(model.FinancialEntry, len(amounts)))
+        financial_entry_rows = []
+
+        asset_rows = []
+        for asset_id, row in zip(chunk_asset_ids, chunk):
+            price_ids = []
+            for amount in (row.purchase_price, row.msrp, row.residual_value):
+                if amount is None:
+                    price_ids.append(None)
+                    continue
+                financial_entry_id = next(financial_entry_ids)
+                financial_entry_rows.append({"id": financial_entry_id, "currency_id": currency_id, "amount": amount})
+                price_ids.append(financial_entry_id)
+
+            purchase_price_id, msrp_id, residual_value_id = price_ids
+            manufacturer_id = manufacturer_ids.get(row.manufacturer_name, default_manufacturer_id)
+            category = categories.get(row.category_id)
+            asset_rows.append({"id": asset_id,
+                               "manufacturer_id": manufacturer_id,
+                               "model_number": row.model_number,
+                               "model_name": row.model_name,
+                               "category_id": row.category_id,
+                               "storage_area_id": None,
+                               "purchase_date": None,
+                               "purchase_price_id": purchase_price_id,
+                               "msrp_id": msrp_id,
+                               "residual_value_id": residual_value_id,
+                               "parent_asset_id": None,
+                               "is_kit_root": False,
+                               "is_attachment": False,
+                               "serial_number": None,
+                               "inventory_number": row.inventory_number,
+                               "description": row.description,
+                               "is_available": True,
+                               "online_item_page": row.online_item_page,
+                               "warranty_starts": None,
+                               "warranty_ends": None,
+                               "search_context": search.context_for(manufacturer_names[manufacturer_id], category['name'] if category else None)})
+
+        # Location logs for the rows that have coordinates
+        located = [(asset_id, row) for asset_id, row in zip(chunk_asset_ids, chunk) if row.latitude is not None and row.longitude is not None]
+        location_log_ids = allocate_ids(model.AssetLocationLog, len(located))
+        location_log_rows = [{"id": location_log_id, "asset_id": asset_id, "latitude": row.latitude, "longitude": row.longitude}
+                             for location_log_id, (asset_id, row) in zip(location_log_ids, located)]
+
+        # Parents before children so the foreign keys hold
+        insert_rows(model.FinancialEntry, financial_entry_rows, chunk_size)
+        insert_rows(model.Asset, asset_rows, chunk_size)
+        insert_rows(model.AssetLocationLog, location_log_rows, chunk_size)
+
+        # Count the chunk's assets in their categories with one upsert
+        category_deltas = {}
+        for row in chunk:
+            totals = category_deltas.get(row.category_id, (0, 0, 0))
+            category_deltas[row.category_id] = (totals[0] + 1, totals[1] + 1, totals[2])
+        category_counts.adjust_many(category_deltas)
+
+        audit_entries(model.CLASS_TO_ENUM_MAP['FinancialEntry'], [entry["id"] for entry in financial_entry_rows], created_by_user_id, audit_details, chunk_size)
+        audit_entries(model.CLASS_TO_ENUM_MAP['Asset'], chunk_asset_ids, created_by_user_id, audit_details, chunk_size)
+        audit_entries(model.CLASS_TO_ENUM_MAP['AssetLocationLog'], location_log_ids, created_by_user_id, audit_details, chunk_size)
+
+        asset_ids.extend(chunk_asset_ids)
+
+    # Commit only if commit=True
+    if commit:
+        model.db.session.commit()
+
+    return asset_ids
@@ -0,0 +1,226 @@
+"""In-process caches for DB backed lookups."""
+
+import threading
+import time
+
+from collections import OrderedDict
+
+from typing import Any, Callable, Dict, Hashable, Iterable, List, Optional
+from flask import g, has_app_context
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+from database import model
+
+
+
+
+class ProcessCache:
+    """Process-wide key/value cache with an optional TTL and explicit invalidation."""
+
+    def __init__(self, ttl_seconds: Optional[float] = None):
+        self.ttl_seconds = ttl_seconds
+        self._entries: Dict[Hashable, tuple] = {}
+        self._generation = 0
+        self._lock = threading.Lock()
+
+
+    def get(self, key: Hashable, loader: Callable[[], Any]) -> Any:
+        """Return the cached value for key, calling loader() to fill it on a miss or after expiry."""
+
+        entry = self._entries.get(key)
+        if entry is not None:
+            value, expires_at = entry
+            if expires_at is None or expires_at > time.monotonic():
+                return value
+
+        generation = self._generation
+        value = loader()
+
+        expires_at = time.monotonic() + self.ttl_seconds if self.ttl_seconds else None
+        with self._lock:
+            # Don't store a value that was loaded while an invalidation happened, it may already be stale
+            if generation == self._generation:
+                self._entries[key] = (value, expires_at)
+
+        return value
+
+
+    def get_many(self, keys: Iterable[Hashable], loader: Callable[[List[Hashable]], Dict[Hashable, Any]]) -> Dict[Hashable, Any]:
+        """Return {key: value} for keys, calling loader(missing_keys) once for every key that missed or expired."""
+
+        now = time.monotonic()
+        found = {}
+        missing = []
+        for key in keys:
+            entry = self._entries.get(key)
+            if entry is not None and (entry[1] is None or entry[1] > now):
+                found[key] = entry[0]
+            else:
+                missing.append(key)
+
+        if not missing:
+            return found
+
+        generation = self._generation
+        loaded = loader(missing)
+
+        expires_at = time.monotonic() + self.ttl_seconds if self.ttl_seconds else None
+        with self._lock:
+            if generation == self._generation:
+                for key in missing:
+                    self._entries[key] = (loaded[key], expires_at)
+
+        found.update((key, loaded[key]) for key in missing)
+        return found
+
+
+    def invalidate(self, key: Optional[Hashable] = None):
+        """Drop a single key, or everything when key is None."""
+
+        with self._lock:
+            self._generation += 1
+            if key is None:
+                self._entries.clear()
+            else:
+                self._entries.pop(key, None)
+
+
+
+
+class LRUCache:
+    """Process-wide cache holding at most max_entries keys, evicting the least recently used. Same interface as ProcessCache."""
+
+    def __init__(self, max_entries: int, ttl_seconds: Optional[float] = None):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self._entries: "OrderedDict[Hashable, tuple]" = OrderedDict()
+        self._generation = 0
+        self._lock = threading.Lock()
+
+
+    def _lookup(self, key: Hashable, now: float) -> tuple:
+        """Return (True, value) for a live entry, marking it recently used, or (False, None). Call with the lock held."""
+
+        entry = self._entries.get(key)
+        if entry is None:
+            return False, None
+
+        value, expires_at = entry
+        if expires_at is not None and expires_at <= now:
+            del self._entries[key]
+            return False, None
+
+        self._entries.move_to_end(key)
+        return True, value
+
+
+    def _store(self, key: Hashable, value: Any, expires_at: Optional[float]):
+        """Insert or refresh an entry and evict down to max_entries. Call with the lock held."""
+
+        self._entries[key] = (value, expires_at)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+
+    def get(self, key: Hashable, loader: Callable[[], Any]) -> Any:
+        """Return the cached value for key, calling loader() to fill it on a miss or after expiry."""
+
+        with self._lock:
+            found, value = self._lookup(key, time.monotonic())
+            generation = self._generation
+        if found:
+            return value
+
+        value = loader()
+
+        expires_at = time.monotonic() + self.ttl_seconds if self.ttl_seconds else None
+        with self._lock:
+            if generation == self._generation:
+                self._store(key, value, expires_at)
+
+        return value
+
+
+    def get_many(self, keys: Iterable[Hashable], loader: Callable[[List[Hashable]], Dict[Hashable, Any]]) -> Dict[Hashable, Any]:
+        """Return {key: value} for keys, calling loader(missing_keys) once for every key that missed or expired."""
+
+        found = {}
+        missing = []
+        with self._lock:
+            now = time.monotonic()
+            for key in keys:
+                hit, value = self._lookup(key, now)
+                if hit:
+                    found[key] = value
+                else:
+                    missing.append(key)
+            generation = self._generation
+
+        if not missing:
+            return found
+
+        loaded = loader(missing)
+
+        expires_at = time.monotonic() + self.ttl_seconds if self.ttl_seconds else None
+        with self._lock:
+            if generation == self._generation:
+                for key in missing:
+                    self._store(key, loaded[key], expires_at)
+
+        found.update((key, loaded[key]) for key in missing)
+        return found
+
+
+    def invalidate(self, key: Optional[Hashable] = None):
+        """Drop a single key, or everything when key is None."""
+
+        with self._lock:
+            self._generation += 1
+            if key is None:
+                self._entries.clear()
+            else:
+                self._entries.pop(key, None)
+
+
+
+
+def request_memo(namespace: str) -> Optional[dict]:
+    """Return a dict that lives for the current request (flask.g), or None when there is no app context."""
+
+    if not has_app_context():
+        return None
+
+    return g.setdefault(f"_memo_{namespace}", {})
+
+
+
+
+def invalidate_after_commit(invalidate: Callable, *args, session: Optional[Session] = None):
+    """Call invalidate(*args) now, and again once the session's transaction commits or rolls back.
+
+    Invalidating only before the commit leaves a window in which another request reloads the old rows and caches them
+    for the whole TTL. Repeating it when the transaction ends drops anything loaded in between, and repeated calls
+    with the same arguments in one transaction only run once at the end.
+    """
+
+    invalidate(*args)
+
+    session = session or model.db.session()
+    session.info.setdefault('invalidate_after_commit', {})[(invalidate, args)] = None
+
+
+def _run_pending_invalidations(session):
+    for invalidate, args in session.info.pop('invalidate_after_commit', {}):
+        invalidate(*args)
+
+
+@event.listens_for(Session, 'after_commit')
+def _invalidate_after_commit(session):
+    _run_pending_invalidations(session)
+
+
+@event.listens_for(Session, 'after_rollback')
+def _invalidate_after_rollback(session):
+    _run_pending_invalidations(session)
@@ -0,0 +1,136 @@
+"""Per-category asset counts, adjusted as assets change instead of aggregated on read."""
+
+from typing import Dict, NamedTuple, Optional, Tuple
+from sqlalchemy import text
+from sqlalchemy.dialects import postgresql
+
+from database import model
+from database import cache
+from database import category_tree
+
+
+# Rolled-up counts are recomputed after this long even without a local change, to pick up other processes' writes.
+CATEGORY_COUNTS_CACHE_TTL_SECONDS = 30
+
+_category_counts_cache = cache.ProcessCache(ttl_seconds=CATEGORY_COUNTS_CACHE_TTL_SECONDS)
+
+
+
+
+class CountDelta(NamedTuple):
+    asset_count: int = 0
+    available_count: int = 0
+    archived_count: int = 0
+
+
+
+
+def adjust_many(deltas: Dict[Optional[int], Tuple[int, int, int]]):
+    """Apply {category_id: (asset, available, archived) deltas} with one upsert. Uncategorized assets aren't counted."""
+
+    rows = [{"category_id": category_id,
+             "asset_count": delta[0],
+             "available_count": delta[1],
+             "archived_count": delta[2]}
+            for category_id, delta in deltas.items()
+            if category_id is not None and any(delta)]
+
+    if not rows:
+        return
+
+    counts = model.CategoryAssetCount.__table__
+    statement = postgresql.insert(counts).values(rows)
+    statement = statement.on_conflict_do_update(index_elements=["category_id"],
+                                                set_={column: counts.c[column] + statement.excluded[column]
+                                                      for column in ("asset_count", "available_count", "archived_count")})
+
+    model.db.session.execute(statement)
+    _category_counts_cache.invalidate()
+
+
+def adjust(category_id: Optional[int], asset_count: int = 0, available_count: int = 0, archived_count: int = 0):
+    """Apply one category's count deltas."""
+
+    adjust_many({category_id: CountDelta(asset_count, available_count, archived_count)})
+
+
+def asset_delta(is_available: bool, is_archived: bool, sign: int = 1) -> CountDelta:
+    """The counts a single asset contributes to its category, negated with sign=-1 to take it away."""
+
+    return CountDelta(asset_count=sign,
+                      available_count=sign if is_available and not is_archived else 0,
+                      archived_count=sign if is_archived else 0)
+
+
+def is_asset_archived(asset_id: int) -> bool:
+    """Read an asset's archived flag from its AuditState."""
+
+    is_archived = model.db.session.query(model.AuditState.is_archived) \
+                                  .filter_by(auditable_entity_type=model.AuditableEntityTypes.ASSET.value,
+                                             related_entity_id=asset_id,
+                                             related_composite_id=0) \
+                                  .scalar()
+
+    return bool(is_archived)
+
+
+def _load_rolled_up_counts() -> Dict[int, dict]:
+    """Read the per-category rows and add each one into every ancestor, using the cached category tree."""
+
+    tree = category_tree.category_tree()
+    direct = {row.category_id: row for row in model.db.session.query(model.CategoryAssetCount).all()}
+
+    counts = {}
+    for category_id in tree.nodes:
+        row = direct.get(category_id)
+        counts[category_id] = {"asset_count": row.asset_count if row else 0,
+                               "available_count": row.available_count if row else 0,
+                               "archived_count": row.archived_count if row else 0,
+                               "subtree_asset_count": 0,
+                               "subtree_available_count": 0,
+                               "subtree_archived_count": 0}
+
+    for category_id, category_counts in counts.items():
+        for counted_id in (category_id,) + tree.ancestor_ids[category_id]:
+            counts[counted_id]["subtree_asset_count"] += category_counts["asset_count"]
+            counts[counted_id]["subtree_available_count"] += category_counts["available_count"]
+            counts[counted_id]["subtree_archived_count"] += category_counts["archived_count"]
+
+    return counts
+
+
+def rolled_up_counts() -> Dict[int, dict]:
+    """{category_id: counts} for the category itself and its whole subtree. Shared between requests, don't modify it."""
+
+    return _category_counts_cache.get("counts", _load_rolled_up_counts)
+
+
+def invalidate():
+    """Drop the rolled-up counts so the next read recomputes them."""
+
+    _category_counts_cache.invalidate()
+
+
+def rebuild(commit: bool = True):
+    """Recount every category from the assets table, e.g. after changes made outside these functions."""
+
+    model.db.session.execute(text("DELETE FROM category_asset_counts;"))
+    model.db.session.execute(text("""
+        INSERT INTO category_asset_counts (category_id, asset_count, available_count, archived_count)
+        SELECT a.category_id,
+               COUNT(*),
+               COUNT(*) FILTER (WHERE a.is_available AND NOT COALESCE(s.is_archived, FALSE)),
+               COUNT(*) FILTER (WHERE COALESCE(s.is_archived, FALSE))
+        FROM assets AS a
+        LEFT JOIN audit_states AS s
+               ON s.auditable_entity_type = 'ASSET'
+              AND s.related_entity_id = a.id
+              AND s.related_composite_id = 0
+        WHERE a.category_id IS NOT NULL
+        GROUP BY a.category_id;
+    """))
+
+    _category_counts_cache.invalidate()
+
+    if commit:
+        model.db.session.commit()
@@ -0,0 +1,102 @@
+"""Category hierarchy, built once with a recursive CTE and cached in-process."""
+
+from typing import Dict, FrozenSet, List, NamedTuple
+from sqlalchemy import text
+
+from database import model
+from database import cache
+
+
+# The tree is rebuilt after this long even without an invalidation, to pick up categories created by other processes.
+CATEGORY_TREE_CACHE_TTL_SECONDS = 300
+
+_category_tree_cache = cache.ProcessCache(ttl_seconds=CATEGORY_TREE_CACHE_TTL_SECONDS)
+
+
+
+
+class CategoryTree(NamedTuple):
+    """Every lookup the category picker and asset filters need, precomputed. Treat it as read-only, it is shared."""
+
+    nested: Dict[int, dict]                     # {root_id: node}, each node is Category.to_dict() plus 'children'
+    nodes: Dict[int, dict]                      # {category_id: node}
+    ancestor_ids: Dict[int, tuple]              # {category_id: (root_id, ..., parent_id)}
+    descendant_ids: Dict[int, FrozenSet[int]]   # {category_id: ids in its subtree, itself included}
+
+
+
+
+def _load_category_tree() -> CategoryTree:
+    """Walk the hierarchy in one recursive query. Ordering by path puts every parent before its children."""
+
+    rows = model.db.session.execute(text("""
+        WITH RECURSIVE category_tree AS (
+            SELECT id, parent_category_id, name, color_id, ARRAY[id] AS path
+            FROM categories
+            WHERE parent_category_id IS NULL
+            UNION ALL
+            SELECT c.id, c.parent_category_id, c.name, c.color_id, t.path || c.id
+            FROM categories AS c
+            JOIN category_tree AS t ON c.parent_category_id = t.id
+        )
+        SELECT id, parent_category_id, name, color_id, path
+        FROM category_tree
+        ORDER BY path;
+    """)).all()
+
+    nested = {}
+    nodes = {}
+    ancestor_ids = {}
+    descendant_ids = {}
+
+    for row in rows:
+        node = {'id': row.id,
+                'parent_category_id': row.parent_category_id,
+                'name': row.name,
+                'color_id': row.color_id,
+                'children': []}
+        nodes[row.id] = node
+
+        if row.parent_category_id is None:
+            nested[row.id] = node
+        else:
+            nodes[row.parent_category_id]['children'].append(node)
+
+        ancestor_ids[row.id] = tuple(row.path[:-1])
+        descendant_ids[row.id] = {row.id}
+        for ancestor_id in ancestor_ids[row.id]:
+            descendant_ids[ancestor_id].add(row.id)
+
+    return CategoryTree(nested=nested,
+                        nodes=nodes,
+                        ancestor_ids=ancestor_ids,
+                        descendant_ids={category_id: frozenset(ids) for category_id, ids in descendant_ids.items()})
+
+
+def category_tree() -> CategoryTree:
+    """Return the cached CategoryTree, building it on first use or after invalidation."""
+
+    return _category_tree_cache.get("tree", _load_category_tree)
+
+
+def descendant_ids(category_id: int) -> FrozenSet[int]:
+    """Ids of the category and everything below it. Unknown ids just return themselves."""
+
+    return category_tree().descendant_ids.get(category_id, frozenset((category_id,)))
+
+
+def expand_category_ids(category_ids: List[int]) -> List[int]:
+    """Replace each category id with its whole subtree."""
+
+    tree = category_tree()
+    expanded = set()
+    for category_id in category_ids:
+        expanded |= tree.descendant_ids.get(category_id, {category_id})
+
+    return sorted(expanded)
+
+
+def invalidate_category_tree():
+    """Call when categories are created or moved."""
+
+    _category_tree_cache.invalidate()
@@ -1,8 +1,21 @@
 "Create methods for DB Entities"
 from database import model
+from database import cache
+from database import permissions
+from database import availability
+from database import category_tree
+from database import category_counts
+from database import search
+from database import scan
+from database import kits
+from database import asset_images
+from database import audit_sink
+from database import reference_data
+from database import deployment_settings
 
 from typing import Optional
 from datetime import datetime
+from sqlalchemy import func
 
 
 
@@ -37,6 +50,9 @@ def timezone(id: int,
     # Always add to the session
     model.db.session.add(timezone)
     
+    # Reference data readers reload timezones on next use, and again once the transaction ends
+    cache.invalidate_after_commit(reference_data.invalidate)
+
     # Commit only if commit=True
     if commit:
         model.db.session.commit()
@@ -66,6 +82,9 @@ def country(id: int,
     # Always add to the session
     model.db.session.add(country)
     
+    # Reference data readers reload countries on next use, and again once the transaction ends
+    cache.invalidate_after_commit(reference_data.invalidate)
+
     # Commit only if commit=True
     if commit:
         model.db.session.commit()
@@ -98,6 +117,9 @@ def state(code: model.StateCodes,
     # Always add to the session
     model.db.session.add(state)
     
+    # Reference data readers reload states on next use, and again once the transaction ends
+    cache.invalidate_after_commit(reference_data.invalidate)
+
     # Commit only if commit=True
     if commit:
         model.db.session.commit()
@@ -128,6 +150,9 @@ def currency(id: int,
     # Always add to the session
     model.db.session.add(currency)
     
+    # Reference data readers reload currencies on next use, and again once the transaction ends
+    cache.invalidate_after_commit(reference_data.invalidate)
+
     # Commit only if commit=True
     if commit:
         model.db.session.commit()
@@ -156,10 +181,8 @@ def financial_entry(currency_id: int,
                                               auditable_entity_type=model.CLASS_TO_ENUM_MAP['FinancialEntry'],
                                               related_entity_id=financial_entry.id,
                                               created_by_user_id=created_by_user_id,
-                                              audit_details=audit_details)
-
-    # Add the audit_entry to the session
-    model.db.session.add(financial_entry_audit_entry)
+                                              audit_details=audit_details,
+                                              commit=False)
     
     # Commit only if commit=True
     if commit:
@@ -177,7 +200,7 @@ def audit_entry(operation_type: model.OperationType,
                 related_composite_id: int = None,
                 audit_details: Optional[str] = None,
                 commit: bool = True):
-    """Create and return a new Audit Info entry."""
+    """Queue a new Audit Info entry (and its AuditState change) on the session and return it."""
 
     # Check to make sure that the value is in the Enum list
     if operation_type not in [e.value for e in model.OperationType]:
@@ -187,25 +210,37 @@ def audit_entry(operation_type: model.OperationType,
         raise ValueError("Either related_entity_id or related_entity_hash must be provided.")
 
     time_stamp = datetime.utcnow()
-    audit_entry = model.AuditEntry(operation_type=operation_type,
-                                   auditable_entity_type=auditable_entity_type,
-                                   related_entity_id=related_entity_id,
-                                   related_entity_hash=related_entity_hash,
-                                   related_composite_id=related_composite_id,  # For composite Foreign Keys
-                                   details=audit_details,
-                                   created_by=created_by_user_id,
-                                   created_at=time_stamp,
-                                   last_edited_by=created_by_user_id,
-                                   last_edited_at=time_stamp)
-    
-    # Always add to the session
-    model.db.session.add(audit_entry)
+    is_archiving = operation_type == model.OperationType.ARCHIVE.value
+
+    entry = audit_sink.entry_row(operation_type=operation_type,
+                                 auditable_entity_type=auditable_entity_type,
+                                 created_by_user_id=created_by_user_id,
+                                 time_stamp=time_stamp,
+                                 related_entity_id=related_entity_id,
+                                 related_entity_hash=related_entity_hash,
+                                 related_composite_id=related_composite_id,  # For composite Foreign Keys
+                                 audit_details=audit_details)
+
+    # Keep the one-row-per-entity AuditState in sync. Hash-only entities (GlobalSettings) aren't read through it.
+    state = None
+    if related_entity_id is not None:
+        state = audit_sink.state_row(operation_type=operation_type,
+                                     auditable_entity_type=auditable_entity_type,
+                                     related_entity_id=related_entity_id,
+                                     related_composite_id=related_composite_id,
+                                     edited_by_user_id=created_by_user_id,
+                                     edited_at=time_stamp,
+                                     is_archived=True if is_archiving else None)
+
+    # Queue both rows, they are written together with the rest of the unit of work's audit trail
+    audit_sink.enqueue(entry, state)
     
     # Commit only if commit=True
     if commit:
         model.db.session.commit()
 
-    return audit_entry
+    # Not added to the session, the sink writes the row, so the returned entry has no id
+    return model.AuditEntry(**entry)
 
 
 
@@ -230,6 +265,9 @@ def global_settings(deployment_fingerprint: str,
     # Add the global_setting to the session
     model.db.session.add(global_settings)
 
+    # Every process drops its cached settings once this commits
+    deployment_settings.notify_changed()
+
 
     # Adding this just to the ones that need initalized for database creation
     if audit:
@@ -240,10 +278,8 @@ def global_settings(deployment_fingerprint: str,
                                                   auditable_entity_type=model.CLASS_TO_ENUM_MAP['GlobalSettings'],
                                                   related_entity_id=global_settings.id,
                                                   created_by_user_id=created_by_user_id,
-                                                  audit_details=audit_details)
-
-        # Add the audit_entry to the session
-        model.db.session.add(global_settings_audit_entry)
+                                                  audit_details=audit_details,
+                                                  commit=False)
 
 
     # Commit only if commit=True
@@ -282,10 +318,11 @@ def color(name: str,
                                         auditable_entity_type=model.CLASS_TO_ENUM_MAP['Color'],
                                         related_entity_id=color.id,
                                         created_by_user_id=created_by_user_id,
-                                        audit_details=audit_details)
+                                        audit_details=audit_details,
+                                        commit=False)
 
-        # Add the audit_entry to the session
-        model.db.session.add(color_audit_entry)
+    # Reference data readers reload colors on next use, and again once the transaction ends
+    cache.invalidate_after_commit(reference_data.invalidate)
 
     # Commit only if commit=True
     if commit:
@@ -324,13 +361,11 @@ def ui_theme(name: str,
         model.db.session.flush()
 
         uiTheme_audit_entry = audit_entry(operation_type=model.OperationType.CREATE.value,
-                                          auditable_entity_type=model.CLASS_TO_ENUM_MAP['Color'],
+                                          auditable_entity_type=model.CLASS_TO_ENUM_MAP['UiTheme'],
                                           related_entity_id=uiTheme.id,
                                           created_by_user_id=created_by_user_id,
-                                          audit_details=audit_details)
-
-        # Add the audit_entry to the session
-        model.db.session.add(uiTheme_audit_entry)
+                                          audit_details=audit_details,
+                                          commit=False)
 
     # Commit only if commit=True
     if commit:
@@ -378,10 +413,8 @@ def user_settings(currency_id: int,
                                                 auditable_entity_type=model.CLASS_TO_ENUM_MAP['UserSettings'],
                                                 related_entity_id=user_settings.id,
                                                 created_by_user_id=created_by_user_id,
-                                                audit_details=audit_details)
-
-        # Add the audit_entry to the session
-        model.db.session.add(user_settings_audit_entry)
+                                                audit_details=audit_details,
+                                                commit=False)
 
     # Commit only if commit=True
     if commit:
@@ -513,10 +546,8 @@ def user(password_hash: str,
                                    auditable_entity_type=model.CLASS_TO_ENUM_MAP['User'],
                                    related_entity_id=user.id,
                                    created_by_user_id=created_by_user_id,
-                                   audit_details=audit_details)
-
-    # Add the user_audit_entry to the session
-    model.db.session.add(user_audit_entry)
+                                   audit_details=audit_details,
+                                   commit=False)
 
     # Commit only if commit=True
     if commit:
@@ -562,10 +593,8 @@ def phone_number(phoneable_entity_type: model.PhoneableEntityTypes,
                                            auditable_entity_type=model.CLASS_TO_ENUM_MAP['PhoneNumber'],
                                            related_entity_id=phone_number.id,
                                            created_by_user_id=created_by_user_id,
-                                           audit_details=audit_details)
-
-    # Add the user_audit_entry to the session
-    model.db.session.add(phone_number_audit_entry)
+                                           audit_details=audit_details,
+                                           commit=False)
 
     # Commit only if commit=True
     if commit:
@@ -605,10 +634,8 @@ def email_address(emailable_entity_type: model.EmailableEntityTypes,
                                     auditable_entity_type=model.CLASS_TO_ENUM_MAP['EmailAddress'],
                                     related_entity_id=email_address.id,
                                     created_by_user_id=created_by_user_id,
-                                    audit_details=audit_details)
-
-    # Add the user_audit_entry to the session
-    model.db.session.add(email_audit_entry)
+                                    audit_details=audit_details,
+                                    commit=False)
 
     # Commit only if commit=True
     if commit:
@@ -650,12 +677,10 @@ def file_attachment(attachable_entity_type: model.AttachableEntityTypes,
         auditable_entity_type=model.CLASS_TO_ENUM_MAP['FileAttachment'],
         related_entity_id=file_attachment.id,
         created_by_user_id=created_by_user_id,
-        audit_details=audit_details
+        audit_details=audit_details,
+        commit=False
     )
 
-    # Add the user_audit_entry to the session
-    model.db.session.add(file_attachment_audit_entry)
-
     # Commit only if commit=True
     if commit:
         model.db.session.commit()
@@ -689,11 +714,15 @@ def file_attachment_association(file_attachment_id: int,
         auditable_entity_type=model.CLASS_TO_ENUM_MAP['FileAttachmentAssociation'],
         related_entity_id=file_attachment_association.file_attachment_id,
         created_by_user_id=created_by_user_id,
-        audit_details=audit_details
+        audit_details=audit_details,
+        commit=False
     )
 
-    # Add to session
-    model.db.session.add(file_attachment_association_audit_entry)
+    # Keep the asset's image variant map in step
+    if attachable_entity_type == model.AttachableEntityTypes.ASSET.value:
+        file_attachment = model.db.session.query(model.FileAttachment).filter_by(id=file_attachment_id).first()
+        if file_attachment:
+            asset_images.record_variant(entity_id, file_attachment)
 
     # Commit if specified
     if commit:
@@ -743,23 +772,23 @@ def file_attachment_with_association(attachable_entity_type: model.AttachableEnt
         auditable_entity_type=model.CLASS_TO_ENUM_MAP['FileAttachment'],
         related_entity_id=file_attachment.id,
         created_by_user_id=created_by_user_id,
-        audit_details=audit_details
+        audit_details=audit_details,
+        commit=False
     )
 
-    # Add to session
-    model.db.session.add(file_attachment_audit_entry)
-
     # Audit entry for FileAttachmentAssociation
     file_attachment_association_audit_entry = audit_entry(
         operation_type=model.OperationType.CREATE.value,
         auditable_entity_type=model.CLASS_TO_ENUM_MAP['FileAttachmentAssociation'],
         related_entity_id=file_attachment_association.file_attachment_id,  # Assuming you want to relate it to the file_attachment_id
         created_by_user_id=created_by_user_id,
-        audit_details=audit_details
+        audit_details=audit_details,
+        commit=False
     )
 
-    # Add to session
-    model.db.session.add(file_attachment_association_audit_entry)
+    # Keep the asset's image variant map in step
+    if attachable_entity_type == model.AttachableEntityTypes.ASSET.value:
+        asset_images.record_variant(entity_id, file_attachment)
 
     # Commit if specified
     if commit:
@@ -790,10 +819,11 @@ def user_role(user_id: int,
                                         related_entity_id=user_role.user_id,
                                         related_composite_id=user_role.role_id,
                                         created_by_user_id=created_by_user_id,
-                                        audit_details=audit_details)
+                                        audit_details=audit_details,
+                                        commit=False)
 
-    # Add the audit_entry to the session
-    model.db.session.add(user_role_audit_entry)
+    # Cached permission sets built from this user role are now stale, here and again once the transaction ends
+    cache.invalidate_after_commit(permissions.invalidate_permissions, user_role.user_id)
 
     # Commit only if commit=True
     if commit:
@@ -823,10 +853,8 @@ def role(name: str,
                                         auditable_entity_type=model.CLASS_TO_ENUM_MAP['Role'],
                                         related_entity_id=role.id,
                                         created_by_user_id=created_by_user_id,
-                                        audit_details=audit_details)
-
-    # Add the audit_entry to the session
-    model.db.session.add(role_audit_entry)
+                                        audit_details=audit_details,
+                                        commit=False)
     
     # Commit only if commit=True
     if commit:
@@ -857,11 +885,12 @@ def role_permission(role_id: int,
                                               related_entity_id=role_permission.role_id,
                                               related_composite_id=role_permission.permission_id,
                                               created_by_user_id=created_by_user_id,
-                                              audit_details=audit_details)
-
-    # Add the audit_entry to the session
-    model.db.session.add(role_permission_audit_entry)
+                                              audit_details=audit_details,
+                                              commit=False)
     
+    # Cached permission sets built from this role permission are now stale, here and again once the transaction ends
+    cache.invalidate_after_commit(permissions.invalidate_permissions)
+
     # Commit only if commit=True
     if commit:
         model.db.session.commit()
@@ -890,10 +919,8 @@ def permission(name: str,
                                          auditable_entity_type=model.CLASS_TO_ENUM_MAP['Permission'],
                                          related_entity_id=permission.id,
                                          created_by_user_id=created_by_user_id,
-                                         audit_details=audit_details)
-
-    # Add audit_entry to the session
-    model.db.session.add(permission_audit_entry)
+                                         audit_details=audit_details,
+                                         commit=False)
     
     # Commit only if commit=True
     if commit:
@@ -934,10 +961,8 @@ def address(name: str,
                                       auditable_entity_type=model.CLASS_TO_ENUM_MAP['Address'],
                                       related_entity_id=address.id,
                                       created_by_user_id=created_by_user_id,
-                                      audit_details=audit_details)
-
-    # Add the audit_entry to the session
-    model.db.session.add(address_audit_entry)
+                                      audit_details=audit_details,
+                                      commit=False)
     
     # Commit only if commit=True
     if commit:
@@ -973,10 +998,8 @@ def area(name: str,
                                    auditable_entity_type=model.CLASS_TO_ENUM_MAP['Area'],
                                    related_entity_id=area.id,
                                    created_by_user_id=created_by_user_id,
-                                   audit_details=audit_details)
-
-    # Add the audit_entry to the session
-    model.db.session.add(area_audit_entry)
+                                   audit_details=audit_details,
+                                   commit=False)
     
     # Commit only if commit=True
     if commit:
@@ -1008,10 +1031,8 @@ def manufacturer(name: str,
                                            auditable_entity_type=model.CLASS_TO_ENUM_MAP['Manufacturer'],
                                            related_entity_id=manufacturer.id,
                                            created_by_user_id=created_by_user_id,
-                                           audit_details=audit_details)
-
-    # Add audit_entry to the session
-    model.db.session.add(manufacturer_audit_entry)
+                                           audit_details=audit_details,
+                                           commit=False)
     
     # Commit only if commit=True
     if commit:
@@ -1043,10 +1064,11 @@ def category(name: str,
                                        auditable_entity_type=model.CLASS_TO_ENUM_MAP['Category'],
                                        related_entity_id=category.id,
                                        created_by_user_id=created_by_user_id,
-                                       audit_details=audit_details)
+                                       audit_details=audit_details,
+                                       commit=False)
 
-    # Add the audit_entry to the session
-    model.db.session.add(category_audit_entry)
+    # The cached category tree doesn't have this one yet
+    category_tree.invalidate_category_tree()
     
     # Commit only if commit=True
     if commit:
@@ -1099,7 +1121,8 @@ def asset(manufacturer_id: int,
                         is_available=is_available,
                         online_item_page=online_item_page,
                         warranty_starts=warranty_starts,
-                        warranty_ends=warranty_ends)
+                        warranty_ends=warranty_ends,
+                        search_context=search.context_for_ids(manufacturer_id, category_id))
     
     # Add asset to the session for flush
     model.db.session.add(asset)
@@ -1110,10 +1133,15 @@ def asset(manufacturer_id: int,
                                     auditable_entity_type=model.CLASS_TO_ENUM_MAP['Asset'],
                                     related_entity_id=asset.id,
                                     created_by_user_id=created_by_user_id,
-                                    audit_details=audit_details)
+                                    audit_details=audit_details,
+                                    commit=False)
 
-    # Add the audit_entry to the session
-    model.db.session.add(asset_audit_entry)
+    # Count the new asset in its category
+    category_counts.adjust(category_id, *category_counts.asset_delta(is_available, is_archived=False))
+
+    # Its kit has a new member
+    if parent_asset_id is not None:
+        kits.invalidate(kits.kit_root_ids([parent_asset_id]).values())
     
     # Commit only if commit=True
     if commit:
@@ -1131,6 +1159,17 @@ def asset_tag(asset_id: int,
               audit_details: Optional[str] = None,
               commit: bool = True):
     """Create and return a Asset Tag entry."""
+
+    code_type, data = scan.scan_key(code_type, data)
+
+    # Check if a tag (archived or not) already carries this payload, it is unique per code type
+    existing = model.db.session.query(model.AssetTag.id, model.AssetTag.asset_id) \
+                               .filter(model.AssetTag.code_type == code_type,
+                                       func.md5(model.AssetTag.data) == scan.data_hash(data),
+                                       model.AssetTag.data == data) \
+                               .first()
+    if existing:
+        raise ValueError(f"{code_type} tag already exists on asset ID: {existing.asset_id}")
     
     asset_tag = model.AssetTag(asset_id=asset_id,
                                code_type=code_type,
@@ -1145,10 +1184,11 @@ def asset_tag(asset_id: int,
                                         auditable_entity_type=model.CLASS_TO_ENUM_MAP['AssetTag'],
                                         related_entity_id=asset_tag.id,
                                         created_by_user_id=created_by_user_id,
-                                        audit_details=audit_details)
+                                        audit_details=audit_details,
+                                        commit=False)
 
-    # Add the user_audit_entry to the session
-    model.db.session.add(asset_tag_audit_entry)
+    # Drop the cached miss for this payload
+    scan.invalidate(code_type, data)
 
     # Commit only if commit=True
     if commit:
@@ -1180,10 +1220,8 @@ def asset_location_log(asset_id: int,
                                                  auditable_entity_type=model.CLASS_TO_ENUM_MAP['AssetLocationLog'],
                                                  related_entity_id=asset_location_log.id,
                                                  created_by_user_id=created_by_user_id,
-                                                 audit_details=audit_details)
-
-    # Add the user_audit_entry to the session
-    model.db.session.add(asset_location_log_audit_entry)
+                                                 audit_details=audit_details,
+                                                 commit=False)
 
     # Commit only if commit=True
     if commit:
@@ -1217,10 +1255,8 @@ def flag(name: str,
                                    auditable_entity_type=model.CLASS_TO_ENUM_MAP['Flag'],
                                    related_entity_id=flag.id,
                                    created_by_user_id=created_by_user_id,
-                                   audit_details=audit_details)
-
-    # Add the user_audit_entry to the session
-    model.db.session.add(flag_audit_entry)
+                                   audit_details=audit_details,
+                                   commit=False)
 
     # Commit only if commit=True
     if commit:
@@ -1236,7 +1272,23 @@ def asset_flag(asset_id: int,
                created_by_user_id: int,
                audit_details: Optional[str] = None,
                commit: bool = True):
-    """Create and return an Asset Flag entry."""
+    """Create and return an Asset Flag entry. Flags that make assets unavailable also clear the asset's is_available."""
+
+    asset = model.db.session.query(model.Asset).filter_by(id=asset_id).first()
+    flag = model.db.session.query(model.Flag).filter_by(id=flag_id).first()
+
+    # Check if asset and flag exist
+    if not asset:
+        raise ValueError(f"Invalid asset ID: {asset_id}")
+    if not flag:
+        raise ValueError(f"Invalid flag ID: {flag_id}")
+
+    if flag.makes_unavailable and asset.is_available:
+        asset.is_available = False
+
+        # It no longer counts as available in its category, unless it was archived and didn't count already
+        if not category_counts.is_asset_archived(asset_id):
+            category_counts.adjust(asset.category_id, available_count=-1)
     
     asset_flag = model.AssetFlag(asset_id=asset_id,
                                  flag_id=flag_id)
@@ -1251,10 +1303,8 @@ def asset_flag(asset_id: int,
                                          related_entity_id=asset_flag.asset_id,
                                          related_composite_id=asset_flag.flag_id,
                                          created_by_user_id=created_by_user_id,
-                                         audit_details=audit_details)
-
-    # Add the audit_entry to the session
-    model.db.session.add(asset_flag_audit_entry)
+                                         audit_details=audit_details,
+                                         commit=False)
     
     # Commit only if commit=True
     if commit:
@@ -1288,10 +1338,8 @@ def custom_property(name: str,
                                               auditable_entity_type=model.CLASS_TO_ENUM_MAP['CustomProperty'],
                                               related_entity_id=custom_property.id,
                                               created_by_user_id=created_by_user_id,
-                                              audit_details=audit_details)
-
-    # Add the user_audit_entry to the session
-    model.db.session.add(custom_property_audit_entry)
+                                              audit_details=audit_details,
+                                              commit=False)
 
     # Commit only if commit=True
     if commit:
@@ -1324,10 +1372,8 @@ def asset_custom_property(asset_id: int,
                                                     related_entity_id=asset_custom_property.asset_id,
                                                     related_composite_id=asset_custom_property.custom_property_id,
                                                     created_by_user_id=created_by_user_id,
-                                                    audit_details=audit_details)
-
-    # Add the audit_entry to the session
-    model.db.session.add(asset_custom_property_audit_entry)
+                                                    audit_details=audit_details,
+                                                    commit=False)
     
     # Commit only if commit=True
     if commit:
@@ -1367,10 +1413,8 @@ def reservation(reserved_for: int,
                                           auditable_entity_type=model.CLASS_TO_ENUM_MAP['Reservation'],
                                           related_entity_id=reservation.id,
                                           created_by_user_id=created_by_user_id,
-                                          audit_details=audit_details)
-
-    # Add the user_audit_entry to the session
-    model.db.session.add(reservation_audit_entry)
+                                          audit_details=audit_details,
+                                          commit=False)
 
     # Commit only if commit=True
     if commit:
@@ -1386,10 +1430,24 @@ def reservation_asset(reservation_id: int,
                       created_by_user_id: int,
                       audit_details: Optional[str] = None,
                       commit: bool = True):
-    """Create and return a Reservation Asset entry."""
-    
+    """Create and return a Reservation Asset entry. Raises ValueError if the asset is already reserved in that window."""
+
+    reservation = model.db.session.query(model.Reservation).filter_by(id=reservation_id).first()
+
+    # Check if reservation exists
+    if not reservation:
+        raise ValueError(f"Invalid reservation ID: {reservation_id}")
+
+    # Check the window against the database, the exclusion constraint on reserved_during is the last line of defence
+    window = availability.reserved_window(reservation)
+    if window is not None:
+        conflicting_reservation_ids = availability.conflicts_db(asset_id, *window, exclude_reservation_id=reservation_id)
+        if conflicting_reservation_ids:
+            raise ValueError(f"Asset {asset_id} is already reserved during this window by reservation(s) {conflicting_reservation_ids}")
+
     reservation_asset = model.ReservationAsset(reservation_id=reservation_id,
-                                               asset_id=asset_id)
+                                               asset_id=asset_id,
+                                               reserved_during=availability.reserved_range(reservation))
     
     # Add role_permission to the session for flush
     model.db.session.add(reservation_asset)
@@ -1401,10 +1459,11 @@ def reservation_asset(reservation_id: int,
                                                 related_entity_id=reservation_asset.reservation_id,
                                                 related_composite_id=reservation_asset.asset_id,
                                                 created_by_user_id=created_by_user_id,
-                                                audit_details=audit_details)
+                                                audit_details=audit_details,
+                                                commit=False)
 
-    # Add the audit_entry to the session
-    model.db.session.add(reservation_asset_audit_entry)
+    # The warm availability index for this asset no longer has every reservation
+    availability.invalidate([asset_id])
     
     # Commit only if commit=True
     if commit:
@@ -1438,10 +1497,8 @@ def comment(commentable_entity_type: model.CommentableEntityTypes, #Type hint
                                       auditable_entity_type=model.CLASS_TO_ENUM_MAP['Comment'],
                                       related_entity_id=comment.id,
                                       created_by_user_id=created_by_user_id,
-                                      audit_details=audit_details)
-
-    # Add the user_audit_entry to the session
-    model.db.session.add(comment_audit_entry)
+                                      audit_details=audit_details,
+                                      commit=False)
 
     # Commit only if commit=True
     if commit:
@@ -1473,10 +1530,8 @@ def reaction(user_id: int,
                                        auditable_entity_type=model.CLASS_TO_ENUM_MAP['Reaction'],
                                        related_entity_id=reaction.id,
                                        created_by_user_id=created_by_user_id,
-                                       audit_details=audit_details)
-
-    # Add the audit_entry to the session
-    model.db.session.add(reaction_audit_entry)
+                                       audit_details=audit_details,
+                                       commit=False)
     
     # Commit only if commit=True
     if commit:
@@ -6,32 +6,74 @@ from database import read
 from database import update
 from database import delete
 from database import archive
+from database import bulk
 
 from typing import Optional, Type, Tuple
-from sqlalchemy import and_, desc
+from sqlalchemy import and_, desc, text
 from sqlalchemy.orm import Session, Query, aliased
 
 class Utils:
     @staticmethod
     def get_query_with_audit_join(entity: Type[model.AuditableBase],
                                   auditable_entity_type: model.AuditableEntityTypes) -> Tuple[Query, Type]:
-        """Creates a query for the specified entity type with an outer join on AuditEntry."""
+        """Creates a query for the specified entity type with an outer join on its AuditState (one row per entity)."""
 
-        # Create an alias for AuditEntry to keep track of the latest audit for the entity
-        latest_audit = aliased(model.AuditEntry)
+        # Create an alias for AuditState to keep track of the latest audit for the entity
+        latest_audit = aliased(model.AuditState)
 
         # Initialize the query with the specified entity
         query = model.db.session.query(entity)
 
+        # Composite key entities (join tables) store their second key in related_composite_id, everything else stores 0
+        entity_id_column, composite_id_column = entity.__audit_key__
+        composite_id = getattr(entity, composite_id_column) if composite_id_column else 0
+
         # Perform an outer join with the latest_audit alias
-        # Filter the join by auditable entity type and related entity ID
+        # Filter the join by auditable entity type and related entity key
         query = query.outerjoin(latest_audit, and_(latest_audit.auditable_entity_type == auditable_entity_type,
-                                                   latest_audit.related_entity_id == entity.id))
+                                                   latest_audit.related_entity_id == getattr(entity, entity_id_column),
+                                                   latest_audit.related_composite_id == composite_id))
         
-        # Return both the query and the alias for the latest audit entry
+        # Return both the query and the alias for the latest audit state
         return query, latest_audit
     
 
+    @staticmethod
+    def rebuild_audit_states(commit: bool = True):
+        """Rebuild the audit_states table from the full audit_entries history."""
+
+        model.db.session.execute(text("DELETE FROM audit_states;"))
+
+        # Take the newest entry per entity for the "last edited" columns, and archive the entity if any entry archived it
+        model.db.session.execute(text("""
+            INSERT INTO audit_states (auditable_entity_type, related_entity_id, related_composite_id,
+                                      last_operation_type, last_edited_by, last_edited_at, is_archived, archived_at)
+            SELECT latest.auditable_entity_type, latest.related_entity_id, latest.related_composite_id,
+                   latest.operation_type, latest.last_edited_by, latest.last_edited_at,
+                   archived.is_archived, archived.archived_at
+            FROM (
+                SELECT DISTINCT ON (auditable_entity_type, related_entity_id, COALESCE(related_composite_id, 0))
+                       auditable_entity_type, related_entity_id, COALESCE(related_composite_id, 0) AS related_composite_id,
+                       operation_type, last_edited_by, last_edited_at
+                FROM audit_entries
+                WHERE related_entity_id IS NOT NULL
+                ORDER BY auditable_entity_type, related_entity_id, COALESCE(related_composite_id, 0), created_at DESC, id DESC
+            ) AS latest
+            JOIN (
+                SELECT auditable_entity_type, related_entity_id, COALESCE(related_composite_id, 0) AS related_composite_id,
+                       BOOL_OR(is_archived OR operation_type = 'ARCHIVE') AS is_archived,
+                       MAX(COALESCE(archived_at, CASE WHEN operation_type = 'ARCHIVE' THEN created_at END)) AS archived_at
+                FROM audit_entries
+                WHERE related_entity_id IS NOT NULL
+                GROUP BY auditable_entity_type, related_entity_id, COALESCE(related_composite_id, 0)
+            ) AS archived
+            USING (auditable_entity_type, related_entity_id, related_composite_id);
+        """))
+
+        if commit:
+            model.db.session.commit()
+
+
     # @staticmethod
     # def get_query_with_audit_join(entity: Type[model.AuditableBase],
     #                               auditable_entity_type: model.AuditableEntityTypes) -> Tuple[Query, Type]:
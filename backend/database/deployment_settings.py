@@ -0,0 +1,180 @@
+"""The deployment's GlobalSettings row, cached in-process and kept fresh across workers with LISTEN/NOTIFY.
+
+The single global_settings row is read once per process into a Settings record, and its default currency is looked
+up in the reference data cache on each access (so currency edits show up as soon as that cache reloads). Rendering a
+price needs no query at all:
+
+    deployment_settings.default_currency().symbol
+
+Writers call notify_changed() in the same transaction as their change. PostgreSQL delivers the notification when that
+transaction commits, and every process running start_listener() drops its copy. If the listener loses its connection
+it drops the cache too, logs why and reconnects, and entries expire after SETTINGS_CACHE_TTL_SECONDS regardless.
+"""
+import logging
+import select
+import threading
+import time
+
+from typing import NamedTuple, Optional
+from sqlalchemy import text
+
+from database import model
+from database import cache
+from database import reference_data
+
+
+# Notification channel for global_settings changes
+SETTINGS_CHANNEL = "parm_global_settings"
+
+# Only a safety net, changes normally arrive through SETTINGS_CHANNEL
+SETTINGS_CACHE_TTL_SECONDS = 3600
+
+# How long the listener waits on its socket between checks, and before reconnecting after an error
+SETTINGS_LISTEN_POLL_SECONDS = 60
+SETTINGS_LISTEN_RETRY_SECONDS = 5
+
+_settings_cache = cache.ProcessCache(ttl_seconds=SETTINGS_CACHE_TTL_SECONDS)
+
+_listener: Optional[threading.Thread] = None
+_listener_lock = threading.Lock()
+
+logger = logging.getLogger(__name__)
+
+
+
+
+class Settings(NamedTuple):
+    deployment_fingerprint: str
+    default_currency_id: int
+
+
+
+
+def _load_settings() -> Optional[Settings]:
+    row = model.db.session.query(model.GlobalSettings.deployment_fingerprint,
+                                 model.GlobalSettings.default_currency_id).first()
+    if row is None:
+        return None
+
+    return Settings(deployment_fingerprint=row.deployment_fingerprint,
+                    default_currency_id=row.default_currency_id)
+
+
+def settings() -> Optional[Settings]:
+    """Return the cached Settings, loading them on first use or after invalidation. None before the row is created."""
+
+    return _settings_cache.get("settings", _load_settings)
+
+
+def warm() -> Optional[Settings]:
+    """Load the settings now (e.g. at startup) rather than on the first request that needs them."""
+
+    return settings()
+
+
+def invalidate():
+    """Drop this process's copy. Other processes are told through notify_changed()."""
+
+    _settings_cache.invalidate()
+
+
+
+
+# ACCESSORS
+
+
+
+
+def deployment_fingerprint() -> Optional[str]:
+    """The deployment's fingerprint, or None before the settings row is created."""
+
+    current = settings()
+    return current.deployment_fingerprint if current else None
+
+
+def default_currency_id() -> Optional[int]:
+    """The id of the currency values are shown in by default, or None before the settings row is created."""
+
+    current = settings()
+    return current.default_currency_id if current else None
+
+
+def default_currency() -> Optional[reference_data.CurrencyRecord]:
+    """The currency values are shown in by default, or None before the settings row is created."""
+
+    current = settings()
+    return reference_data.currency(current.default_currency_id) if current else None
+
+
+
+
+# CROSS-PROCESS INVALIDATION
+
+
+
+
+def notify_changed():
+    """Call in the transaction that writes global_settings. Every listening process drops its copy once it commits."""
+
+    invalidate()
+
+    # NOTIFY is transactional: nothing is sent if the change is rolled back, and our own listener hears it too, which
+    # also clears anything another thread of this process reloaded before the commit
+    if model.db.engine.dialect.name == "postgresql":
+        model.db.session.execute(text("SELECT pg_notify(:channel, '');"), {"channel": SETTINGS_CHANNEL})
+
+
+def _listen(engine):
+    """Invalidate whenever SETTINGS_CHANNEL is notified. Runs forever, reconnecting after errors."""
+
+    while True:
+        connection = None
+        try:
+            # Detached from the pool so it doesn't hold one of the request connections
+            connection = engine.raw_connection()
+            connection.detach()
+            dbapi_connection = connection.connection
+            dbapi_connection.autocommit = True
+            dbapi_connection.cursor().execute(f"LISTEN {SETTINGS_CHANNEL};")
+
+            # Anything may have changed while nobody was listening
+            invalidate()
+
+            while True:
+                readable, _, _ = select.select([dbapi_connection], [], [], SETTINGS_LISTEN_POLL_SECONDS)
+                if not readable:
+                    continue
+
+                dbapi_connection.poll()
+                if dbapi_connection.notifies:
+                    dbapi_connection.notifies.clear()
+                    invalidate()
+
+        except Exception:
+            logger.exception(f"Listening on {SETTINGS_CHANNEL} failed, retrying in {SETTINGS_LISTEN_RETRY_SECONDS}s")
+            invalidate()
+
+        finally:
+            if connection is not None:
+                connection.close()
+
+        time.sleep(SETTINGS_LISTEN_RETRY_SECONDS)
+
+
+def start_listener(engine) -> bool:
+    """Start this process's listener thread, once. Call after forking (e.g. before the first request), not at import.
+
+    Returns False without starting anything on databases other than PostgreSQL, where only the TTL applies.
+    """
+
+    global _listener
+
+    if engine.dialect.name != "postgresql":
+        return False
+
+    with _listener_lock:
+        if _listener is None or not _listener.is_alive():
+            _listener = threading.Thread(target=_listen, args=(engine,), name="settings-listener", daemon=True)
+            _listener.start()
+
+    return True
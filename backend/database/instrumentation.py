@@ -0,0 +1,206 @@
+"""Per-request SQL instrumentation: statement counts, DB time and repeated statement shapes (N+1 signatures).
+
+Every cursor execution on any engine is timed and handed to the collectors active on the current thread. A request
+gets its own collector through init_app(), and count_queries() opens one anywhere else, e.g. in a test:
+
+    with instrumentation.count_queries() as stats:
+        client.get('/api/assets')
+    assert stats.count <= 3
+
+Routes can declare a budget with @query_budget(n). Over budget, a warning is logged, or with QUERY_BUDGET_STRICT set
+(e.g. under TESTING) QueryBudgetExceeded is raised so the test fails.
+"""
+import logging
+import re
+import threading
+import time
+
+from collections import Counter, deque
+from contextlib import contextmanager
+from typing import Dict, List
+from flask import Flask, g, request
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+
+# A statement shape run this many times in one request is reported as a likely N+1
+N_PLUS_ONE_THRESHOLD = 5
+
+# Requests kept for /debug/queries
+RECENT_REQUESTS_KEPT = 50
+
+logger = logging.getLogger(__name__)
+
+_local = threading.local()
+_recent_requests = deque(maxlen=RECENT_REQUESTS_KEPT)
+
+_PARAMETER_PATTERN = re.compile(r"%\(\w+\)s|%s|\?|:\w+|\$\d+")
+_LITERAL_PATTERN = re.compile(r"'(?:[^']|'')*'|\b\d+(?:\.\d+)?\b")
+_LIST_PATTERN = re.compile(r"\(\s*\?(?:\s*,\s*\?)+\s*\)")
+_WHITESPACE_PATTERN = re.compile(r"\s+")
+
+
+
+
+class QueryBudgetExceeded(AssertionError):
+    pass
+
+
+class QueryStats:
+    """The statements run while a collector was active."""
+
+    def __init__(self):
+        self.count = 0
+        self.total_seconds = 0.0
+        self.shapes = Counter()
+
+
+    def record(self, statement: str, seconds: float):
+        self.count += 1
+        self.total_seconds += seconds
+        self.shapes[statement_shape(statement)] += 1
+
+
+    def repeated_shapes(self, threshold: int = N_PLUS_ONE_THRESHOLD) -> Dict[str, int]:
+        """{shape: times run} for the shapes run at least threshold times, most repeated first."""
+
+        return {shape: times for shape, times in self.shapes.most_common() if times >= threshold}
+
+
+    def to_dict(self) -> dict:
+        return {'count': self.count,
+                'total_ms': round(self.total_seconds * 1000, 3),
+                'repeated_shapes': self.repeated_shapes()}
+
+
+
+
+def statement_shape(statement: str) -> str:
+    """Reduce a statement to its shape: parameters and literals become ?, and IN lists of any length look the same."""
+
+    shape = _PARAMETER_PATTERN.sub("?", statement)
+    shape = _LITERAL_PATTERN.sub("?", shape)
+    shape = _LIST_PATTERN.sub("(?...)", shape)
+    return _WHITESPACE_PATTERN.sub(" ", shape).strip()
+
+
+def _collectors() -> List[QueryStats]:
+    collectors = getattr(_local, 'collectors', None)
+    if collectors is None:
+        collectors = _local.collectors = []
+    return collectors
+
+
+@event.listens_for(Engine, 'before_cursor_execute')
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault('query_start_times', []).append(time.perf_counter())
+
+
+@event.listens_for(Engine, 'after_cursor_execute')
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    started_at = conn.info['query_start_times'].pop()
+    collectors = _collectors()
+    if not collectors:
+        return
+
+    seconds = time.perf_counter() - started_at
+    for stats in collectors:
+        stats.record(statement, seconds)
+
+
+@event.listens_for(Engine, 'handle_error')
+def _handle_error(exception_context):
+    # A failed statement never reaches after_cursor_execute, so drop its start time here or later timings pair up wrong
+    conn = exception_context.connection
+    if conn is not None and conn.info.get('query_start_times'):
+        conn.info['query_start_times'].pop()
+
+
+@contextmanager
+def count_queries():
+    """Collect the statements run on this thread inside the block."""
+
+    stats = QueryStats()
+    _collectors().append(stats)
+    try:
+        yield stats
+    finally:
+        _collectors().remove(stats)
+
+
+
+
+# FLASK
+
+
+
+
+def query_budget(max_queries: int):
+    """Decorator declaring the most statements a view may run per request."""
+
+    def decorator(view):
+        view.query_budget = max_queries
+        return view
+
+    return decorator
+
+
+def recent_requests() -> List[dict]:
+    """Summaries of the last RECENT_REQUESTS_KEPT requests, newest first."""
+
+    return list(reversed(_recent_requests))
+
+
+def init_app(app: Flask):
+    """Collect stats for every request, report them in X-Query-* response headers and enforce @query_budget.
+
+    Config: QUERY_INSTRUMENTATION (default True), QUERY_BUDGET_STRICT (default: app.testing).
+    """
+
+    if not app.config.setdefault('QUERY_INSTRUMENTATION', True):
+        return
+
+    @app.before_request
+    def _start_query_stats():
+        g.query_stats = QueryStats()
+        _collectors().append(g.query_stats)
+
+
+    @app.after_request
+    def _finish_query_stats(response):
+        stats = g.pop('query_stats', None)
+        if stats is None:
+            return response
+        _collectors().remove(stats)
+
+        response.headers['X-Query-Count'] = str(stats.count)
+        response.headers['X-Query-Time-Ms'] = f"{stats.total_seconds * 1000:.3f}"
+        repeated = stats.repeated_shapes()
+        if repeated:
+            response.headers['X-Query-Repeated-Shapes'] = str(len(repeated))
+
+        view = app.view_functions.get(request.endpoint)
+        budget = getattr(view, 'query_budget', None)
+
+        _recent_requests.append(dict(stats.to_dict(),
+                                     method=request.method,
+                                     path=request.full_path,
+                                     endpoint=request.endpoint,
+                                     status=response.status_code,
+                                     budget=budget))
+
+        if budget is not None and stats.count > budget:
+            message = f"{request.endpoint} ran {stats.count} queries, over its budget of {budget}"
+            if app.config.get('QUERY_BUDGET_STRICT', app.testing):
+                raise QueryBudgetExceeded(message)
+            logger.warning(message)
+
+        return response
+
+
+    @app.teardown_request
+    def _drop_query_stats(exception):
+        # after_request doesn't run when a view raises, so make sure the collector is gone
+        stats = g.pop('query_stats', None)
+        if stats is not None and stats in _collectors():
+            _collectors().remove(stats)
@@ -0,0 +1,148 @@
+"""Kits: assets grouped under a root through parent_asset_id, loaded a whole subtree per query and cached in-process."""
+
+from typing import Dict, FrozenSet, Iterable, List, NamedTuple, Optional
+from sqlalchemy import text
+
+from database import model
+from database import cache
+
+
+# Kits are reloaded after this long even without an invalidation, to pick up other processes' writes
+KIT_CACHE_TTL_SECONDS = 120
+
+_kit_cache = cache.ProcessCache(ttl_seconds=KIT_CACHE_TTL_SECONDS)
+
+# Condition on assets AS a, checked per row so each step of the walk stays on the parent_asset_id index
+_NOT_ARCHIVED = """NOT EXISTS (SELECT 1 FROM audit_states AS s
+                           WHERE s.auditable_entity_type = 'ASSET'
+                             AND s.related_entity_id = a.id
+                             AND s.related_composite_id = 0
+                             AND s.is_archived)"""
+
+
+
+
+class Kit(NamedTuple):
+    """One kit, rooted at root_id. Shared between requests, treat it as read-only."""
+
+    root_id: int
+    nested: dict                        # The root node. Each node has id, model_name, is_kit_root, is_attachment and children
+    nodes: Dict[int, dict]              # {asset_id: node}
+    member_ids: FrozenSet[int]          # Every live asset in the kit, the root included
+
+
+
+
+def _load_kits(root_ids: List[int]) -> Dict[int, Optional[Kit]]:
+    """Walk every requested kit down from its root in one recursive query. Archived assets are left out with their subtrees.
+
+    Ordering by path puts every parent before its children. Roots that don't exist (or are archived) map to None.
+    """
+
+    rows = model.db.session.execute(text(f"""
+        WITH RECURSIVE kit AS (
+            SELECT a.id AS root_id, a.id, a.parent_asset_id, a.model_name, a.is_kit_root, a.is_attachment, ARRAY[a.id] AS path
+            FROM assets AS a
+            WHERE a.id = ANY(:root_ids)
+              AND {_NOT_ARCHIVED}
+            UNION ALL
+            SELECT k.root_id, a.id, a.parent_asset_id, a.model_name, a.is_kit_root, a.is_attachment, k.path || a.id
+            FROM assets AS a
+            JOIN kit AS k ON a.parent_asset_id = k.id
+            WHERE NOT a.id = ANY(k.path)
+              AND {_NOT_ARCHIVED}
+        )
+        SELECT root_id, id, parent_asset_id, model_name, is_kit_root, is_attachment
+        FROM kit
+        ORDER BY root_id, path;
+    """), {"root_ids": root_ids}).all()
+
+    nodes_by_root = {root_id: {} for root_id in root_ids}
+    for row in rows:
+        node = {'id': row.id,
+                'model_name': row.model_name,
+                'is_kit_root': row.is_kit_root,
+                'is_attachment': row.is_attachment,
+                'children': []}
+
+        nodes = nodes_by_root[row.root_id]
+        nodes[row.id] = node
+        if row.id != row.root_id:
+            nodes[row.parent_asset_id]['children'].append(node)
+
+    return {root_id: Kit(root_id=root_id,
+                         nested=nodes[root_id],
+                         nodes=nodes,
+                         member_ids=frozenset(nodes)) if nodes else None
+            for root_id, nodes in nodes_by_root.items()}
+
+
+def kit_root_ids(asset_ids: Iterable[int]) -> Dict[int, int]:
+    """{asset_id: id at the top of its parent_asset_id chain} in one recursive query.
+
+    The walk stops below the first archived ancestor, so an asset under an archived one is rooted at the last live
+    asset, matching the kits _load_kits builds. Unknown and archived ids are left out.
+    """
+
+    asset_ids = list(dict.fromkeys(asset_ids))
+    if not asset_ids:
+        return {}
+
+    rows = model.db.session.execute(text(f"""
+        WITH RECURSIVE chain AS (
+            SELECT a.id AS asset_id, a.id, a.parent_asset_id, ARRAY[a.id] AS path
+            FROM assets AS a
+            WHERE a.id = ANY(:asset_ids)
+              AND {_NOT_ARCHIVED}
+            UNION ALL
+            SELECT c.asset_id, a.id, a.parent_asset_id, c.path || a.id
+            FROM assets AS a
+            JOIN chain AS c ON a.id = c.parent_asset_id
+            WHERE NOT a.id = ANY(c.path)
+              AND {_NOT_ARCHIVED}
+        )
+        SELECT DISTINCT ON (asset_id) asset_id, id
+        FROM chain
+        ORDER BY asset_id, array_length(path, 1) DESC;
+    """), {"asset_ids": asset_ids}).all()
+
+    return {asset_id: root_id for asset_id, root_id in rows}
+
+
+
+
+def kits(root_ids: Iterable[int]) -> Dict[int, Optional[Kit]]:
+    """{root_id: Kit} for many kits, loading every uncached one in a single query."""
+
+    return _kit_cache.get_many(list(dict.fromkeys(root_ids)), _load_kits)
+
+
+def kit(root_id: int) -> Optional[Kit]:
+    """The kit rooted at root_id, or None if there is no such live asset."""
+
+    return kits([root_id])[root_id]
+
+
+def kit_for_asset(asset_id: int) -> Optional[Kit]:
+    """The whole kit an asset belongs to, found from any of its members."""
+
+    root_id = kit_root_ids([asset_id]).get(asset_id)
+    return kit(root_id) if root_id is not None else None
+
+
+def member_ids(root_id: int) -> FrozenSet[int]:
+    """Ids of every live asset in the kit, e.g. to reserve or check availability for all of them at once."""
+
+    loaded = kit(root_id)
+    return loaded.member_ids if loaded else frozenset()
+
+
+def invalidate(root_ids: Optional[Iterable[int]] = None):
+    """Drop the given kits, or every cached kit when root_ids is None. Call when assets join, leave or are archived."""
+
+    if root_ids is None:
+        _kit_cache.invalidate()
+        return
+
+    for root_id in root_ids:
+        _kit_cache.invalidate(root_id)
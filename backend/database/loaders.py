@@ -0,0 +1,159 @@
+"""Per-request batching loaders for by_id lookups.
+
+A Loader collects the ids asked of it and fetches every outstanding one with a single IN (...) query the first time
+any of them is actually needed. What it has loaded (including ids that don't exist) is kept for the rest of the
+request, so repeating a lookup runs no query at all:
+
+    primary = loaders.defer(model.Color, theme.primary_color_id)        # nothing runs yet
+    secondary = loaders.defer(model.Color, theme.secondary_color_id)
+    primary()                                                            # one query for both colors
+    secondary()                                                          # no query
+    loaders.load(model.Color, theme.primary_color_id)                    # no query
+
+Loaders live in the request memo (flask.g), and are dropped whenever the session flushes or commits, and by writers
+that go through Core statements instead (archive.entity, bulk), so a row created, changed or archived during the
+request is never answered from a stale entry. Outside a request every call gets a fresh loader, so nothing is cached.
+"""
+from typing import Any, Callable, Dict, Hashable, Iterable, List, Optional
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+from database import model
+from database import cache
+
+
+# Ids per IN (...) query
+LOADER_CHUNK_SIZE = 1000
+
+
+
+
+class Loader:
+    """Batches lookups for one kind of row. fetch(ids) returns the rows found, key(row) gives each row's id."""
+
+    def __init__(self, fetch: Callable[[List[Hashable]], Iterable[Any]], key: Callable[[Any], Hashable] = lambda row: row.id):
+        self._fetch = fetch
+        self._key = key
+        self._loaded: Dict[Hashable, Any] = {}
+        self._queued: List[Hashable] = []
+
+
+    def defer(self, id: Hashable) -> Callable[[], Optional[Any]]:
+        """Queue an id and return a function that loads it, along with everything else queued, when first called."""
+
+        if id not in self._loaded:
+            self._queued.append(id)
+
+        def resolve():
+            if id not in self._loaded:
+                self.dispatch()
+            return self._loaded.get(id)
+
+        return resolve
+
+
+    def load(self, id: Hashable) -> Optional[Any]:
+        """The row with this id, or None if it doesn't exist."""
+
+        return self.defer(id)()
+
+
+    def load_many(self, ids: Iterable[Hashable]) -> Dict[Hashable, Optional[Any]]:
+        """{id: row or None} for every id, with one query for all the ones not loaded yet."""
+
+        ids = list(ids)
+        for id in ids:
+            if id not in self._loaded:
+                self._queued.append(id)
+        self.dispatch()
+
+        return {id: self._loaded.get(id) for id in ids}
+
+
+    def dispatch(self):
+        """Fetch every queued id that isn't loaded yet."""
+
+        missing = list(dict.fromkeys(id for id in self._queued if id not in self._loaded))
+        self._queued = []
+
+        for start in range(0, len(missing), LOADER_CHUNK_SIZE):
+            chunk = missing[start:start + LOADER_CHUNK_SIZE]
+            for row in self._fetch(chunk):
+                self._loaded[self._key(row)] = row
+            # Remember misses too, so asking again is free
+            for id in chunk:
+                self._loaded.setdefault(id, None)
+
+
+    def prime(self, row: Any):
+        """Store a row loaded some other way."""
+
+        self._loaded[self._key(row)] = row
+
+
+    def clear(self, id: Optional[Hashable] = None):
+        """Forget one id, or everything when id is None, e.g. after changing it."""
+
+        if id is None:
+            self._loaded.clear()
+        else:
+            self._loaded.pop(id, None)
+
+
+
+
+def loader(name: str, fetch: Callable[[List[Hashable]], Iterable[Any]], key: Callable[[Any], Hashable] = lambda row: row.id) -> Loader:
+    """The current request's loader called name, created with fetch and key the first time it is asked for."""
+
+    memo = cache.request_memo("loaders")
+    if memo is None:
+        return Loader(fetch, key)
+
+    if name not in memo:
+        memo[name] = Loader(fetch, key)
+    return memo[name]
+
+
+def entity_loader(entity: type) -> Loader:
+    """The current request's loader for an entity with an integer id primary key."""
+
+    def fetch(ids: List[int]):
+        return model.db.session.query(entity).filter(entity.id.in_(ids)).all()
+
+    return loader(entity.__name__, fetch)
+
+
+def load(entity: type, id: int) -> Optional[Any]:
+    """The entity with this id, or None."""
+
+    return entity_loader(entity).load(id)
+
+
+def defer(entity: type, id: int) -> Callable[[], Optional[Any]]:
+    """Queue an entity id, see Loader.defer."""
+
+    return entity_loader(entity).defer(id)
+
+
+def load_many(entity: type, ids: Iterable[int]) -> Dict[int, Optional[Any]]:
+    """{id: entity or None} for every id, with one query for the ones not loaded in this request yet."""
+
+    return entity_loader(entity).load_many(ids)
+
+
+def clear():
+    """Drop every loader of the current request. Call after writes that bypass the ORM flush, e.g. Core statements."""
+
+    memo = cache.request_memo("loaders")
+    if memo:
+        memo.clear()
+
+
+@event.listens_for(Session, 'after_flush')
+def _drop_loaders_after_writes(session, flush_context):
+    clear()
+
+
+@event.listens_for(Session, 'after_commit')
+def _drop_loaders_after_commit(session):
+    clear()
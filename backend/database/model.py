@@ -3,8 +3,8 @@
 from flask_sqlalchemy import SQLAlchemy
 from datetime import datetime
 from enum import Enum as PyEnum
-from sqlalchemy import String, Integer, Boolean, Column, ForeignKey, SmallInteger, DateTime, Index
-from sqlalchemy.dialects.postgresql import ENUM
+from sqlalchemy import String, Integer, Boolean, Column, ForeignKey, SmallInteger, DateTime, Index, DDL, event, Computed, func, text
+from sqlalchemy.dialects.postgresql import ENUM, TSRANGE, TSVECTOR, JSONB, ExcludeConstraint
 from sqlalchemy.ext.declarative import declarative_base
 
 
@@ -585,7 +585,9 @@ CLASS_TO_ENUM_MAP = {
 class AuditableBase(db.Model):
     __abstract__ = True  # Make sure SQLAlchemy knows this is an abstract base class
 
-
+    # Columns that identify this entity in audit_entries / audit_states as (related_entity_id, related_composite_id).
+    # Join tables with a composite primary key override this.
+    __audit_key__ = ('id', None)
 
 
     def get_audit_type(self):
@@ -614,7 +616,7 @@ class GlobalSettings(AuditableBase):
     
 
 class AuditEntry(db.Model):
-    """Audit info for changes."""
+    """Audit info for changes. Range partitioned by month on created_at (see database/audit_partitions.py)."""
 
     __tablename__ = "audit_entries"
 
@@ -626,7 +628,8 @@ class AuditEntry(db.Model):
     related_composite_id = db.Column(db.Integer, nullable=True)
     details = db.Column(db.Text, nullable=True)
     created_by = db.Column(db.Integer, ForeignKey('users.id'), nullable=False)
-    created_at = db.Column(db.DateTime, nullable=False)
+    # Part of the primary key because PostgreSQL requires the partition key in it
+    created_at = db.Column(db.DateTime, primary_key=True, nullable=False)
     last_edited_by = db.Column(db.Integer, ForeignKey('users.id'), nullable=True)
     last_edited_at = db.Column(db.DateTime, nullable=False)
     is_archived = db.Column(db.Boolean, nullable=False, default=False)
@@ -635,15 +638,16 @@ class AuditEntry(db.Model):
     creator = db.relationship('User', foreign_keys=[created_by])
     edited_by_user = db.relationship('User', foreign_keys=[last_edited_by])
 
+    # Archived state is read from audit_states, and the entity type alone is a prefix of the type/id index, so neither
+    # gets an index of its own. Every index is repeated in every monthly partition.
     __table_args__ = (
-        Index('idx_audit_entries_related_entity_type', 'auditable_entity_type'),
         Index('idx_audit_entries_related_entity_id', 'related_entity_id'),
         Index('idx_audit_entries_related_entity_hash', 'related_entity_hash'),
         Index('idx_audit_entries_related_composite_id', 'related_composite_id'),
-        Index('idx_audit_entries_related_entity_type_id', 'auditable_entity_type', 'related_entity_id'),
+        Index('idx_audit_entries_related_entity_type_id_created_at', 'auditable_entity_type', 'related_entity_id', 'created_at'),
         Index('idx_audit_entries_related_entity_type_composite_id', 'auditable_entity_type', 'related_composite_id'),
         Index('idx_audit_entries_created_by', 'created_by'),
-        Index('idx_audit_entries_is_archived', 'is_archived')
+        {'postgresql_partition_by': 'RANGE (created_at)'}
     )
 
     def __repr__(self):
@@ -651,6 +655,38 @@ class AuditEntry(db.Model):
 
 
 
+# Catches rows outside every monthly partition, audit_partitions.ensure_partitions() moves them out again
+event.listen(AuditEntry.__table__,
+             'after_create',
+             DDL('CREATE TABLE IF NOT EXISTS audit_entries_default PARTITION OF audit_entries DEFAULT;').execute_if(dialect='postgresql'))
+
+
+
+class AuditState(db.Model):
+    """Latest audit state for an entity. One row per entity, kept in sync with audit_entries."""
+
+    __tablename__ = "audit_states"
+
+    auditable_entity_type = db.Column(auditable_entity_types_enum, primary_key=True, nullable=False)
+    related_entity_id = db.Column(db.Integer, primary_key=True, nullable=False)
+    related_composite_id = db.Column(db.Integer, primary_key=True, nullable=False, default=0)  # 0 when the entity has no composite key
+    last_operation_type = db.Column(operation_type_enum, nullable=False)
+    last_edited_by = db.Column(db.Integer, ForeignKey('users.id'), nullable=True)
+    last_edited_at = db.Column(db.DateTime, nullable=False)
+    is_archived = db.Column(db.Boolean, nullable=False, default=False)
+    archived_at = db.Column(db.DateTime, nullable=True)
+
+    edited_by_user = db.relationship('User', foreign_keys=[last_edited_by])
+
+    __table_args__ = (
+        Index('idx_audit_states_entity_type_is_archived', 'auditable_entity_type', 'is_archived'),
+    )
+
+    def __repr__(self):
+        return f'<AuditState auditable_entity_type={self.auditable_entity_type} related_entity_id={self.related_entity_id} is_archived={self.is_archived}>'
+
+
+
 class Reservation(AuditableBase):
     """Reservations."""
 
@@ -683,9 +719,12 @@ class ReservationAsset(AuditableBase):
     """Reservation Assets."""
 
     __tablename__ = "reservation_assets"
+    __audit_key__ = ('reservation_id', 'asset_id')
 
     reservation_id = db.Column(db.Integer, db.ForeignKey('reservations.id'), primary_key=True, nullable=False)
     asset_id = db.Column(db.Integer, db.ForeignKey('assets.id'), primary_key=True, nullable=False)
+    # Copy of the reservation's planned window as [checkout, checkin). NULL once released (archived) or if unscheduled.
+    reserved_during = db.Column(TSRANGE, nullable=True)
     
     reservation = db.relationship('Reservation', backref='asset_relationships')
     asset = db.relationship('Asset', backref='reservation_relationships')
@@ -694,11 +733,20 @@ class ReservationAsset(AuditableBase):
         Index('idx_reservation_assets_reservation_id', 'reservation_id'),
         Index('idx_reservation_assets_asset_id', 'asset_id'),
         Index('idx_reservation_assets_reservation_asset', 'reservation_id', 'asset_id'),
+        # No two reservations may hold the same asset over overlapping windows. The GiST index also serves overlap lookups.
+        ExcludeConstraint(('asset_id', '='), ('reserved_during', '&&'),
+                          name='excl_reservation_assets_asset_reserved_during',
+                          using='gist'),
     )
     
     def __repr__(self):
         return f"<ReservationAsset reservation_id={self.reservation_id} asset_id={self.asset_id}>"
 
+# The exclusion constraint compares an integer with '=' inside a GiST index, which needs btree_gist
+event.listen(ReservationAsset.__table__,
+             'before_create',
+             DDL('CREATE EXTENSION IF NOT EXISTS btree_gist;').execute_if(dialect='postgresql'))
+
 
 
 class AssetTag(AuditableBase):
@@ -717,6 +765,8 @@ class AssetTag(AuditableBase):
         Index('idx_asset_tags_asset_id', 'asset_id'),
         Index('idx_asset_tags_code_type', 'code_type'),
         Index('idx_asset_tags_asset_id_code_type', 'asset_id', 'code_type'),
+        # A payload identifies one tag. Hashed because data can be longer than a btree index entry allows.
+        Index('uq_asset_tags_code_type_data_md5', 'code_type', func.md5(data), unique=True),
     )
 
     def __repr__(self):
@@ -808,6 +858,23 @@ class Category(AuditableBase):
 
 
 
+class CategoryAssetCount(db.Model):
+    """Asset counts for a single category (not its subcategories), kept up to date as assets change."""
+
+    __tablename__ = "category_asset_counts"
+
+    category_id = db.Column(db.Integer, db.ForeignKey('categories.id'), primary_key=True, nullable=False)
+    asset_count = db.Column(db.Integer, nullable=False, default=0)       # Every asset, archived ones included
+    available_count = db.Column(db.Integer, nullable=False, default=0)   # Not archived and is_available
+    archived_count = db.Column(db.Integer, nullable=False, default=0)
+
+    category = db.relationship('Category', backref=db.backref('asset_counts', uselist=False))
+
+    def __repr__(self):
+        return f'<CategoryAssetCount category_id={self.category_id} asset_count={self.asset_count} available_count={self.available_count}>'
+
+
+
 class Color(AuditableBase):
     """Custom property / field to be added ale-cart to assets."""
 
@@ -846,6 +913,7 @@ class AssetCustomProperty(AuditableBase):
     """Join Table. Custom properties associated with assets."""
 
     __tablename__ = "asset_custom_properties"
+    __audit_key__ = ('asset_id', 'custom_property_id')
 
     asset_id = db.Column(db.Integer, db.ForeignKey('assets.id'), primary_key=True, nullable=False)
     custom_property_id = db.Column(db.Integer, db.ForeignKey('custom_properties.id'), primary_key=True, nullable=False)
@@ -865,6 +933,20 @@ class AssetCustomProperty(AuditableBase):
 
 
 
+# Weighted search document: names and numbers rank above manufacturer and category, which rank above the description
+ASSET_SEARCH_VECTOR_SQL = (
+    "setweight(to_tsvector('simple'::regconfig, coalesce(model_name, '') || ' ' || coalesce(model_number, '') || ' ' || coalesce(serial_number, '')), 'A') || "
+    "setweight(to_tsvector('simple'::regconfig, coalesce(search_context, '')), 'B') || "
+    "setweight(to_tsvector('simple'::regconfig, coalesce(description, '')), 'C')"
+)
+
+# The short fields, lowercased, for pg_trgm typo-tolerant matching
+ASSET_SEARCH_TEXT_SQL = (
+    "lower(coalesce(model_name, '') || ' ' || coalesce(model_number, '') || ' ' || coalesce(serial_number, '') || ' ' || coalesce(search_context, ''))"
+)
+
+
+
 class Asset(AuditableBase):
     """An asset."""
 
@@ -890,6 +972,13 @@ class Asset(AuditableBase):
     online_item_page = db.Column(db.String, nullable=True)
     warranty_starts = db.Column(db.DateTime, nullable=True)
     warranty_ends = db.Column(db.DateTime, nullable=True)
+    # {size label: {file_attachment_id, path, hash}} for the asset's stored image sizes (see database/asset_images.py)
+    image_variants = db.Column(JSONB, nullable=False, server_default=text("'{}'::jsonb"))
+    # Manufacturer and category names, copied in so the generated search columns can include them (see database/search.py)
+    search_context = db.Column(db.String(256), nullable=True)
+    # Generated by PostgreSQL and only used inside search queries, so they aren't loaded with the asset
+    search_vector = db.deferred(db.Column(TSVECTOR, Computed(ASSET_SEARCH_VECTOR_SQL, persisted=True)))
+    search_text = db.deferred(db.Column(db.Text, Computed(ASSET_SEARCH_TEXT_SQL, persisted=True)))
     
     manufacturer = db.relationship('Manufacturer', backref= 'assets')
     category = db.relationship('Category', backref= 'assets')
@@ -907,12 +996,15 @@ class Asset(AuditableBase):
     __table_args__ = (
         Index('idx_assets_manufacturer_id', 'manufacturer_id'),
         Index('idx_assets_category_id', 'category_id'),
+        Index('idx_assets_category_id_id', 'category_id', 'id'),  # Keyset pagination order
         Index('idx_assets_storage_area_id', 'storage_area_id'),
         Index('idx_assets_parent_asset_id', 'parent_asset_id'),
         Index('idx_assets_is_kit_root', 'is_kit_root'),
         Index('idx_assets_is_attachment', 'is_attachment'),
         Index('idx_assets_is_available', 'is_available'),
         Index('idx_assets_inventory_number', 'inventory_number'),
+        Index('idx_assets_search_vector', 'search_vector', postgresql_using='gin'),
+        Index('idx_assets_search_text_trgm', 'search_text', postgresql_using='gin', postgresql_ops={'search_text': 'gin_trgm_ops'}),
     )
 
     def to_dict(self):
@@ -937,13 +1029,19 @@ class Asset(AuditableBase):
             'is_available': self.is_available,
             'warranty_starts': self.warranty_starts.isoformat() if self.warranty_starts else None,
             'warranty_ends': self.warranty_ends.isoformat() if self.warranty_ends else None,
-            'small_image_path': self.small_image_path if hasattr(self, 'small_image_path') else None,
-            'large_image_path': self.large_image_path if hasattr(self, 'large_image_path') else None,
+            'image_variants': self.image_variants or {},
+            'small_image_path': (self.image_variants or {}).get(ImageSize.SMALL.value, {}).get('path'),
+            'large_image_path': (self.image_variants or {}).get(ImageSize.LARGE.value, {}).get('path'),
         }
     
     def __repr__(self):
         return f'<Asset id={self.id} model_name={self.model_name}>'
 
+# The trigram index's gin_trgm_ops operator class comes from pg_trgm
+event.listen(Asset.__table__,
+             'before_create',
+             DDL('CREATE EXTENSION IF NOT EXISTS pg_trgm;').execute_if(dialect='postgresql'))
+
 
 
 class Manufacturer(AuditableBase):
@@ -972,6 +1070,7 @@ class AssetFlag(AuditableBase):
     """Join Table. The connection between a flag and an asset."""
 
     __tablename__ = "asset_flags"
+    __audit_key__ = ('asset_id', 'flag_id')
 
     asset_id = db.Column(db.Integer, db.ForeignKey('assets.id'), primary_key=True, nullable=False)
     flag_id = db.Column(db.Integer, db.ForeignKey('flags.id'), primary_key=True, nullable=False)
@@ -1249,6 +1348,7 @@ class UserRole(AuditableBase):
     """Track when a user was assigned a specific role."""
 
     __tablename__ = "user_roles"
+    __audit_key__ = ('user_id', 'role_id')
 
     user_id = db.Column(db.Integer, db.ForeignKey('users.id'), primary_key=True, nullable=False)
     role_id = db.Column(db.Integer, db.ForeignKey('roles.id'), primary_key=True, nullable=False)
@@ -1300,6 +1400,7 @@ class RolePermission(AuditableBase):
     """Track when a role was granted a particular permission."""
 
     __tablename__ = "role_permissions"
+    __audit_key__ = ('role_id', 'permission_id')
 
     role_id = db.Column(db.Integer, db.ForeignKey('roles.id'), primary_key=True, nullable=False)
     permission_id = db.Column(db.Integer, db.ForeignKey('permissions.id'), primary_key=True, nullable=False)
@@ -1448,8 +1549,44 @@ class State(db.Model):
 
 
 
+# ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+# Cold storage for archived rows, moved out of the hot tables in batches (see database/archive.py).
+# Same columns as the hot table, minus the generated ones (recomputed on restore), and no foreign keys so rows can
+# move in any order. moved_at records when a row left the hot table.
+
+def _cold_table(hot_table, *indexed_columns):
+    name = f"{hot_table.name}_archive"
+    columns = [Column(column.name, column.type, primary_key=column.primary_key, nullable=column.nullable, autoincrement=False)
+               for column in hot_table.columns if column.computed is None]
+
+    return db.Table(name,
+                    *columns,
+                    Column('moved_at', DateTime, nullable=False),
+                    *(Index(f'idx_{name}_{column}', column) for column in indexed_columns))
+
+
+assets_archive = _cold_table(Asset.__table__, 'parent_asset_id')
+asset_tags_archive = _cold_table(AssetTag.__table__, 'asset_id')
+asset_flags_archive = _cold_table(AssetFlag.__table__)
+asset_custom_properties_archive = _cold_table(AssetCustomProperty.__table__)
+asset_location_logs_archive = _cold_table(AssetLocationLog.__table__, 'asset_id')
+reservations_archive = _cold_table(Reservation.__table__)
+reservation_assets_archive = _cold_table(ReservationAsset.__table__, 'asset_id')
+
+# Hot table name -> its cold table
+COLD_TABLES = {table.name[:-len('_archive')]: table for table in (assets_archive,
+                                                                  asset_tags_archive,
+                                                                  asset_flags_archive,
+                                                                  asset_custom_properties_archive,
+                                                                  asset_location_logs_archive,
+                                                                  reservations_archive,
+                                                                  reservation_assets_archive)}
+
+
+
+
 
-def connect_to_db(flask_app, db_uri="postgresql:///parm", echo=True):
+def connect_to_db(flask_app, db_uri="postgresql:///parm", echo=False):
     flask_app.config["SQLALCHEMY_DATABASE_URI"] = db_uri
     flask_app.config["SQLALCHEMY_ECHO"] = echo
     flask_app.config["SQLALCHEMY_TRACK_MODIFICATIONS"] = False
@@ -1463,8 +1600,8 @@ def connect_to_db(flask_app, db_uri="postgresql:///parm", echo=True):
 if __name__ == "__main__":
     from backend.server import app
 
-    # Call connect_to_db(app, echo=False) if your program output gets
-    # too annoying; this will tell SQLAlchemy not to print out every
-    # query it executes.
+    # Call connect_to_db(app, echo=True) to have SQLAlchemy print out every
+    # query it executes. Per-request counts and timings are in the
+    # X-Query-* response headers instead, see database/instrumentation.py.
 
     connect_to_db(app)
\ No newline at end of file
@@ -2,11 +2,11 @@
 
 from tools import utils
 
-from typing import Optional
-from sqlalchemy.orm import joinedload
+from typing import Optional, FrozenSet
 from enum import Enum
 
 from database import model
+from database import cache
 
 class PermissionsType(Enum):
     # Assets
@@ -72,25 +72,56 @@ class PermissionsType(Enum):
     CAN_DELETE_AUDITS = "can_delete_audits"
 
 
+# Effective permission sets are cached per user for this long, on top of explicit invalidation.
+PERMISSION_CACHE_TTL_SECONDS = 300
+
+_permission_cache = cache.ProcessCache(ttl_seconds=PERMISSION_CACHE_TTL_SECONDS)
+
+
+def _load_user_permissions(user_id: int) -> FrozenSet[str]:
+    # One flat query through the UserRole -> RolePermission -> Permission chain
+    permission_names = model.db.session.query(model.Permission.name).join(
+        model.RolePermission, model.RolePermission.permission_id == model.Permission.id
+    ).join(
+        model.UserRole, model.UserRole.role_id == model.RolePermission.role_id
+    ).filter(model.UserRole.user_id == user_id).distinct().all()
+
+    return frozenset(row.name for row in permission_names)
+
+
+def user_permissions(requesting_user_id: int) -> FrozenSet[str]:
+    """Return the names of every permission a user has through their roles."""
+
+    # Memoized for the request first, then process-wide
+    memo = cache.request_memo("user_permissions")
+    if memo is not None and requesting_user_id in memo:
+        return memo[requesting_user_id]
+
+    permissions = _permission_cache.get(requesting_user_id,
+                                        lambda: _load_user_permissions(requesting_user_id))
+
+    if memo is not None:
+        memo[requesting_user_id] = permissions
+
+    return permissions
+
+
+def invalidate_permissions(user_id: Optional[int] = None):
+    """Forget cached permission sets for one user, or for everyone when user_id is None."""
+
+    _permission_cache.invalidate(user_id)
+
+    memo = cache.request_memo("user_permissions")
+    if memo is not None:
+        if user_id is None:
+            memo.clear()
+        else:
+            memo.pop(user_id, None)
+
+
 def has_permission(requesting_user_id: int,
                    required_permission: PermissionsType) -> bool:
-    # Fetch the user and their roles
-    user = model.db.session.query(model.User).options(
-        joinedload(model.User.role_relationships)
-        .joinedload(model.UserRole.role)
-        .joinedload(model.Role.permission_relationships)
-        .joinedload(model.RolePermission.permission)
-    ).filter_by(id=requesting_user_id).first()
-
-    if not user:
-        return False
-
-    for user_role in user.role_relationships:
-        for role_permission in user_role.role.permission_relationships:
-            if role_permission.permission.name == PermissionsType(required_permission).value:
-                return True
-                
-    return False
+    return PermissionsType(required_permission).value in user_permissions(requesting_user_id)
 
 def has_ownership(requesting_user_id: int) -> bool:
 
@@ -0,0 +1,112 @@
+"""Named column sets for serializing assets without loading whole entities.
+
+A projection is a tuple of field names, always including id and category_id for the /api/assets keyset cursor.
+Applying one to a query swaps its entities for just those columns (joining manufacturers or categories only when
+a field needs them), so rows come back as plain tuples ready for JSON.
+"""
+from typing import Dict, List, Tuple
+
+from database import model
+
+
+# Every field a projection can ask for, and the column it is read from
+ASSET_FIELDS = {
+    'id': model.Asset.id,
+    'manufacturer_id': model.Asset.manufacturer_id,
+    'manufacturer_name': model.Manufacturer.name,
+    'model_number': model.Asset.model_number,
+    'model_name': model.Asset.model_name,
+    'category_id': model.Asset.category_id,
+    'category_name': model.Category.name,
+    'storage_area_id': model.Asset.storage_area_id,
+    'purchase_date': model.Asset.purchase_date,
+    'parent_asset_id': model.Asset.parent_asset_id,
+    'is_kit_root': model.Asset.is_kit_root,
+    'is_attachment': model.Asset.is_attachment,
+    'serial_number': model.Asset.serial_number,
+    'inventory_number': model.Asset.inventory_number,
+    'description': model.Asset.description,
+    'is_available': model.Asset.is_available,
+    'online_item_page': model.Asset.online_item_page,
+    'warranty_starts': model.Asset.warranty_starts,
+    'warranty_ends': model.Asset.warranty_ends,
+    'image_variants': model.Asset.image_variants,
+}
+
+# Serialized with isoformat(), as Asset.to_dict does
+DATETIME_FIELDS = frozenset(('purchase_date', 'warranty_starts', 'warranty_ends'))
+
+ASSET_PROJECTIONS = {
+    # What the asset grid renders, plus the (category_id, id) keyset cursor
+    'grid': ('id', 'model_name', 'manufacturer_name', 'category_id', 'is_available'),
+    # The info panel
+    'detail': ('id', 'manufacturer_id', 'manufacturer_name', 'model_number', 'model_name', 'category_id', 'category_name',
+               'storage_area_id', 'purchase_date', 'parent_asset_id', 'is_kit_root', 'is_attachment', 'serial_number',
+               'inventory_number', 'description', 'is_available', 'online_item_page', 'warranty_starts', 'warranty_ends',
+               'image_variants'),
+    # Spreadsheet exports
+    'export': ('id', 'manufacturer_name', 'model_name', 'model_number', 'serial_number', 'inventory_number',
+               'category_id', 'category_name', 'description', 'purchase_date', 'is_available'),
+}
+
+
+
+
+def asset_fields(projection: str) -> Tuple[str, ...]:
+    """The fields of a named projection. Raises ValueError for unknown names."""
+
+    try:
+        return ASSET_PROJECTIONS[projection]
+    except KeyError:
+        raise ValueError(f"Unknown projection: {projection}. Expected one of {', '.join(ASSET_PROJECTIONS)}")
+
+
+def apply_asset_projection(query, projection: str):
+    """Replace an Asset query's entities with the projection's columns, keeping its joins and filters."""
+
+    fields = asset_fields(projection)
+
+    if 'manufacturer_name' in fields:
+        query = query.outerjoin(model.Manufacturer, model.Manufacturer.id == model.Asset.manufacturer_id)
+    if 'category_name' in fields:
+        query = query.outerjoin(model.Category, model.Category.id == model.Asset.category_id)
+
+    return query.with_entities(*(ASSET_FIELDS[field].label(field) for field in fields))
+
+
+
+
+# SERIALIZATION
+
+
+
+
+def _datetime_positions(fields: Tuple[str, ...]) -> List[int]:
+    return [position for position, field in enumerate(fields) if field in DATETIME_FIELDS]
+
+
+def to_rows(rows: List[tuple], fields: Tuple[str, ...]) -> List[dict]:
+    """One dict per row, keyed by field."""
+
+    datetime_positions = _datetime_positions(fields)
+    serialized = []
+    for row in rows:
+        values = list(row[:len(fields)])
+        for position in datetime_positions:
+            if values[position] is not None:
+                values[position] = values[position].isoformat()
+        serialized.append(dict(zip(fields, values)))
+
+    return serialized
+
+
+def to_columns(rows: List[tuple], fields: Tuple[str, ...]) -> Dict[str, list]:
+    """One list per field, each with a value per row. Field names are sent once instead of once per row."""
+
+    columns = {field: [row[position] for row in rows] for position, field in enumerate(fields)}
+
+    for position in _datetime_positions(fields):
+        field = fields[position]
+        columns[field] = [value.isoformat() if value is not None else None for value in columns[field]]
+
+    return columns
@@ -1,23 +1,38 @@
 "Read methods for DB Entities"
 from database import model
 from database import crud
+from database import category_tree
+from database import category_counts
+from database import search
+from database import scan
+from database import kits
+from database import projections
+from database import audit_partitions
+from database import loaders
+from database import reference_data
+from database import deployment_settings
 
 from database.permissions import has_permission, PermissionsType
 from tools import utils
 
-from typing import Optional, List, Dict
-from sqlalchemy import desc
-from sqlalchemy.orm import joinedload, aliased, contains_eager
+from typing import Optional, List, Dict, Tuple, FrozenSet
+from sqlalchemy import desc, func, or_, tuple_
+from sqlalchemy.orm import joinedload, contains_eager
 
 
 class GlobalSettings:
 
     @staticmethod
-    def entry():
-        """Fetch and return the first entry from the global_settings table, or None if no entry exists."""
+    def entry() -> Optional[deployment_settings.Settings]:
+        """Return the deployment's settings, or None if no entry exists. Cached per process, see deployment_settings."""
         
-        global_settings = model.db.session.query(model.GlobalSettings).first()
-        return global_settings if global_settings else None
+        return deployment_settings.settings()
+
+    @staticmethod
+    def default_currency() -> Optional[reference_data.CurrencyRecord]:
+        """Return the default currency record, or None if no entry exists. No query once the cache is warm."""
+
+        return deployment_settings.default_currency()
 
 
 
@@ -57,9 +72,19 @@ class AuditEntry:
         """Fetch and return the most recent AuditEntry for a specific entity type and id, or None if no matching entry is found."""
         
         if has_permission(requesting_user_id, PermissionsType.CAN_VIEW_AUDITS.value):
-            most_recent_entry = model.db.session.query(model.AuditEntry).filter_by(auditable_entity_type=auditable_entity_type,
-                                                                                    related_entity_id=related_entity_id
-                                        ).order_by(desc(model.AuditEntry.created_at)).first()
+            query = model.db.session.query(model.AuditEntry).filter_by(auditable_entity_type=auditable_entity_type,
+                                                                        related_entity_id=related_entity_id)
+
+            # The AuditState already knows when the entity was last edited, so only that month's partition is searched
+            last_edited_at = model.db.session.query(func.max(model.AuditState.last_edited_at)) \
+                                             .filter_by(auditable_entity_type=auditable_entity_type,
+                                                        related_entity_id=related_entity_id) \
+                                             .scalar()
+            if last_edited_at is not None:
+                query = query.filter(model.AuditEntry.created_at >= audit_partitions.month_start(last_edited_at),
+                                     model.AuditEntry.created_at <= last_edited_at)
+
+            most_recent_entry = query.order_by(desc(model.AuditEntry.created_at)).first()
             
             return most_recent_entry if most_recent_entry else None
         
@@ -87,22 +112,28 @@ class Reservation:
     def by_id(requesting_user_id: int,
               reservation_id: int,
               include_archived: bool = False):
-        """Fetch and return a reservation by ID, or None if no match is found."""
+        """Fetch and return a reservation by ID, or None if no match is found. Batched and cached per request."""
 
-        query, latest_audit = crud.Utils.get_query_with_audit_join(model.Reservation,
-                                                                   model.AuditableEntityTypes.RESERVATION.value)
-        
-        query = query.options(joinedload('area'))
+        show_archived = include_archived and has_permission(requesting_user_id, PermissionsType.CAN_VIEW_ARCHIVED_RESERVATIONS.value)
+        return Reservation._loader(show_archived).load(reservation_id)
 
-        query = query.filter_by(id=reservation_id)
-        
-        if has_permission(requesting_user_id, PermissionsType.CAN_VIEW_ARCHIVED_RESERVATIONS.value):
-            if not include_archived:
+
+    @staticmethod
+    def _loader(show_archived: bool) -> loaders.Loader:
+        """The request's reservation loader, with or without archived reservations."""
+
+        def fetch(reservation_ids: List[int]):
+            query, latest_audit = crud.Utils.get_query_with_audit_join(model.Reservation,
+                                                                       model.AuditableEntityTypes.RESERVATION.value)
+            query = query.options(joinedload('area'))
+            query = query.filter(model.Reservation.id.in_(reservation_ids))
+
+            if not show_archived:
                 query = query.filter(latest_audit.is_archived == False)
-        else:
-            query = query.filter(latest_audit.is_archived == False)
 
-        return query.first()
+            return query.all()
+
+        return loaders.loader(f"Reservation:{'all' if show_archived else 'live'}", fetch)
 
 
     @staticmethod
@@ -115,22 +146,23 @@ class Reservation:
         if include_archived and just_archived:
             raise ValueError("Both flags cannot be True.")
 
-        query, latest_audit = crud.Utils.get_query_with_audit_join(model.Reservation,
-                                                                   model.AuditableEntityTypes.RESERVATION.value)
-        query = query.options(joinedload('area'))
-        query = query.filter(model.Reservation.id.in_(reservation_ids))
-        
-        if has_permission(requesting_user_id, PermissionsType.CAN_VIEW_ARCHIVED_RESERVATIONS.value):
-            if just_archived:
-                query = query.filter(latest_audit.is_archived == True)
-            elif not include_archived:
-                query = query.filter(latest_audit.is_archived == False)
-        else:
-            if just_archived:
+        can_view_archived = has_permission(requesting_user_id, PermissionsType.CAN_VIEW_ARCHIVED_RESERVATIONS.value)
+
+        if just_archived:
+            if not can_view_archived:
                 return None
-            query = query.filter(latest_audit.is_archived == False)
 
-        reservations = query.all()
+            query, latest_audit = crud.Utils.get_query_with_audit_join(model.Reservation,
+                                                                       model.AuditableEntityTypes.RESERVATION.value)
+            query = query.options(joinedload('area'))
+            query = query.filter(model.Reservation.id.in_(reservation_ids), latest_audit.is_archived == True)
+
+            reservations = query.all()
+            return reservations if reservations else None
+
+        # Shares the request's loader with by_id, so ids already loaded cost nothing
+        reservations = [reservation for reservation in Reservation._loader(include_archived and can_view_archived).load_many(reservation_ids).values()
+                        if reservation is not None]
         return reservations if reservations else None
     
 
@@ -278,7 +310,19 @@ class ReservationAsset:
 
 
 class AssetTag:
-    pass
+
+    @staticmethod
+    def resolve(code_type: model.AssetCodeType, data: str) -> Optional[scan.ScanResult]:
+        """Resolve a scanned payload to its tag, asset and kit root, or None if no live tag carries it."""
+
+        return scan.resolve(code_type, data)
+
+
+    @staticmethod
+    def resolve_many(scans: List[Tuple[model.AssetCodeType, str]]) -> List[Optional[scan.ScanResult]]:
+        """Resolve many (code_type, data) scans at once, in the order given."""
+
+        return scan.resolve_many(scans)
 
 
 
@@ -296,17 +340,17 @@ class Category:
     
     @staticmethod
     def by_id(category_id: int) -> Optional[object]:
-        """Fetch and return a Category by its ID, or None if no match is found."""
+        """Fetch and return a Category by its ID, or None if no match is found. Batched and cached per request."""
 
-        return model.db.session.query(model.Category).filter_by(id=category_id).first()
+        return loaders.load(model.Category, category_id)
 
 
     @staticmethod
     def by_ids(category_ids: List[int]) -> Optional[List[object]]:
         """Fetch and return a list of Categories by their IDs, or None if no match is found."""
 
-        query = model.db.session.query(model.Category).filter(model.Category.id.in_(category_ids)).all()
-        return query if query else None
+        categories = [category for category in loaders.load_many(model.Category, category_ids).values() if category is not None]
+        return categories if categories else None
 
 
     @staticmethod
@@ -333,68 +377,66 @@ class Category:
 
     @staticmethod
     def all_ordered() -> Optional[Dict[int, object]]:
-        """Fetch and return all entries from the Category table ordered by hierarchy, or None if the table is empty."""
-        
-        def transform_to_hierarchical(query_result):
-            tree = {}
-            lookup = {}
-            
-            for item in query_result:
-                id = item.id
-                node = item.to_dict()
-                node['children'] = []
-                lookup[id] = node
-                if item.parent_category_id is None:
-                    tree[id] = node
-                else:
-                    lookup[item.parent_category_id]['children'].append(node)
-            
-            return tree
+        """Return the categories as a nested {root_id: node} tree from the in-process cache, or None if there are none.
 
+        The tree is shared between requests, so don't modify it.
+        """
 
+        tree = category_tree.category_tree()
+        return tree.nested if tree.nested else None
 
-        query = model.db.session.query(model.Category).all()
 
-        if query:
-            return transform_to_hierarchical(query)
-        else:
-            return None
+    @staticmethod
+    def descendant_ids(category_id: int) -> FrozenSet[int]:
+        """Return the ids of a category and all of its subcategories, at any depth."""
+
+        return category_tree.descendant_ids(category_id)
+
+
+    @staticmethod
+    def asset_counts() -> Dict[int, dict]:
+        """Return {category_id: counts} with asset/available/archived counts for each category and for its whole subtree.
+
+        Counts are maintained as assets change (see category_counts), so this never aggregates over assets.
+        """
+
+        return category_counts.rolled_up_counts()
 
 
 
 class Color:
     
     @staticmethod
-    def by_id(color_id: int) -> Optional[object]:
-        """Fetch and return a Color by its ID, or None if no match is found."""
+    def by_id(color_id: int) -> Optional[reference_data.ColorRecord]:
+        """Return a Color record by its ID, or None if no match is found. Served from the reference data cache."""
 
-        return model.db.session.query(model.Color).filter_by(id=color_id).first()
+        return reference_data.color(color_id)
 
     @staticmethod
-    def by_ids(color_ids: List[int]) -> Optional[List[object]]:
-        """Fetch and return a list of Colors by their IDs, or None if no match is found."""
+    def by_ids(color_ids: List[int]) -> Optional[List[reference_data.ColorRecord]]:
+        """Return a list of Color records by their IDs, or None if no match is found."""
 
-        query = model.db.session.query(model.Color).filter(model.Color.id.in_(color_ids)).all()
-        return query if query else None
+        colors = reference_data.by_ids(reference_data.reference_data().colors, color_ids)
+        return colors if colors else None
 
     @staticmethod
-    def by_name(color_name: str) -> Optional[object]:
-        """Fetch and return a Color by its name, or None if no match is found."""
+    def by_name(color_name: str) -> Optional[reference_data.ColorRecord]:
+        """Return a Color record by its name, or None if no match is found."""
 
-        return model.db.session.query(model.Color).filter_by(name=color_name).first()
+        return reference_data.color_by_name(color_name)
 
     @staticmethod
-    def by_hex_value(hex_value: str) -> Optional[object]:
-        """Fetch and return a Color by its hex value, or None if no match is found."""
+    def by_hex_value(hex_value: str) -> Optional[reference_data.ColorRecord]:
+        """Return a Color record by its hex value, or None if no match is found."""
 
-        return model.db.session.query(model.Color).filter_by(hex_value=hex_value).first()
+        return reference_data.color_by_hex_value(hex_value)
 
     @staticmethod
-    def all() -> Optional[List[object]]:
-        """Fetch and return all entries from the Color table, or None if the table is empty."""
+    def all() -> Optional[List[reference_data.ColorRecord]]:
+        """Return every Color record, or None if the table is empty."""
 
-        query = model.db.session.query(model.Color).all()
-        return query if query else None
+        colors = list(reference_data.reference_data().colors.values())
+        return colors if colors else None
 
 
 
@@ -414,27 +456,35 @@ class Asset:
     def by_id(requesting_user_id: int,
               asset_id: int,
               include_archived: bool = False):
-        """Fetch and return an Asset by its ID, or None if no match is found."""
+        """Fetch and return an Asset by its ID, or None if no match is found. Batched and cached per request."""
 
-        query, latest_audit = crud.Utils.get_query_with_audit_join(model.Asset,
-                                                                   model.AuditableEntityTypes.ASSET.value)
-        
-        query = query.options(joinedload('manufacturer'),
-                              joinedload('category'),
-                              joinedload('storage_area'),
-                              joinedload('purchase_price_entry'),
-                              joinedload('msrp_entry'),
-                              joinedload('residual_value_entry'))
+        show_archived = include_archived and has_permission(requesting_user_id, PermissionsType.CAN_VIEW_ARCHIVED_ASSETS.value)
+        return Asset._loader(show_archived).load(asset_id)
 
-        query = query.filter(model.Asset.id == asset_id).order_by(latest_audit.created_at.desc()).first()
 
-        if has_permission(requesting_user_id, PermissionsType.CAN_VIEW_ARCHIVED_ASSETS.value):
-            if not include_archived:
+    @staticmethod
+    def _loader(show_archived: bool) -> loaders.Loader:
+        """The request's asset loader, with or without archived assets."""
+
+        def fetch(asset_ids: List[int]):
+            query, latest_audit = crud.Utils.get_query_with_audit_join(model.Asset,
+                                                                       model.AuditableEntityTypes.ASSET.value)
+
+            query = query.options(joinedload('manufacturer'),
+                                  joinedload('category'),
+                                  joinedload('storage_area'),
+                                  joinedload('purchase_price_entry'),
+                                  joinedload('msrp_entry'),
+                                  joinedload('residual_value_entry'))
+
+            query = query.filter(model.Asset.id.in_(asset_ids))
+
+            if not show_archived:
                 query = query.filter(latest_audit.is_archived == False)
-        else:
-            query = query.filter(latest_audit.is_archived == False)
 
-        return query
+            return query.all()
+
+        return loaders.loader(f"Asset:{'all' if show_archived else 'live'}", fetch)
 
 
     @staticmethod
@@ -447,29 +497,29 @@ class Asset:
         if include_archived and just_archived:
             raise ValueError("Both flags cannot be True.")
 
-        query, latest_audit = crud.Utils.get_query_with_audit_join(model.Asset, 
-                                                                   model.AuditableEntityTypes.ASSET.value)
-        
-        query = query.options(joinedload('manufacturer'),
-                              joinedload('category'),
-                              joinedload('storage_area'),
-                              joinedload('purchase_price_entry'),
-                              joinedload('msrp_entry'),
-                              joinedload('residual_value_entry'))
-
-        query = query.filter(model.Asset.id.in_(asset_ids)).distinct(model.Asset.id)
+        can_view_archived = has_permission(requesting_user_id, PermissionsType.CAN_VIEW_ARCHIVED_ASSETS.value)
 
-        if has_permission(requesting_user_id, PermissionsType.CAN_VIEW_ARCHIVED_ASSETS.value):
-            if just_archived:
-                query = query.filter(latest_audit.is_archived == True)
-            elif not include_archived:
-                query = query.filter(latest_audit.is_archived == False)
-        else:
-            if just_archived:
+        if just_archived:
+            if not can_view_archived:
                 return None
-            query = query.filter(latest_audit.is_archived == False)
 
-        assets = query.all()
+            query, latest_audit = crud.Utils.get_query_with_audit_join(model.Asset,
+                                                                       model.AuditableEntityTypes.ASSET.value)
+
+            query = query.options(joinedload('manufacturer'),
+                                  joinedload('category'),
+                                  joinedload('storage_area'),
+                                  joinedload('purchase_price_entry'),
+                                  joinedload('msrp_entry'),
+                                  joinedload('residual_value_entry'))
+
+            query = query.filter(model.Asset.id.in_(asset_ids), latest_audit.is_archived == True)
+
+            assets = query.all()
+            return assets if assets else None
+
+        # Shares the request's loader with by_id, so ids already loaded cost nothing
+        assets = [asset for asset in Asset._loader(include_archived and can_view_archived).load_many(asset_ids).values() if asset is not None]
         return assets if assets else None
 
 
@@ -477,7 +527,8 @@ class Asset:
     def by_category(requesting_user_id: int, 
                     category_ids: List[int], 
                     include_archived: bool = False, 
-                    just_archived: bool = False):
+                    just_archived: bool = False,
+                    include_subcategories: bool = False):
         """Fetch and return Assets by their category IDs, or None if no match is found."""
 
         if include_archived and just_archived:
@@ -492,6 +543,9 @@ class Asset:
                             joinedload('purchase_price_entry'),
                             joinedload('msrp_entry'),
                             joinedload('residual_value_entry'))
+
+        if include_subcategories:
+            category_ids = category_tree.expand_category_ids(category_ids)
         
         query = query.filter(model.Asset.category_id.in_(category_ids))
 
@@ -521,18 +575,13 @@ class Asset:
         query, latest_audit = crud.Utils.get_query_with_audit_join(model.Asset,
                                                                 model.AuditableEntityTypes.ASSET.value)
 
-        # Alias for joined loading
-        fa_alias = aliased(model.FileAttachment)
-
         query = query.options(
             joinedload('manufacturer'),
             joinedload('category'),
             joinedload('storage_area'),
             joinedload('purchase_price_entry'),
             joinedload('msrp_entry'),
-            joinedload('residual_value_entry'),
-            # Add joinedload for file_attachment_associations and file_attachment
-            joinedload('file_attachment_associations').joinedload('file_attachment')
+            joinedload('residual_value_entry')
         )
 
         if has_permission(requesting_user_id, PermissionsType.CAN_VIEW_ARCHIVED_ASSETS.value):
@@ -545,15 +594,132 @@ class Asset:
                 return None
             query = query.filter(latest_audit.is_archived == False)
 
+        # Image paths come from Asset.image_variants, no attachment rows are loaded
         assets = query.all()
 
-        # Additional step to filter the image paths for 'small' and 'medium'
-        for asset in assets:
-            asset.small_image_path = next((fa.file_attachment.file_path for fa in asset.file_attachment_associations if '2-small' in fa.file_attachment.file_path), None)
-            asset.large_image_path = next((fa.file_attachment.file_path for fa in asset.file_attachment_associations if '4-large' in fa.file_attachment.file_path), None)
-            print(f"Asset ID: {asset.id}, Small Image Path: {asset.small_image_path}, Large Image Path: {asset.large_image_path}")
-
         return assets if assets else None
+
+
+    @staticmethod
+    def page(requesting_user_id: int,
+             limit: int,
+             after: Optional[Tuple[Optional[int], int]] = None,
+             category_ids: Optional[List[int]] = None,
+             is_available: Optional[bool] = None,
+             manufacturer_ids: Optional[List[int]] = None,
+             include_archived: bool = False,
+             include_subcategories: bool = False,
+             projection: Optional[str] = None) -> List[object]:
+        """Fetch one page of Assets in (category_id, id) order, starting after the (category_id, id) cursor.
+
+        With a projection name from projections.ASSET_PROJECTIONS, only its columns are read and rows are returned instead of Assets.
+        """
+
+        query, latest_audit = crud.Utils.get_query_with_audit_join(model.Asset,
+                                                                   model.AuditableEntityTypes.ASSET.value)
+
+        if projection is None:
+            query = query.options(joinedload('manufacturer'))
+        else:
+            query = projections.apply_asset_projection(query, projection)
+
+        if not (include_archived and has_permission(requesting_user_id, PermissionsType.CAN_VIEW_ARCHIVED_ASSETS.value)):
+            query = query.filter(latest_audit.is_archived == False)
+
+        if category_ids:
+            if include_subcategories:
+                category_ids = category_tree.expand_category_ids(category_ids)
+            query = query.filter(model.Asset.category_id.in_(category_ids))
+
+        if is_available is not None:
+            query = query.filter(model.Asset.is_available == is_available)
+
+        if manufacturer_ids:
+            query = query.filter(model.Asset.manufacturer_id.in_(manufacturer_ids))
+
+        # Seek past the cursor. Uncategorized (NULL) assets sort last, matching PostgreSQL's default NULLS LAST.
+        if after is not None:
+            after_category_id, after_id = after
+
+            if after_category_id is None:
+                query = query.filter(model.Asset.category_id.is_(None), model.Asset.id > after_id)
+            else:
+                query = query.filter(or_(tuple_(model.Asset.category_id, model.Asset.id) > tuple_(after_category_id, after_id),
+                                         model.Asset.category_id.is_(None)))
+
+        return query.order_by(model.Asset.category_id, model.Asset.id).limit(limit).all()
+
+
+    @staticmethod
+    def image_variants(asset_id: int) -> Optional[dict]:
+        """Fetch just an Asset's image variant map, or None if the asset doesn't exist."""
+
+        return model.db.session.query(model.Asset.image_variants).filter(model.Asset.id == asset_id).scalar()
+
+
+    @staticmethod
+    def kit(asset_id: int) -> Optional[kits.Kit]:
+        """Fetch the whole kit the asset belongs to, from its root down, or None if the asset doesn't exist."""
+
+        return kits.kit_for_asset(asset_id)
+
+
+    @staticmethod
+    def kits(root_asset_ids: List[int]) -> Dict[int, Optional[kits.Kit]]:
+        """Fetch many kits by their root asset IDs at once."""
+
+        return kits.kits(root_asset_ids)
+
+
+    @staticmethod
+    def search(requesting_user_id: int,
+               query_text: str,
+               limit: int,
+               offset: int = 0,
+               category_ids: Optional[List[int]] = None,
+               is_available: Optional[bool] = None,
+               include_archived: bool = False,
+               include_subcategories: bool = False,
+               projection: Optional[str] = None) -> List[Tuple[object, float]]:
+        """Fetch one page of (Asset, rank) matching query_text, best match first. Returns [] for a query with no words.
+
+        With a projection name, (row, rank) pairs are returned instead, as in page().
+        """
+
+        if search.prefix_tsquery(query_text) is None:
+            return []
+
+        query, latest_audit = crud.Utils.get_query_with_audit_join(model.Asset,
+                                                                   model.AuditableEntityTypes.ASSET.value)
+
+        if projection is None:
+            query = query.options(joinedload('manufacturer'))
+        else:
+            query = projections.apply_asset_projection(query, projection)
+
+        rank = search.rank_expression(query_text).label('rank')
+        query = query.add_columns(rank)
+
+        query = query.filter(search.match_clause(query_text))
+
+        if not (include_archived and has_permission(requesting_user_id, PermissionsType.CAN_VIEW_ARCHIVED_ASSETS.value)):
+            query = query.filter(latest_audit.is_archived == False)
+
+        if category_ids:
+            if include_subcategories:
+                category_ids = category_tree.expand_category_ids(category_ids)
+            query = query.filter(model.Asset.category_id.in_(category_ids))
+
+        if is_available is not None:
+            query = query.filter(model.Asset.is_available == is_available)
+
+        # Ties are broken by id so that pages don't overlap
+        results = query.order_by(desc(rank), model.Asset.id).offset(offset).limit(limit).all()
+
+        if projection is None:
+            return [(asset, float(rank)) for asset, rank in results]
+
+        return [(tuple(row[:-1]), float(row[-1])) for row in results]
     
 
 
@@ -561,17 +727,17 @@ class Manufacturer:
 
     @staticmethod
     def by_id(manufacturer_id: int) -> Optional[object]:
-        """Fetch and return a Manufacturer by its ID, or None if no match is found."""
+        """Fetch and return a Manufacturer by its ID, or None if no match is found. Batched and cached per request."""
 
-        return model.db.session.query(model.Manufacturer).filter_by(id=manufacturer_id).first()
+        return loaders.load(model.Manufacturer, manufacturer_id)
 
 
     @staticmethod
     def by_ids(manufacturer_id: List[int]) -> Optional[List[object]]:
         """Fetch and return a list of Manufacturers by their IDs, or None if no match is found."""
 
-        query = model.db.session.query(model.Manufacturer).filter(model.Manufacturer.id.in_(manufacturer_id)).all()
-        return query if query else None
+        manufacturers = [manufacturer for manufacturer in loaders.load_many(model.Manufacturer, manufacturer_id).values() if manufacturer is not None]
+        return manufacturers if manufacturers else None
 
 
     @staticmethod
@@ -602,7 +768,38 @@ class Flag:
 
 
 class Currency:
-    pass
+
+    @staticmethod
+    def by_id(currency_id: int) -> Optional[reference_data.CurrencyRecord]:
+        """Return a Currency record by its ID, or None if no match is found. Served from the reference data cache."""
+
+        return reference_data.currency(currency_id)
+
+    @staticmethod
+    def by_ids(currency_ids: List[int]) -> Optional[List[reference_data.CurrencyRecord]]:
+        """Return a list of Currency records by their IDs, or None if no match is found."""
+
+        currencies = reference_data.by_ids(reference_data.reference_data().currencies, currency_ids)
+        return currencies if currencies else None
+
+    @staticmethod
+    def by_iso_code(iso_code: str) -> Optional[reference_data.CurrencyRecord]:
+        """Return a Currency record by its ISO code, or None if no match is found."""
+
+        return reference_data.currency_by_iso_code(iso_code)
+
+    @staticmethod
+    def symbol(currency_id: int) -> Optional[str]:
+        """Return a currency's symbol, or None if no match is found."""
+
+        return reference_data.currency_symbol(currency_id)
+
+    @staticmethod
+    def all() -> Optional[List[reference_data.CurrencyRecord]]:
+        """Return every Currency record, or None if the table is empty."""
+
+        currencies = list(reference_data.reference_data().currencies.values())
+        return currencies if currencies else None
 
 
 
@@ -610,14 +807,20 @@ class FinancialEntry:
     
     @staticmethod
     def by_id(entry_id: int) -> Optional[object]:
-        """Fetch and return a FinancialEntry by its ID, or None if no match is found."""
-        return model.db.session.query(model.FinancialEntry).filter_by(id=entry_id).first()
+        """Fetch and return a FinancialEntry by its ID, or None if no match is found. Batched and cached per request."""
+        return loaders.load(model.FinancialEntry, entry_id)
 
     @staticmethod
     def by_ids(entry_ids: List[int]) -> Optional[List[object]]:
         """Fetch and return a list of FinancialEntries by their IDs, or None if no match is found."""
-        query = model.db.session.query(model.FinancialEntry).filter(model.FinancialEntry.id.in_(entry_ids)).all()
-        return query if query else None
+        entries = [entry for entry in loaders.load_many(model.FinancialEntry, entry_ids).values() if entry is not None]
+        return entries if entries else None
+
+    @staticmethod
+    def serialized_by_ids(entry_ids: List[int]) -> List[dict]:
+        """Return FinancialEntries as dicts, skipping unknown IDs. Currencies come from the reference data cache."""
+        entries = loaders.load_many(model.FinancialEntry, entry_ids)
+        return [reference_data.financial_entry_dict(entry) for entry in entries.values() if entry is not None]
 
     @staticmethod
     def by_currency_id(currency_id: int) -> Optional[List[object]]:
@@ -644,7 +847,14 @@ class AssetLocationLog:
 
 
 class FileAttachment:
-    
+
+    @staticmethod
+    def by_id(file_attachment_id: int) -> Optional[object]:
+        """Fetch and return a FileAttachment by its ID, or None if no match is found."""
+
+        return model.db.session.query(model.FileAttachment).filter_by(id=file_attachment_id).first()
+
+
     @staticmethod
     def image_size_for_entity_id(entity_id: int, attachable_entity_type: model.AttachableEntityTypes, image_size: model.ImageSize) -> Optional[object]:
         """Fetch and return a FileAttachment by its entity ID, attachable entity type, and image size, or None if not found."""
@@ -720,26 +930,24 @@ class UiTheme:
     
     @staticmethod
     def by_id(entry_id: int) -> Optional[object]:
-        """Fetch and return a UiTheme by its ID, or None if no match is found."""
+        """Fetch and return a UiTheme by its ID, or None if no match is found. Batched and cached per request."""
 
-        return model.db.session.query(model.UiTheme).filter_by(id=entry_id).first()
+        return loaders.load(model.UiTheme, entry_id)
     
     @staticmethod
     def colors_by_id(entry_id: int) -> Optional[dict]:
         """Fetch the primary and secondary color IDs for a UiTheme by its ID."""
 
         theme = UiTheme.by_id(entry_id)
+        if not theme:
+            return None
 
-        theme_primary_object = Color.by_id(theme.primary_color_id)
-        theme_secondary_object = Color.by_id(theme.secondary_color_id)
-
-        theme_primary_hex = theme_primary_object.hex_value
-        theme_secondary_hex = theme_secondary_object.hex_value
+        # Colors come from the reference data cache, so this is only the theme lookup
+        primary = reference_data.color(theme.primary_color_id)
+        secondary = reference_data.color(theme.secondary_color_id)
 
-        if theme:
-            return {"primary_color_id": theme_primary_hex,
-                    "secondary_color_id": theme_secondary_hex}
-        return None
+        return {"primary_color_id": primary.hex_value if primary else None,
+                "secondary_color_id": secondary.hex_value if secondary else None}
 
 
 
@@ -819,14 +1027,87 @@ class Address:
 
 
 class Country:
-    pass
+
+    @staticmethod
+    def by_id(country_id: int) -> Optional[reference_data.CountryRecord]:
+        """Return a Country record by its ID, or None if no match is found. Served from the reference data cache."""
+
+        return reference_data.country(country_id)
+
+    @staticmethod
+    def by_code(code: str) -> Optional[reference_data.CountryRecord]:
+        """Return a Country record by its ISO code, or None if no match is found."""
+
+        return reference_data.country_by_code(code)
+
+    @staticmethod
+    def by_name(name: str) -> Optional[reference_data.CountryRecord]:
+        """Return a Country record by its name, or None if no match is found."""
+
+        return reference_data.country_by_name(name)
+
+    @staticmethod
+    def all() -> Optional[List[reference_data.CountryRecord]]:
+        """Return every Country record, or None if the table is empty."""
+
+        countries = list(reference_data.reference_data().countries.values())
+        return countries if countries else None
 
 
 
 class Timezone:
-    pass
+
+    @staticmethod
+    def by_id(timezone_id: int) -> Optional[reference_data.TimezoneRecord]:
+        """Return a Timezone record by its ID, or None if no match is found. Served from the reference data cache."""
+
+        return reference_data.timezone(timezone_id)
+
+    @staticmethod
+    def by_identifier(identifier: str) -> Optional[reference_data.TimezoneRecord]:
+        """Return a Timezone record by its identifier, or None if no match is found."""
+
+        return reference_data.timezone_by_identifier(identifier)
+
+    @staticmethod
+    def all() -> Optional[List[reference_data.TimezoneRecord]]:
+        """Return every Timezone record, or None if the table is empty."""
+
+        timezones = list(reference_data.reference_data().timezones.values())
+        return timezones if timezones else None
 
 
 
 class State:
-    pass
\ No newline at end of file
+
+    @staticmethod
+    def by_id(state_id: int) -> Optional[reference_data.StateRecord]:
+        """Return a State record by its ID, or None if no match is found. Served from the reference data cache."""
+
+        return reference_data.state(state_id)
+
+    @staticmethod
+    def by_code(code: str) -> Optional[reference_data.StateRecord]:
+        """Return a State record by its code, or None if no match is found."""
+
+        return reference_data.state_by_code(code)
+
+    @staticmethod
+    def by_name(name: str) -> Optional[reference_data.StateRecord]:
+        """Return a State record by its name, or None if no match is found."""
+
+        return reference_data.state_by_name(name)
+
+    @staticmethod
+    def by_country_id(country_id: int) -> Optional[List[reference_data.StateRecord]]:
+        """Return the State records of a country, or None if it has none."""
+
+        states = [state for state in reference_data.reference_data().states.values() if state.country_id == country_id]
+        return states if states else None
+
+    @staticmethod
+    def all() -> Optional[List[reference_data.StateRecord]]:
+        """Return every State record, or None if the table is empty."""
+
+        states = list(reference_data.reference_data().states.values())
+        return states if states else None
@@ -0,0 +1,281 @@
+"""Currencies, countries, timezones, states and colors, cached in-process as read-only records.
+
+These tables are seeded once and hardly ever change, so the whole set is loaded in five queries (at startup through
+warm(), or on first use) and every lookup after that is a dict access:
+
+    reference_data.currency_symbol(entry.currency_id)        # no query
+    reference_data.state_by_code('CA').name                   # no query
+
+Records are NamedTuples, not entities, so they can be shared between requests and threads safely. crud.create
+invalidates the cache whenever it writes one of these tables (and again when that transaction ends), and other
+processes pick changes up within REFERENCE_DATA_CACHE_TTL_SECONDS.
+"""
+from decimal import Decimal
+from typing import Dict, List, NamedTuple, Optional
+
+from database import model
+from database import cache
+
+
+# The records are reloaded after this long even without an invalidation, to pick up rows written by other processes
+REFERENCE_DATA_CACHE_TTL_SECONDS = 300
+
+_reference_data_cache = cache.ProcessCache(ttl_seconds=REFERENCE_DATA_CACHE_TTL_SECONDS)
+
+
+
+
+class CurrencyRecord(NamedTuple):
+    id: int
+    name: str
+    symbol: str
+    iso_code: str
+    exchange_rate: Decimal
+
+
+class CountryRecord(NamedTuple):
+    id: int
+    code: str
+    intl_phone_code: int
+    name: str
+
+
+class TimezoneRecord(NamedTuple):
+    id: int
+    identifier: str
+    abbreviation: str
+    utc_offset_minutes: int
+    has_dst: bool
+
+
+class StateRecord(NamedTuple):
+    id: int
+    code: str
+    name: str
+    timezone_id: int
+    country_id: int
+
+
+class ColorRecord(NamedTuple):
+    id: int
+    name: str
+    hex_value: str
+
+
+class ReferenceData(NamedTuple):
+    """Every record, indexed the ways they get looked up. Treat it as read-only, it is shared."""
+
+    currencies: Dict[int, CurrencyRecord]
+    currencies_by_iso_code: Dict[str, CurrencyRecord]
+    countries: Dict[int, CountryRecord]
+    countries_by_code: Dict[str, CountryRecord]
+    countries_by_name: Dict[str, CountryRecord]
+    timezones: Dict[int, TimezoneRecord]
+    timezones_by_identifier: Dict[str, TimezoneRecord]
+    states: Dict[int, StateRecord]
+    states_by_code: Dict[str, StateRecord]
+    states_by_name: Dict[str, StateRecord]
+    colors: Dict[int, ColorRecord]
+    colors_by_name: Dict[str, ColorRecord]
+    colors_by_hex_value: Dict[str, ColorRecord]
+
+
+
+
+def _records(record_type: type, entity: type) -> Dict[int, NamedTuple]:
+    """{id: record} for every row of entity, reading only the record's columns."""
+
+    columns = [getattr(entity, field) for field in record_type._fields]
+    rows = model.db.session.query(*columns).order_by(entity.id).all()
+    return {row.id: record_type(*row) for row in rows}
+
+
+def _index(records: Dict[int, NamedTuple], field: str) -> Dict[str, NamedTuple]:
+    """{field value: record}. When values repeat, the lowest id wins, as a first() query would return."""
+
+    index = {}
+    for record in records.values():
+        index.setdefault(getattr(record, field), record)
+    return index
+
+
+def _load_reference_data() -> ReferenceData:
+    currencies = _records(CurrencyRecord, model.Currency)
+    countries = _records(CountryRecord, model.Country)
+    timezones = _records(TimezoneRecord, model.Timezone)
+    states = _records(StateRecord, model.State)
+    colors = _records(ColorRecord, model.Color)
+
+    return ReferenceData(currencies=currencies,
+                         currencies_by_iso_code=_index(currencies, 'iso_code'),
+                         countries=countries,
+                         countries_by_code=_index(countries, 'code'),
+                         countries_by_name=_index(countries, 'name'),
+                         timezones=timezones,
+                         timezones_by_identifier=_index(timezones, 'identifier'),
+                         states=states,
+                         states_by_code=_index(states, 'code'),
+                         states_by_name=_index(states, 'name'),
+                         colors=colors,
+                         colors_by_name=_index(colors, 'name'),
+                         colors_by_hex_value=_index(colors, 'hex_value'))
+
+
+def reference_data() -> ReferenceData:
+    """Return the cached ReferenceData, loading it on first use or after invalidation."""
+
+    return _reference_data_cache.get("reference_data", _load_reference_data)
+
+
+def warm() -> ReferenceData:
+    """Load the records now (e.g. at startup) rather than on the first request that needs them."""
+
+    return reference_data()
+
+
+def invalidate():
+    """Call when currencies, countries, timezones, states or colors are written."""
+
+    _reference_data_cache.invalidate()
+
+
+
+
+# LOOKUPS
+
+
+
+
+def currency(currency_id: int) -> Optional[CurrencyRecord]:
+    """The currency with this id, or None."""
+
+    return reference_data().currencies.get(currency_id)
+
+
+def currency_by_iso_code(iso_code: str) -> Optional[CurrencyRecord]:
+    """The currency with this ISO code (e.g. USD), or None."""
+
+    return reference_data().currencies_by_iso_code.get(iso_code)
+
+
+def currency_symbol(currency_id: int) -> Optional[str]:
+    """The symbol of the currency with this id, or None."""
+
+    record = currency(currency_id)
+    return record.symbol if record else None
+
+
+def country(country_id: int) -> Optional[CountryRecord]:
+    """The country with this id, or None."""
+
+    return reference_data().countries.get(country_id)
+
+
+def country_by_code(code: str) -> Optional[CountryRecord]:
+    """The country with this ISO code, or None."""
+
+    return reference_data().countries_by_code.get(code)
+
+
+def country_by_name(name: str) -> Optional[CountryRecord]:
+    """The country with this name, or None."""
+
+    return reference_data().countries_by_name.get(name)
+
+
+def timezone(timezone_id: int) -> Optional[TimezoneRecord]:
+    """The timezone with this id, or None."""
+
+    return reference_data().timezones.get(timezone_id)
+
+
+def timezone_by_identifier(identifier: str) -> Optional[TimezoneRecord]:
+    """The timezone with this identifier (e.g. America/Los_Angeles), or None."""
+
+    return reference_data().timezones_by_identifier.get(identifier)
+
+
+def state(state_id: int) -> Optional[StateRecord]:
+    """The state with this id, or None."""
+
+    return reference_data().states.get(state_id)
+
+
+def state_by_code(code: str) -> Optional[StateRecord]:
+    """The state with this code (e.g. CA), or None."""
+
+    return reference_data().states_by_code.get(code)
+
+
+def state_by_name(name: str) -> Optional[StateRecord]:
+    """The state with this name, or None."""
+
+    return reference_data().states_by_name.get(name)
+
+
+def state_name(state_id: int) -> Optional[str]:
+    """The name of the state with this id, or None."""
+
+    record = state(state_id)
+    return record.name if record else None
+
+
+def color(color_id: int) -> Optional[ColorRecord]:
+    """The color with this id, or None."""
+
+    return reference_data().colors.get(color_id)
+
+
+def color_by_name(name: str) -> Optional[ColorRecord]:
+    """The color with this name, or None."""
+
+    return reference_data().colors_by_name.get(name)
+
+
+def color_by_hex_value(hex_value: str) -> Optional[ColorRecord]:
+    """The color with this hex value, or None."""
+
+    return reference_data().colors_by_hex_value.get(hex_value)
+
+
+def by_ids(records: Dict[int, NamedTuple], ids: List[int]) -> List[NamedTuple]:
+    """The records for ids, in order, skipping unknown ones."""
+
+    return [records[id] for id in ids if id in records]
+
+
+
+
+# SERIALIZERS
+
+
+
+
+def financial_entry_dict(entry: model.FinancialEntry) -> dict:
+    """A FinancialEntry for JSON, with its currency resolved from the cache instead of the currency relationship."""
+
+    record = currency(entry.currency_id)
+    return {'id': entry.id,
+            'currency_id': entry.currency_id,
+            'currency_symbol': record.symbol if record else None,
+            'currency_iso_code': record.iso_code if record else None,
+            'amount': str(entry.amount)}
+
+
+def address_dict(address: model.Address) -> dict:
+    """An Address for JSON, with its state and country resolved from the cache instead of their relationships."""
+
+    state_record = state(address.state_id)
+    country_record = country(address.country_id)
+    return {'id': address.id,
+            'name': address.name,
+            'type': address.type,
+            'street': address.street,
+            'city': address.city,
+            'state_id': address.state_id,
+            'state_code': state_record.code if state_record else None,
+            'state_name': state_record.name if state_record else None,
+            'zip': address.zip,
+            'country_id': address.country_id,
+            'country_code': country_record.code if country_record else None,
+            'country_name': country_record.name if country_record else None}
@@ -0,0 +1,109 @@
+"""Scan resolution: map a scanned (code_type, data) payload to its tag, asset and kit root.
+
+Tags are unique on (code_type, md5(data)). The md5 keeps index entries small, as payloads can be up to 3072 characters,
+and the digest is computed here so lookups hit the index directly. Matches are rechecked against data itself.
+Recent scans are kept in an in-process LRU, since a desk tends to scan the same gear going out and coming back.
+"""
+import hashlib
+
+from typing import Dict, Iterable, List, NamedTuple, Optional, Tuple
+from sqlalchemy import func, tuple_
+
+from database import model
+from database import cache
+from database import kits
+
+
+# Scan results are cached per (code_type, data). Tag writes made through this process invalidate straight away,
+# the TTL only bounds how long other processes' writes (and kit moves) go unseen.
+SCAN_CACHE_MAX_ENTRIES = 50000
+SCAN_CACHE_TTL_SECONDS = 60
+
+# Payloads per query in resolve_many, to keep the IN list to a sensible size
+SCAN_BATCH_CHUNK_SIZE = 500
+
+_scan_cache = cache.LRUCache(max_entries=SCAN_CACHE_MAX_ENTRIES, ttl_seconds=SCAN_CACHE_TTL_SECONDS)
+
+
+
+
+class ScanResult(NamedTuple):
+    asset_tag_id: int
+    asset_id: int
+    kit_root_id: int     # The top of the asset's kit, which is the asset itself when it isn't part of one
+
+
+ScanKey = Tuple[str, str]
+
+
+
+
+def data_hash(data: str) -> str:
+    """Python-side equivalent of PostgreSQL's md5(data) for the unique index."""
+
+    return hashlib.md5(data.encode("utf-8")).hexdigest()
+
+
+def scan_key(code_type, data: str) -> ScanKey:
+    """Normalise a code type (AssetCodeType or its value) and payload into a cache key. Raises ValueError on unknown types."""
+
+    return model.AssetCodeType(code_type).value, data
+
+
+def _load_scans(keys: List[ScanKey]) -> Dict[ScanKey, Optional[ScanResult]]:
+    """Resolve scan keys against asset_tags, ignoring archived tags. Unknown payloads map to None."""
+
+    tags_by_key = {}
+    for start in range(0, len(keys), SCAN_BATCH_CHUNK_SIZE):
+        chunk = keys[start:start + SCAN_BATCH_CHUNK_SIZE]
+        rows = model.db.session.query(model.AssetTag.id, model.AssetTag.asset_id, model.AssetTag.code_type, model.AssetTag.data) \
+                               .outerjoin(model.AuditState,
+                                          (model.AuditState.auditable_entity_type == model.AuditableEntityTypes.ASSET_TAG.value) &
+                                          (model.AuditState.related_entity_id == model.AssetTag.id) &
+                                          (model.AuditState.related_composite_id == 0)) \
+                               .filter(tuple_(model.AssetTag.code_type, func.md5(model.AssetTag.data))
+                                       .in_([(code_type, data_hash(data)) for code_type, data in chunk]),
+                                       model.AuditState.is_archived.isnot(True)) \
+                               .all()
+
+        for asset_tag_id, asset_id, code_type, data in rows:
+            tags_by_key[(code_type, data)] = (asset_tag_id, asset_id)
+
+    kit_root_ids = kits.kit_root_ids(asset_id for _, asset_id in tags_by_key.values())
+
+    results = {}
+    for key in keys:
+        tag = tags_by_key.get(key)
+        results[key] = None if tag is None else ScanResult(asset_tag_id=tag[0],
+                                                           asset_id=tag[1],
+                                                           kit_root_id=kit_root_ids.get(tag[1], tag[1]))
+
+    return results
+
+
+
+
+def resolve(code_type, data: str) -> Optional[ScanResult]:
+    """Resolve one scanned payload, or None if no live tag carries it."""
+
+    key = scan_key(code_type, data)
+    return _scan_cache.get_many([key], _load_scans)[key]
+
+
+def resolve_many(scans: Iterable[Tuple[object, str]]) -> List[Optional[ScanResult]]:
+    """Resolve (code_type, data) payloads in the order given, loading every cache miss together."""
+
+    keys = [scan_key(code_type, data) for code_type, data in scans]
+    results = _scan_cache.get_many(list(dict.fromkeys(keys)), _load_scans)
+
+    return [results[key] for key in keys]
+
+
+def invalidate(code_type=None, data: Optional[str] = None):
+    """Forget one payload's cached result, or every cached scan when called without arguments."""
+
+    if code_type is None:
+        _scan_cache.invalidate()
+        return
+
+    _scan_cache.invalidate(scan_key(code_type, data))
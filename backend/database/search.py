@@ -0,0 +1,128 @@
+"""Asset search: PostgreSQL full-text matching with pg_trgm as the typo-tolerant fallback.
+
+Asset has three search columns:
+
+    - search_context holds the manufacturer and category names. Generated columns can't read other tables, so
+      whatever changes an asset's manufacturer or category (or renames one) must refresh it.
+    - search_vector is a generated, weighted tsvector: names and numbers (A), manufacturer and category (B), description (C).
+    - search_text is a generated, lowercased copy of the short fields for trigram matching.
+
+Both generated columns have GIN indexes, so a search is two index scans OR'd into one bitmap, ranked over the matches only.
+"""
+import re
+
+from typing import Iterable, Optional
+from sqlalchemy import func, literal, literal_column, text
+
+from database import model
+from database import category_tree
+
+
+# The 'simple' configuration doesn't stem or drop stop words, which suits model names and serial numbers
+SEARCH_CONFIG = literal_column("'simple'::regconfig")
+
+# Full-text matches always outrank trigram-only ones. ts_rank_cd is normalised into [0, 1) so this stays bounded.
+FULL_TEXT_RANK_WEIGHT = 2.0
+
+_TOKEN_PATTERN = re.compile(r"\w+")
+
+
+
+
+def context_for(manufacturer_name: Optional[str], category_name: Optional[str]) -> Optional[str]:
+    """The search_context value for an asset with this manufacturer and category."""
+
+    names = [name for name in (manufacturer_name, category_name) if name]
+    return " ".join(names) if names else None
+
+
+def context_for_ids(manufacturer_id: Optional[int], category_id: Optional[int]) -> Optional[str]:
+    """search_context by ids. The category name comes from the cached tree, the manufacturer costs one query."""
+
+    manufacturer_name = None
+    if manufacturer_id is not None:
+        manufacturer_name = model.db.session.query(model.Manufacturer.name).filter_by(id=manufacturer_id).scalar()
+
+    category = category_tree.category_tree().nodes.get(category_id) if category_id is not None else None
+
+    return context_for(manufacturer_name, category['name'] if category else None)
+
+
+def normalize(query_text: str) -> str:
+    """Lowercase and collapse the query the same way search_text is built, for trigram comparison."""
+
+    return " ".join(_TOKEN_PATTERN.findall(query_text.lower()))
+
+
+def prefix_tsquery(query_text: str) -> Optional[str]:
+    """Turn free text into a to_tsquery() string where every word must match as a prefix, or None if it has no words.
+
+    Only word characters are kept, so user input can never produce tsquery syntax errors.
+    """
+
+    tokens = _TOKEN_PATTERN.findall(query_text.lower())
+    if not tokens:
+        return None
+
+    return " & ".join(f"{token}:*" for token in tokens)
+
+
+
+
+# SQL EXPRESSIONS
+
+
+
+
+def match_clause(query_text: str):
+    """Filter clause for assets matching query_text by full text or, failing that, by trigram word similarity."""
+
+    tsquery = func.to_tsquery(SEARCH_CONFIG, prefix_tsquery(query_text))
+    # `<%` is word_similarity(query, text) >= pg_trgm.word_similarity_threshold, and can use the trigram GIN index
+    return model.Asset.search_vector.op('@@')(tsquery) | literal(normalize(query_text)).op('<%')(model.Asset.search_text)
+
+
+def rank_expression(query_text: str):
+    """Relevance score for ordering matches, higher is better."""
+
+    tsquery = func.to_tsquery(SEARCH_CONFIG, prefix_tsquery(query_text))
+    # Normalization flag 32 maps the rank to rank / (rank + 1)
+    full_text_rank = func.ts_rank_cd(model.Asset.search_vector, tsquery, 32)
+
+    return full_text_rank * FULL_TEXT_RANK_WEIGHT + func.word_similarity(normalize(query_text), model.Asset.search_text)
+
+
+
+
+# MAINTENANCE
+
+
+
+
+def refresh_context(asset_ids: Optional[Iterable[int]] = None, commit: bool = True):
+    """Recompute search_context from the current manufacturer and category names, for the given assets or all of them.
+
+    Call after renaming a manufacturer or category, or after changing assets outside the create/update functions.
+    """
+
+    statement = """
+        UPDATE assets AS a
+        SET search_context = NULLIF(CONCAT_WS(' ', m.name, c.name), '')
+        FROM assets AS base
+        LEFT JOIN manufacturers AS m ON m.id = base.manufacturer_id
+        LEFT JOIN categories AS c ON c.id = base.category_id
+        WHERE a.id = base.id
+    """
+    params = {}
+
+    if asset_ids is not None:
+        asset_ids = list(asset_ids)
+        if not asset_ids:
+            return
+        statement += " AND a.id = ANY(:asset_ids)"
+        params["asset_ids"] = asset_ids
+
+    model.db.session.execute(text(statement), params)
+
+    if commit:
+        model.db.session.commit()
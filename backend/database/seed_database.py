@@ -14,9 +14,10 @@ import random
 from random import choice, randint
 from datetime import datetime
 from sqlalchemy import text
-from itertools import product
+from itertools import product, chain
+from typing import Optional
 
-from . import crud, model
+from . import crud, model, audit_partitions
 
 # import crud
 # import model
@@ -44,6 +45,9 @@ os.system('createdb parm')
 model.connect_to_db(server.app)
 model.db.create_all()
 
+# Partitions for this month and the next few, audit_partitions.run_maintenance() keeps adding them
+audit_partitions.ensure_partitions()
+
 
 
 
@@ -217,79 +221,71 @@ def populate_bootstrap_audit_entries(p_color_01_id,
                                      bootstrap_user_id):
     
     try:
-        primary_color_01_audit_entry = crud.create.audit_entry(operation_type = model.OperationType.CREATE.value,
-                                                               auditable_entity_type = model.CLASS_TO_ENUM_MAP['Color'],
-                                                               related_entity_id = p_color_01_id,
-                                                               audit_details = db_init_message,
-                                                               created_by_user_id = bootstrap_user_id,
-                                                               commit = False)
-
-        secondary_color_01_audit_entry = crud.create.audit_entry(operation_type = model.OperationType.CREATE.value,
-                                                                 auditable_entity_type = model.CLASS_TO_ENUM_MAP['Color'],
-                                                                 related_entity_id = s_color_01_id,
-                                                                 audit_details = db_init_message,
-                                                                 created_by_user_id = bootstrap_user_id,
-                                                                 commit = False)
-        
-        primary_color_02_audit_entry = crud.create.audit_entry(operation_type = model.OperationType.CREATE.value,
-                                                               auditable_entity_type = model.CLASS_TO_ENUM_MAP['Color'],
-                                                               related_entity_id = p_color_02_id,
-                                                               audit_details = db_init_message,
-                                                               created_by_user_id = bootstrap_user_id,
-                                                               commit = False)
-        
-        secondary_color_02_audit_entry = crud.create.audit_entry(operation_type = model.OperationType.CREATE.value,
-                                                                 auditable_entity_type = model.CLASS_TO_ENUM_MAP['Color'],
-                                                                 related_entity_id = s_color_02_id,
-                                                                 audit_details = db_init_message,
-                                                                 created_by_user_id = bootstrap_user_id,
-                                                                 commit = False)
-        
-        light_theme_ui_theme_audit_entry = crud.create.audit_entry(operation_type = model.OperationType.CREATE.value,
-                                                                   auditable_entity_type = model.CLASS_TO_ENUM_MAP['UiTheme'],
-                                                                   related_entity_id = light_ui_id,
-                                                                   audit_details = db_init_message,
-                                                                   created_by_user_id = bootstrap_user_id,
-                                                                   commit = False)
-        
-        dark_theme_ui_theme_audit_entry = crud.create.audit_entry(operation_type = model.OperationType.CREATE.value,
-                                                                  auditable_entity_type = model.CLASS_TO_ENUM_MAP['UiTheme'],
-                                                                  related_entity_id = dark_ui_id,
-                                                                  audit_details = db_init_message,
-                                                                  created_by_user_id = bootstrap_user_id,
-                                                                  commit = False)
-        
-        global_settings_audit_entry = crud.create.audit_entry(operation_type = model.OperationType.CREATE.value,
-                                                              auditable_entity_type = model.CLASS_TO_ENUM_MAP['GlobalSettings'],
-                                                              related_entity_hash = global_settings_fingerprint,
-                                                              audit_details = db_init_message,
-                                                              created_by_user_id = bootstrap_user_id,
-                                                              commit = False)
-        
-        bootstrap_user_settings_audit_entry = crud.create.audit_entry(operation_type = model.OperationType.CREATE.value,
-                                                                      auditable_entity_type = model.CLASS_TO_ENUM_MAP['UserSettings'],
-                                                                      related_entity_id = bootstrap_user_settings_id,
-                                                                      audit_details = db_init_message,
-                                                                      created_by_user_id = bootstrap_user_id,
-                                                                      commit = False)
-        
-        bootstrap_user_audit_entry = crud.create.audit_entry(operation_type = model.OperationType.CREATE.value,
-                                                             auditable_entity_type = model.CLASS_TO_ENUM_MAP['User'],
-                                                             related_entity_id = bootstrap_user_id,
-                                                             audit_details = db_init_message,
-                                                             created_by_user_id = bootstrap_user_id,
-                                                             commit = False)
-        
-        
-        model.db.session.add(primary_color_01_audit_entry)
-        model.db.session.add(secondary_color_01_audit_entry)
-        model.db.session.add(primary_color_02_audit_entry)
-        model.db.session.add(secondary_color_02_audit_entry)
-        model.db.session.add(light_theme_ui_theme_audit_entry)
-        model.db.session.add(dark_theme_ui_theme_audit_entry)
-        model.db.session.add(global_settings_audit_entry)
-        model.db.session.add(bootstrap_user_settings_audit_entry)
-        model.db.session.add(bootstrap_user_audit_entry)
+        crud.create.audit_entry(operation_type = model.OperationType.CREATE.value,
+                                auditable_entity_type = model.CLASS_TO_ENUM_MAP['Color'],
+                                related_entity_id = p_color_01_id,
+                                audit_details = db_init_message,
+                                created_by_user_id = bootstrap_user_id,
+                                commit = False)
+
+        crud.create.audit_entry(operation_type = model.OperationType.CREATE.value,
+                                auditable_entity_type = model.CLASS_TO_ENUM_MAP['Color'],
+                                related_entity_id = s_color_01_id,
+                                audit_details = db_init_message,
+                                created_by_user_id = bootstrap_user_id,
+                                commit = False)
+        
+        crud.create.audit_entry(operation_type = model.OperationType.CREATE.value,
+                                auditable_entity_type = model.CLASS_TO_ENUM_MAP['Color'],
+                                related_entity_id = p_color_02_id,
+                                audit_details = db_init_message,
+                                created_by_user_id = bootstrap_user_id,
+                                commit = False)
+        
+        crud.create.audit_entry(operation_type = model.OperationType.CREATE.value,
+                                auditable_entity_type = model.CLASS_TO_ENUM_MAP['Color'],
+                                related_entity_id = s_color_02_id,
+                                audit_details = db_init_message,
+                                created_by_user_id = bootstrap_user_id,
+                                commit = False)
+        
+        crud.create.audit_entry(operation_type = model.OperationType.CREATE.value,
+                                auditable_entity_type = model.CLASS_TO_ENUM_MAP['UiTheme'],
+                                related_entity_id = light_ui_id,
+                                audit_details = db_init_message,
+                                created_by_user_id = bootstrap_user_id,
+                                commit = False)
+        
+        crud.create.audit_entry(operation_type = model.OperationType.CREATE.value,
+                                auditable_entity_type = model.CLASS_TO_ENUM_MAP['UiTheme'],
+                                related_entity_id = dark_ui_id,
+                                audit_details = db_init_message,
+                                created_by_user_id = bootstrap_user_id,
+                                commit = False)
+        
+        crud.create.audit_entry(operation_type = model.OperationType.CREATE.value,
+                                auditable_entity_type = model.CLASS_TO_ENUM_MAP['GlobalSettings'],
+                                related_entity_hash = global_settings_fingerprint,
+                                audit_details = db_init_message,
+                                created_by_user_id = bootstrap_user_id,
+                                commit = False)
+        
+        crud.create.audit_entry(operation_type = model.OperationType.CREATE.value,
+                                auditable_entity_type = model.CLASS_TO_ENUM_MAP['UserSettings'],
+                                related_entity_id = bootstrap_user_settings_id,
+                                audit_details = db_init_message,
+                                created_by_user_id = bootstrap_user_id,
+                                commit = False)
+        
+        crud.create.audit_entry(operation_type = model.OperationType.CREATE.value,
+                                auditable_entity_type = model.CLASS_TO_ENUM_MAP['User'],
+                                related_entity_id = bootstrap_user_id,
+                                audit_details = db_init_message,
+                                created_by_user_id = bootstrap_user_id,
+                                commit = False)
+        
+        
+        # The entries are queued on the session and written together at commit
 
         model.db.session.commit()
 
@@ -677,8 +673,42 @@ def populate_categories(created_by_user_id: int = 0):
 
 
 
+def cheqroom_item_to_import_row(item: dict) -> crud.bulk.AssetImportRow:
+    """Map one item of a Cheqroom export onto an AssetImportRow."""
+
+    category_id_str = item.get("category_id")
+    if category_id_str == "Uncategorized" or category_id_str is None:
+        category_id = 1
+    else:
+        try:
+            category_id = int(category_id_str)
+        except ValueError:
+            category_id = 1
+
+    latitude = longitude = None
+    geo_value = item.get("Geo", None)
+    if geo_value:
+        latitude, longitude = map(float, geo_value.split(", "))
+
+    return crud.bulk.AssetImportRow(model_name=item.get("Name"),
+                                    inventory_number=int(item.get("Item Number") or 1),
+                                    manufacturer_name=item.get("Manufacturer") or item.get("Brand"),
+                                    model_number=item.get("Model"),
+                                    category_id=category_id,
+                                    online_item_page=item.get("Hyperlink"),
+                                    description=item.get("Description"),
+                                    purchase_price=float(item["Purchase Price"]) if item.get("Purchase Price") else None,
+                                    msrp=float(item["MSRP"]) if item.get("MSRP") else None,
+                                    residual_value=float(item["Residual Value"]) if item.get("Residual Value") else None,
+                                    latitude=latitude,
+                                    longitude=longitude)
+
+
+
 def populate_assets(created_by_user_id: int = 0,
-                    image_population: bool = False):
+                    image_population: bool = False,
+                    eager_image_variations: bool = False,
+                    image_hash_index_path: Optional[str] = None):
     try:
         # Create an initial "Unknown" manufacturer
         unknown_manufacturer, _ = crud.create.manufacturer(name="Unknown",
@@ -691,243 +721,158 @@ def populate_assets(created_by_user_id: int = 0,
         with open('database/data/Cheqroom_Item_Export-2023-08-12 21_06_57.json', 'r') as file:
             data = json.load(file)
 
-        downloaded_images = set()
-        downloaded_image_hashes = {}
-
-        for item in data:
-            # Create Manufacturer and Flush to get ID
-            manufacturer_name = item.get("Manufacturer") or item.get("Brand")
-            existing_manufacturer = crud.read.Manufacturer.by_name(manufacturer_name=manufacturer_name)
-
-            if existing_manufacturer:
-                manufacturer_id = existing_manufacturer.id
-            else:
-                if manufacturer_name:
-                    manufacturer, _ = crud.create.manufacturer(name=manufacturer_name,
-                                                            created_by_user_id=created_by_user_id,
-                                                            audit_details=db_init_message,
-                                                            commit=False)
-                    model.db.session.flush()
-                    manufacturer_id = manufacturer.id
-                else:
-                    manufacturer_id = unknown_manufacturer_id
+        # Write every asset with its manufacturer, financial entries, location log and audit entries in bulk
+        asset_ids = crud.bulk.assets([cheqroom_item_to_import_row(item) for item in data],
+                                     created_by_user_id=created_by_user_id,
+                                     default_manufacturer_id=unknown_manufacturer_id,
+                                     audit_details=db_init_message,
+                                     commit=False)
 
-            # Create Financial Entries and Flush to get IDs
-            purchase_price_id = msrp_id = residual_value_id = None
+        if image_population:
+            populate_asset_images(data, asset_ids, created_by_user_id, eager_image_variations, image_hash_index_path)
 
-            if item.get("Purchase Price"):
-                purchase_price, _ = crud.create.financial_entry(1,
-                                                                float(item["Purchase Price"]),
-                                                                created_by_user_id,
-                                                                db_init_message,
-                                                                commit = False)
-                model.db.session.flush()
-                purchase_price_id = purchase_price.id
-
-            if item.get("MSRP"):
-                msrp, _ = crud.create.financial_entry(1,
-                                                      float(item["MSRP"]),
-                                                      created_by_user_id,
-                                                      db_init_message,
-                                                      commit = False)
-                model.db.session.flush()
-                msrp_id = msrp.id
-
-            if item.get("Residual Value"):
-                residual_value, _ = crud.create.financial_entry(1,
-                                                                float(item["Residual Value"]),
-                                                                created_by_user_id,
-                                                                db_init_message,
-                                                                commit = False)
-                model.db.session.flush()
-                residual_value_id = residual_value.id
-
-            # Prepare fields for Asset creation
-
-            model_name = item.get("Name")
-            model_number = item.get("Model")
-            inventory_number = int(item.get("Item Number") or 1)
-            online_item_page = item.get("Hyperlink")
-            description = item.get("Description")
-            category_id_str = item.get("category_id")
-            if category_id_str == "Uncategorized" or category_id_str is None:
-                category_id = 1
-            else:
-                try:
-                    category_id = int(category_id_str)
-                except ValueError:
-                    category_id = 1
-
-
-            # Create Asset
-            asset, _ = crud.create.asset(manufacturer_id,
-                                         model_name,
-                                         inventory_number,
-                                         created_by_user_id,
-                                         model_number = model_number,
-                                         category_id = category_id,
-                                         purchase_price_id = purchase_price_id,
-                                         msrp_id = msrp_id,
-                                         residual_value_id = residual_value_id,
-                                         online_item_page = online_item_page,
-                                         description = description,
-                                         audit_details = db_init_message,
-                                         commit = False)
-
-            # Create asset_location_log
-            geo_value = item.get("Geo", None)
-            if geo_value:
-                latitude, longitude = map(float, geo_value.split(", "))
-                crud.create.asset_location_log(asset.id,
-                                            latitude,
-                                            longitude,
-                                            created_by_user_id,
-                                            db_init_message,
-                                            commit=False)
-                
-
-            if image_population:
-                model.db.session.flush()
-                asset_id = asset.id
+        
+        utils.successMessage()
+        model.db.session.commit()
 
-                # Check if there are already hashed images in DB
-                existing_file_hashes = crud.read.FileAttachment.all_file_hash_dict()
+    except Exception as e:
+        model.db.session.rollback()
+        utils.errorMessage(e)
 
-                # Merge dictionaries if so
-                if existing_file_hashes:
-                    downloaded_image_hashes.update(existing_file_hashes)
 
-                # print(f"\n\n\n\n\nDownloaded Image Hashes:\n\n\n\n{downloaded_image_hashes}\n\n\n\n\n\n\n\n\n\n\n")
 
-                # Get the image from the JSON entry
-                image_to_downloaded = item.get("Image Url")
 
-                # Check that there's somthing there
-                if image_to_downloaded:
 
-                    # Check if it's already been downloaded
-                    if (manufacturer_name, model_name) not in downloaded_images:
-                        
-                        image = utils.ImageURLScaping.download_image(image_to_downloaded)
-                        print(f"Image for {utils.UNDERLINED}{model_name}{utils.RESET} has been {utils.GREEN_BOLD}downloaded{utils.RESET}.")
-                        print(f"At this address: {utils.GREEN_BOLD}{image_to_downloaded}{utils.RESET}")
+def populate_asset_images(data: list,
+                          asset_ids: list,
+                          created_by_user_id: int = 0,
+                          eager_image_variations: bool = False,
+                          image_hash_index_path: Optional[str] = None):
+    """Download, resize and attach the image of every asset. Images are processed in parallel, DB writes stay on this thread.
 
-                        # Generate image hash for dupe checking
-                        original_image_hash = utils.Hashing.entire_file(image)
-                        print(f"\n\n{utils.UNDERLINED}Original Image Hash:{utils.RESET} {original_image_hash}\n\n\n")
+    Only originals are stored unless eager_image_variations is set, the server makes other sizes on first request.
+    With image_hash_index_path, what was downloaded is saved there and reused from disk on the next run.
+    """
 
-                        # Base directory
-                        base_dir = "/home/dj/src/PARM-Production_Asset_Reservation_Manager/backend/database/data/file_attachments"
+    # Base directory
+    base_dir = "/home/dj/src/PARM-Production_Asset_Reservation_Manager/backend/database/data/file_attachments"
 
-                        # Sanitize names for directory and filename use
-                        sanitized_manufacturer_name = utils.sanitize_name(manufacturer_name)
-                        sanitized_model_name = utils.sanitize_name(model_name)
+    # Load the hashes already in the DB once, the index is kept up to date as attachments are written below
+    hash_index = utils.FileHashIndex.load(image_hash_index_path, crud.read.FileAttachment.all_file_hash_dict())
+    required_labels = utils.ImageProcessing.image_size_map.keys() if eager_image_variations else ["0-original"]
 
-                        # Specific directories
-                        raw_dir = os.path.join(base_dir, sanitized_manufacturer_name, sanitized_model_name, "raw_images")
-                        processed_dir = os.path.join(base_dir, sanitized_manufacturer_name, sanitized_model_name)
+    # One job per manufacturer/model, the first asset of each pair gets the images
+    downloaded_images = set()
+    jobs = []
+    reused_results = []
 
+    for item, asset_id in zip(data, asset_ids):
+        manufacturer_name = item.get("Manufacturer") or item.get("Brand")
+        model_name = item.get("Name")
 
-                        if original_image_hash in downloaded_image_hashes:
+        # Get the image from the JSON entry
+        image_to_downloaded = item.get("Image Url")
 
-                            print(f"{utils.YELLOW_BOLD}Duplicate original image found{utils.RESET} for {utils.UNDERLINED}{model_name}{utils.RESET}!")
+        # Check that there's somthing there
+        if not image_to_downloaded:
+            print(f"No image to download for {utils.YELLOW_BOLD}{model_name}{utils.RESET}.")
+            continue
 
-                            existing_file_attachment_id = downloaded_image_hashes.get(original_image_hash)
+        # Check if it's already been queued
+        if (manufacturer_name, model_name) in downloaded_images:
+            print(f"Image for {utils.UNDERLINED}{model_name}{utils.RESET} has been already been downloaded and is being {utils.YELLOW_BOLD}skipped{utils.RESET}.")
+            continue
 
-                            crud.create.file_attachment_association(file_attachment_id=existing_file_attachment_id,
-                                                                    attachable_entity_type=model.AttachableEntityTypes.ASSET.value,
-                                                                    entity_id=asset_id,
-                                                                    created_by_user_id=created_by_user_id,
-                                                                    audit_details="Duplicate image found; reusing existing FileAttachment",
-                                                                    commit=False)
-                            
-                            print(f"Images for {utils.UNDERLINED}{model_name}{utils.RESET} were already {utils.GREEN_BOLD}created{utils.RESET}.")
-                            downloaded_images.add((manufacturer_name, model_name))
-                            downloaded_image_hashes[original_image_hash] = existing_file_attachment_id
+        downloaded_images.add((manufacturer_name, model_name))
 
-                        else:
+        # Sanitize names for directory and filename use
+        sanitized_manufacturer_name = utils.sanitize_name(manufacturer_name)
+        sanitized_model_name = utils.sanitize_name(model_name)
 
-                            # Check directories. If they don't exist, create them
-                            if utils.check_directory_exists(raw_dir):
-                                print(f"Directory {utils.UNDERLINED}{raw_dir}{utils.RESET} already exists.")
+        job = utils.ImageJob(key=asset_id,
+                             url=image_to_downloaded,
+                             original_output_dir=os.path.join(base_dir, sanitized_manufacturer_name, sanitized_model_name, "raw_images"),
+                             output_dir=os.path.join(base_dir, sanitized_manufacturer_name, sanitized_model_name),
+                             base_name=model_name,
+                             originals_only=not eager_image_variations)
 
-                            else:
-                                utils.create_directory(raw_dir)
-                                print(f"Directory {utils.UNDERLINED}{raw_dir}{utils.RESET} has been {utils.GREEN_BOLD}created{utils.RESET}.")
+        # Files from an earlier run are still on disk, no need to download or process anything
+        cached_download = hash_index.cached_download(image_to_downloaded, required_labels)
+        if cached_download:
+            source_hash, variations = cached_download
+            reused_results.append(utils.ImageJobResult(job, variations, source_hash=source_hash))
+        else:
+            jobs.append(job)
 
+    # Downloads are hashed as they stream in and checked against hash_index before anything is decoded
+    for result in chain(reused_results, utils.ImageIngestion.run(jobs, known_hashes=hash_index)):
+        asset_id = result.job.key
+        model_name = result.job.base_name
 
-                            if utils.check_directory_exists(processed_dir):
-                                print(f"Directory {utils.UNDERLINED}{processed_dir}{utils.RESET} already exists.")
+        if result.error is not None:
+            print(f"{utils.RED_BOLD}Image failed{utils.RESET} for {utils.UNDERLINED}{model_name}{utils.RESET} ({result.job.url}): {result.error}")
+            continue
 
-                            else:
-                                utils.create_directory(processed_dir)
-                                print(f"Directory {utils.UNDERLINED}{processed_dir}{utils.RESET} has been {utils.GREEN_BOLD}created{utils.RESET}.")
+        if result.is_known:
+            original_image_hash = result.source_hash
+        else:
+            print(f"Image for {utils.UNDERLINED}{model_name}{utils.RESET} has been {utils.GREEN_BOLD}downloaded{utils.RESET} and processed.")
 
+            # The original's hash is the first variation's
+            _, _, original_image_hash = result.variations[0]
 
-                            # Loop through image_size_map to create variations
-                            for label, max_size in utils.ImageProcessing.image_size_map.items():
-                                output_path = utils.ImageProcessing.generate_single_image_variation(image,
-                                                                                                    raw_dir,
-                                                                                                    processed_dir,
-                                                                                                    model_name,
-                                                                                                    label,
-                                                                                                    max_size)
-                                
-                                processed_image_hash_value = utils.Hashing.entire_file(output_path)
-                                print(f"\n\n{utils.UNDERLINED}Processed Image Hash{utils.RESET} for {label}: {processed_image_hash_value}\n\n\n")
+        # If the original is known, just reuse the existing original
+        if original_image_hash in hash_index:
+            print(f"{utils.YELLOW_BOLD}Duplicate original image found{utils.RESET} for {utils.UNDERLINED}{model_name}{utils.RESET}!")
 
-                                if processed_image_hash_value in downloaded_image_hashes:
-                                    
-                                    print(f"{utils.YELLOW_BOLD}Duplicate image variation found{utils.RESET} for {utils.UNDERLINED}{model_name}-{label}{utils.RESET}!")
+            crud.create.file_attachment_association(file_attachment_id=hash_index[original_image_hash],
+                                                    attachable_entity_type=model.AttachableEntityTypes.ASSET.value,
+                                                    entity_id=asset_id,
+                                                    created_by_user_id=created_by_user_id,
+                                                    audit_details="Duplicate image found; reusing existing FileAttachment",
+                                                    commit=False)
+            continue
 
-                                    existing_file_attachment_id = downloaded_image_hashes.get(processed_image_hash_value)
+        for label, output_path, processed_image_hash_value in result.variations:
 
-                                    crud.create.file_attachment_association(file_attachment_id=existing_file_attachment_id,
-                                                                            attachable_entity_type=model.AttachableEntityTypes.ASSET.value,
-                                                                            entity_id=asset_id,
-                                                                            created_by_user_id=created_by_user_id,
-                                                                            audit_details="Duplicate image found; reusing existing FileAttachment",
-                                                                            commit=False)
+            if processed_image_hash_value in hash_index:
+                print(f"{utils.YELLOW_BOLD}Duplicate image variation found{utils.RESET} for {utils.UNDERLINED}{model_name}-{label}{utils.RESET}!")
 
+                crud.create.file_attachment_association(file_attachment_id=hash_index[processed_image_hash_value],
+                                                        attachable_entity_type=model.AttachableEntityTypes.ASSET.value,
+                                                        entity_id=asset_id,
+                                                        created_by_user_id=created_by_user_id,
+                                                        audit_details="Duplicate image found; reusing existing FileAttachment",
+                                                        commit=False)
 
-                                else:
+            else:
+                file_attachment, _, _, _ = crud.create.file_attachment_with_association(attachable_entity_type=model.AttachableEntityTypes.ASSET.value,
+                                                                                        entity_id=asset_id,
+                                                                                        file_path=output_path,
+                                                                                        file_hash=processed_image_hash_value,
+                                                                                        file_type=model.FileType.JPEG.value,
+                                                                                        file_category=model.FileCategory.IMAGE.value,
+                                                                                        created_by_user_id=created_by_user_id,
+                                                                                        audit_details=db_init_message,
+                                                                                        commit=False)
+                model.db.session.flush()
 
-                                    file_attachment, _, _, _ = crud.create.file_attachment_with_association(attachable_entity_type=model.AttachableEntityTypes.ASSET.value,
-                                                                                                            entity_id=asset_id,
-                                                                                                            file_path=output_path,
-                                                                                                            file_hash=processed_image_hash_value,
-                                                                                                            file_type=model.FileType.JPEG.value,
-                                                                                                            file_category=model.FileCategory.IMAGE.value,
-                                                                                                            created_by_user_id=created_by_user_id,
-                                                                                                            audit_details=db_init_message,
-                                                                                                            commit=False)
-                                
-                                model.db.session.flush()
-                                
-                                downloaded_image_hashes[processed_image_hash_value] = file_attachment.id
-            
-                            print(f"Images for {utils.UNDERLINED}{model_name}{utils.RESET}'s sizes have been {utils.GREEN_BOLD}created{utils.RESET}.")
-                            downloaded_images.add((manufacturer_name, model_name))
+                hash_index[processed_image_hash_value] = file_attachment.id
 
-                    else:
-                        print(f"Image for {utils.UNDERLINED}{model_name}{utils.RESET} has been already been downloaded and is being {utils.YELLOW_BOLD}skipped{utils.RESET}.")
-                else:
-                    print(f"No image to download for {utils.YELLOW_BOLD}{model_name}{utils.RESET}.")
-                
+        # Non-JPEG originals are re-encoded, so also remember the downloaded bytes' hash to skip them next time
+        hash_index.setdefault(result.source_hash, hash_index[original_image_hash])
+        hash_index.record_download(result.job.url, result.source_hash, result.variations)
 
-        
-        utils.successMessage()
-        model.db.session.commit()
+        print(f"Images for {utils.UNDERLINED}{model_name}{utils.RESET}'s sizes have been {utils.GREEN_BOLD}created{utils.RESET}.")
 
-    except Exception as e:
-        model.db.session.rollback()
-        utils.errorMessage(e)
+    if image_hash_index_path:
+        hash_index.save(image_hash_index_path)
 
 
 
 
 
-def main(image_population=False):
+def main(image_population=False, eager_image_variations=False, image_hash_index_path=None):
     utils.openingText(program_name, version_number)
 
     populate_timezones()
@@ -983,14 +928,20 @@ def main(image_population=False):
     
     category_id_mapping, category_parent_mapping = populate_categories()
 
-    populate_assets(image_population = image_population)
+    populate_assets(image_population = image_population,
+                    eager_image_variations = eager_image_variations,
+                    image_hash_index_path = image_hash_index_path)
 
 
 
 if __name__ == "__main__":
     parser = argparse.ArgumentParser(description='Run the main program with optional arguments.')
     parser.add_argument('--image_population', action='store_true', help='Enable image population.')
+    parser.add_argument('--eager_image_variations', action='store_true', help='Generate every image size now instead of on first request.')
+    parser.add_argument('--image_hash_index', default=None, help='JSON file to keep downloaded images in between runs, so they are reused instead of fetched again.')
 
     args = parser.parse_args()
 
-    main(image_population=args.image_population)
\ No newline at end of file
+    main(image_population=args.image_population,
+         eager_image_variations=args.eager_image_variations,
+         image_hash_index_path=args.image_hash_index)
\ No newline at end of file
@@ -1,6 +1,10 @@
 "Update methods for DB Entities"
 
 from database import model
+from database import create
+from database import category_counts
+from database import search
+from database import deployment_settings
 from tools import utils
 
 from typing import Optional
@@ -22,6 +26,10 @@ def default_currency(default_currency_id, commit=True):
     if global_settings:
         # Update the default_currency_id
         global_settings.default_currency_id = default_currency_id
+
+        # Every process drops its cached settings once this commits
+        deployment_settings.notify_changed()
+
         if commit:
             model.db.session.commit()
             utils.successMessage()
@@ -30,4 +38,42 @@ def default_currency(default_currency_id, commit=True):
         return global_settings.default_currency_id
     else:
         utils.errorMessage("Global settings entry not found.")
-        return None
\ No newline at end of file
+        return None
+
+
+
+
+def asset_category(asset_id: int,
+                   category_id: Optional[int],
+                   updated_by_user_id: int,
+                   audit_details: Optional[str] = None,
+                   commit: bool = True):
+    """Move an asset to another category and return it."""
+
+    asset = model.db.session.query(model.Asset).filter_by(id=asset_id).first()
+
+    # Check if asset exists
+    if not asset:
+        raise ValueError(f"Invalid asset ID: {asset_id}")
+
+    if asset.category_id != category_id:
+        # Carry the asset's counts over from the old category to the new one
+        is_archived = category_counts.is_asset_archived(asset_id)
+        category_counts.adjust_many({asset.category_id: category_counts.asset_delta(asset.is_available, is_archived, sign=-1),
+                                     category_id: category_counts.asset_delta(asset.is_available, is_archived)})
+
+        asset.category_id = category_id
+        asset.search_context = search.context_for_ids(asset.manufacturer_id, category_id)
+
+        create.audit_entry(operation_type=model.OperationType.UPDATE.value,
+                           auditable_entity_type=model.CLASS_TO_ENUM_MAP['Asset'],
+                           related_entity_id=asset_id,
+                           created_by_user_id=updated_by_user_id,
+                           audit_details=audit_details,
+                           commit=False)
+
+    # Commit only if commit=True
+    if commit:
+        model.db.session.commit()
+
+    return asset
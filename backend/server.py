@@ -1,10 +1,12 @@
 """Server for parm app."""
 import os
 import sys
-from flask import Flask, render_template, jsonify, send_from_directory, redirect, url_for, request
+from datetime import datetime
+from flask import Flask, render_template, jsonify, send_from_directory, send_file, redirect, url_for, request, abort
 from dotenv import load_dotenv
 
-from database import crud, model, permissions
+from database import crud, model, permissions, availability, asset_images, projections, instrumentation, reference_data, deployment_settings
+from database.instrumentation import query_budget
 from tools import utils
 
 
@@ -20,8 +22,41 @@ app.config['SQLALCHEMY_DATABASE_URI'] = f'postgresql://parm_server:{db_password}
 
 model.db.init_app(app)
 
+# Statement counts and DB time per request, see the X-Query-* response headers and /debug/queries
+instrumentation.init_app(app)
+
 # app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
 
+
+# Currencies, countries, states, timezones, colors and the global settings are loaded once, before the first request is
+# served, instead of by whichever request happens to need them first. Not done at import, since the seeding tools import
+# this module before those tables exist. The settings listener is started here too, so each forked worker gets its own.
+@app.before_first_request
+def warm_reference_data():
+    reference_data.warm()
+    deployment_settings.warm()
+    deployment_settings.start_listener(model.db.engine)
+
+# Page size for /api/assets, and the most a client may ask for
+ASSET_PAGE_SIZE_DEFAULT = 60
+ASSET_PAGE_SIZE_MAX = 200
+
+# Ranked search pages by offset. Deep pages cost more, and nobody reads past the first few hundred results anyway.
+SEARCH_OFFSET_MAX = 1000
+SEARCH_QUERY_MAX_LENGTH = 200
+
+# Most scans /api/scan/batch accepts per request
+SCAN_BATCH_MAX = 1000
+
+# Image sizes are generated on first request and kept in a content-addressed, size-limited cache
+THUMBNAIL_CACHE_DIR = os.getenv("THUMBNAIL_CACHE_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), 'database', 'data', 'thumbnail_cache'))
+THUMBNAIL_CACHE_MAX_BYTES = int(os.getenv("THUMBNAIL_CACHE_MAX_BYTES", 1024 ** 3))
+# An attachment's bytes never change, but an asset's source image can be replaced, so asset URLs revalidate daily
+THUMBNAIL_MAX_AGE_ATTACHMENT = 60 * 60 * 24 * 365
+THUMBNAIL_MAX_AGE_ASSET = 60 * 60 * 24
+
+thumbnail_cache = utils.ThumbnailCache(THUMBNAIL_CACHE_DIR, THUMBNAIL_CACHE_MAX_BYTES)
+
 # Replace this with routes and view functions!
 
 
@@ -87,10 +122,8 @@ def login():
 #     return redirect(url_for('asset_grid'))
 
 @app.route('/asset_grid')
+@query_budget(2)
 def asset_grid():
-    assets = crud.read.Asset.all(requesting_user_id=1, include_archived=False)
-    
-
     # primary_color = "#000000"  # Default white
     # secondary_color = "#FFFFFF"  # Default black
 
@@ -98,34 +131,272 @@ def asset_grid():
     secondary_color = "#000000"  # Default black
 
     categories = crud.read.Category.all_ordered()
-    return render_template('app.html', assets=assets, primary_color=primary_color, secondary_color=secondary_color, categories=categories)
+    category_counts = crud.read.Category.asset_counts()
+    return render_template('app.html', primary_color=primary_color, secondary_color=secondary_color, categories=categories, category_counts=category_counts)
 
 
 @app.route('/app', defaults={'path': ''})
 @app.route('/app/<path:path>')
+@query_budget(2)
 def serve_app(path):
     email_cookie = request.cookies.get('email')
     password_cookie = request.cookies.get('password')
 
-    assets = crud.read.Asset.all(requesting_user_id=1, include_archived=False)
-    assets = [asset.to_dict() for asset in assets] if assets else None
-
+    # Assets are fetched page by page from /api/assets, so only the category tree is inlined
     categories = crud.read.Category.all_ordered()
+    category_counts = crud.read.Category.asset_counts()
 
 
     if email_cookie and password_cookie:
-        return render_template('app.html', assets=assets, categories=categories)
+        return render_template('app.html', categories=categories, category_counts=category_counts)
     else:
         return redirect('/login')
     
 
 
+def asset_rows_payload(rows, fields):
+    """Serialize projected asset rows, as one object per row or with format=columnar as one array per field."""
+
+    if request.args.get('format') == 'columnar':
+        return projections.to_columns(rows, fields)
+
+    return projections.to_rows(rows, fields)
+
+
+
+@app.route('/api/assets', methods=['GET'])
+@query_budget(4)
+def api_assets():
+    """One keyset page of assets. Pass the returned next_cursor back as after_category_id/after_id.
+
+    fields picks a projection (grid by default) and format=columnar returns arrays per field instead of objects.
+    """
+
+    try:
+        projection = request.args.get('fields', 'grid')
+        fields = projections.asset_fields(projection)
+    except ValueError as error:
+        return jsonify({"status": "failure", "message": str(error)}), 400
+
+    limit = min(max(request.args.get('limit', ASSET_PAGE_SIZE_DEFAULT, type=int), 1), ASSET_PAGE_SIZE_MAX)
+
+    after = None
+    after_id = request.args.get('after_id', type=int)
+    if after_id is not None:
+        after = (request.args.get('after_category_id', type=int), after_id)
+
+    available = request.args.get('available')
+    is_available = None if available is None else available.lower() in ('1', 'true', 'yes')
+
+    # Ask for one extra row to know whether there is a next page
+    rows = crud.read.Asset.page(requesting_user_id=1,
+                                limit=limit + 1,
+                                after=after,
+                                category_ids=request.args.getlist('category_id', type=int),
+                                is_available=is_available,
+                                manufacturer_ids=request.args.getlist('manufacturer_id', type=int),
+                                include_subcategories=True,
+                                projection=projection)
+
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        last_row = rows[-1]
+        next_cursor = {"after_category_id": last_row[fields.index('category_id')],
+                       "after_id": last_row[fields.index('id')]}
+
+    return jsonify({"assets": asset_rows_payload(rows, fields),
+                    "next_cursor": next_cursor})
+
+
+
+@app.route('/api/assets/<int:asset_id>/kit', methods=['GET'])
+@query_budget(2)
+def api_asset_kit(asset_id):
+    """The kit an asset belongs to, nested from its root down."""
+
+    kit = crud.read.Asset.kit(asset_id)
+    if kit is None:
+        abort(404)
+
+    return jsonify({"root_id": kit.root_id,
+                    "member_ids": sorted(kit.member_ids),
+                    "kit": kit.nested})
+
+
+
+@app.route('/api/search', methods=['GET'])
+@query_budget(4)
+def api_search():
+    """One ranked page of assets matching q. Pass the returned next_cursor back as offset. Takes fields and format like /api/assets."""
+
+    try:
+        projection = request.args.get('fields', 'grid')
+        fields = projections.asset_fields(projection)
+    except ValueError as error:
+        return jsonify({"status": "failure", "message": str(error)}), 400
+
+    query_text = request.args.get('q', '').strip()
+    if len(query_text) > SEARCH_QUERY_MAX_LENGTH:
+        return jsonify({"status": "failure", "message": f"Search queries are limited to {SEARCH_QUERY_MAX_LENGTH} characters"}), 400
+
+    limit = min(max(request.args.get('limit', ASSET_PAGE_SIZE_DEFAULT, type=int), 1), ASSET_PAGE_SIZE_MAX)
+    offset = request.args.get('offset', 0, type=int)
+    if not 0 <= offset <= SEARCH_OFFSET_MAX:
+        return jsonify({"status": "failure", "message": f"Search offsets run from 0 to {SEARCH_OFFSET_MAX}"}), 400
+
+    available = request.args.get('available')
+    is_available = None if available is None else available.lower() in ('1', 'true', 'yes')
+
+    # Ask for one extra row to know whether there is a next page
+    results = crud.read.Asset.search(requesting_user_id=1,
+                                     query_text=query_text,
+                                     limit=limit + 1,
+                                     offset=offset,
+                                     category_ids=request.args.getlist('category_id', type=int),
+                                     is_available=is_available,
+                                     include_subcategories=True,
+                                     projection=projection)
+
+    # No cursor past SEARCH_OFFSET_MAX, so clients following next_cursor stop there instead of being refused
+    next_cursor = None
+    if len(results) > limit:
+        results = results[:limit]
+        if offset + limit <= SEARCH_OFFSET_MAX:
+            next_cursor = {"offset": offset + limit}
+
+    rows = [row + (rank,) for row, rank in results]
+    return jsonify({"assets": asset_rows_payload(rows, fields + ('search_rank',)),
+                    "next_cursor": next_cursor})
+
+
+
+@app.route('/api/scan', methods=['GET'])
+@query_budget(3)
+def api_scan():
+    """Resolve one scanned payload (code_type, data) to its asset and kit root."""
+
+    try:
+        result = crud.read.AssetTag.resolve(request.args['code_type'], request.args['data'])
+    except (KeyError, ValueError) as error:
+        return jsonify({"status": "failure", "message": str(error)}), 400
+
+    if result is None:
+        return jsonify({"status": "failure", "message": "No asset carries this tag"}), 404
+
+    return jsonify(result._asdict())
+
+
+
+@app.route('/api/scan/batch', methods=['POST'])
+@query_budget(4)
+def api_scan_batch():
+    """Resolve a JSON list of {"code_type", "data"} scans in one call. Unknown payloads resolve to null."""
+
+    body = request.get_json(silent=True)
+    if not isinstance(body, dict):
+        return jsonify({"status": "failure", "message": 'Expected a JSON object with a "scans" list'}), 400
+
+    scans = body.get('scans')
+    if not isinstance(scans, list) or len(scans) > SCAN_BATCH_MAX:
+        return jsonify({"status": "failure", "message": f"Expected a list of at most {SCAN_BATCH_MAX} scans"}), 400
+
+    for item in scans:
+        if not (isinstance(item, dict) and isinstance(item.get('code_type'), str) and isinstance(item.get('data'), str)):
+            return jsonify({"status": "failure", "message": 'Each scan needs a string "code_type" and "data"'}), 400
+
+    try:
+        results = crud.read.AssetTag.resolve_many([(item['code_type'], item['data']) for item in scans])
+    except ValueError as error:
+        return jsonify({"status": "failure", "message": str(error)}), 400
+
+    return jsonify({"results": [result._asdict() if result else None for result in results]})
+
+
+
+@app.route('/api/availability', methods=['GET'])
+@query_budget(2)
+def api_availability():
+    """Split asset_id(s) into free and reserved over [start, end). Omit end for an open-ended window."""
+
+    try:
+        start = datetime.fromisoformat(request.args['start'])
+        end = datetime.fromisoformat(request.args['end']) if request.args.get('end') else None
+        asset_ids = request.args.getlist('asset_id', type=int)
+        free_asset_ids = availability.free_assets(asset_ids, start, end)
+    except (KeyError, ValueError) as error:
+        return jsonify({"status": "failure", "message": str(error)}), 400
+
+    free = set(free_asset_ids)
+    return jsonify({"free": free_asset_ids,
+                    "reserved": [asset_id for asset_id in dict.fromkeys(asset_ids) if asset_id not in free]})
+
+
+
+def send_thumbnail(file_attachment, size_label: str, max_age: int, immutable: bool = False):
+    """Respond with one size of an image attachment, generating it through thumbnail_cache if needed."""
+
+    if file_attachment is None or size_label not in utils.ImageProcessing.image_size_map:
+        abort(404)
+
+    # The ETag is known before anything is generated, so a revalidating client costs no disk access at all
+    if size_label == "0-original":
+        etag = file_attachment.file_hash
+    else:
+        etag = thumbnail_cache.key(file_attachment.file_hash, size_label)
+
+    if etag in request.if_none_match:
+        response = app.response_class(status=304)
+        response.set_etag(etag)
+    else:
+        if size_label == "0-original":
+            path = file_attachment.file_path
+        else:
+            path, etag = thumbnail_cache.get_or_create(file_attachment.file_path, file_attachment.file_hash, size_label)
+
+        response = send_file(path, mimetype='image/jpeg', etag=etag, max_age=max_age, conditional=True)
+
+    response.cache_control.public = True
+    response.cache_control.max_age = max_age
+    if immutable:
+        response.cache_control.immutable = True
+
+    return response
+
+
+@app.route('/thumbnails/attachment/<int:file_attachment_id>/<size_label>', methods=['GET'])
+@query_budget(1)
+def attachment_thumbnail(file_attachment_id, size_label):
+    file_attachment = crud.read.FileAttachment.by_id(file_attachment_id)
+    return send_thumbnail(file_attachment, size_label, THUMBNAIL_MAX_AGE_ATTACHMENT, immutable=True)
+
+
+@app.route('/thumbnails/asset/<int:asset_id>/<size_label>', methods=['GET'])
+@query_budget(2)
+def asset_thumbnail(asset_id, size_label):
+    # The asset's variant map names its source image, so this is a primary key lookup rather than an attachment scan
+    source = asset_images.source_variant(crud.read.Asset.image_variants(asset_id))
+    file_attachment = crud.read.FileAttachment.by_id(source['file_attachment_id']) if source else None
+    return send_thumbnail(file_attachment, size_label, THUMBNAIL_MAX_AGE_ASSET)
+
+
+
 @app.route('/images/<path:filename>', methods=['GET'])
 def serve_image(filename):
     image_root = os.path.abspath('/home/dj/src/PARM-Production_Asset_Reservation_Manager/backend/database/data/file_attachments/')
     return send_from_directory(image_root, filename)
 
 
+@app.route('/debug/queries', methods=['GET'])
+def debug_queries():
+    """Query stats for the most recent requests. Only served in debug mode or with QUERY_DEBUG_VIEW set."""
+
+    if not (app.debug or app.config.get('QUERY_DEBUG_VIEW')):
+        abort(404)
+
+    return jsonify({"requests": instrumentation.recent_requests()})
+
+
 if __name__ == "__main__":
 
     app.run(host="0.0.0.0", debug=True)
\ No newline at end of file
@@ -0,0 +1,38 @@
+"""Keep audit_entries' monthly partitions in shape: create upcoming ones, compact old UPDATE chains, detach expired ones.
+
+Run it daily, e.g. from cron:
+
+    python -m tools.audit_maintenance
+    python -m tools.audit_maintenance --partition_existing_table    # once, on a database created before partitioning
+"""
+import os
+import sys
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import argparse
+
+from database import audit_partitions
+
+
+
+
+if __name__ == "__main__":
+    import server
+
+    parser = argparse.ArgumentParser(description='Create, compact and detach audit_entries partitions.')
+    parser.add_argument('--database_uri', default=os.getenv("DATABASE_URI", "postgresql:///parm"), help='Database to work on.')
+    parser.add_argument('--drop_expired', action='store_true', help='Drop expired partitions instead of keeping them as standalone tables.')
+    parser.add_argument('--partition_existing_table', action='store_true', help='Convert an unpartitioned audit_entries table first.')
+
+    args = parser.parse_args()
+
+    server.app.config['SQLALCHEMY_DATABASE_URI'] = args.database_uri
+    with server.app.app_context():
+        if args.partition_existing_table:
+            print(f"Copied {audit_partitions.partition_existing_table():,} audit entries into the partitioned table")
+
+        results = audit_partitions.run_maintenance(drop_expired=args.drop_expired)
+        print(f"Created: {', '.join(results['created']) or 'none'}")
+        print(f"Compacted: {sum(results['compacted'].values()):,} entries removed from {len(results['compacted'])} partitions")
+        print(f"Detached: {', '.join(results['detached']) or 'none'}")
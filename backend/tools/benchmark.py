@@ -0,0 +1,191 @@
+"""Benchmark the main read paths and routes at several inventory sizes, saving the timings as JSON.
+
+For each scale the database is grown with tools.synthetic_data, then every benchmark is run `repeat` times after a
+warm-up call. Each call runs in a fresh app context, as a request would, so request memos start empty. Cold variants
+drop the process caches before each call. Results record min/median/max milliseconds and the statement count of the
+last call, tagged with the current commit:
+
+    python -m tools.benchmark --scales 10000 100000 --output benchmarks/$(git rev-parse --short HEAD).json
+    python -m tools.benchmark --scales 10000 --compare benchmarks/abc1234.json
+
+Use a seeded copy of the database (createdb -T parm parm_benchmark), the generator writes to it.
+"""
+import os
+import sys
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import argparse
+import json
+import statistics
+import subprocess
+import time
+
+from datetime import datetime, timedelta
+from typing import Callable, List, NamedTuple, Optional
+
+from database import crud, model, permissions, availability, category_tree, category_counts, instrumentation
+from tools import synthetic_data
+
+
+DEFAULT_SCALES = [10000, 100000]
+DEFAULT_REPEAT = 5
+
+# Benchmarks skipped above this many assets because a single call takes minutes
+UNBOUNDED_READ_MAX_SCALE = 100000
+
+
+
+
+class Benchmark(NamedTuple):
+    name: str
+    run: Callable[[], object]
+    setup: Optional[Callable[[], None]] = None      # Called before every timed run, e.g. to drop caches
+    max_scale: Optional[int] = None
+
+
+
+
+def _benchmarks(client) -> List[Benchmark]:
+    """Every benchmark, built against whatever the database holds right now."""
+
+    sample_asset_ids = [asset_id for asset_id, in model.db.session.query(model.Asset.id).order_by(model.Asset.id).limit(200).all()]
+    root_category_id = model.db.session.query(model.Category.id).filter(model.Category.parent_category_id.is_(None)).order_by(model.Category.id).limit(1).scalar()
+    window_start = datetime(2024, 6, 1)
+    availability_query = "&".join(f"asset_id={asset_id}" for asset_id in sample_asset_ids[:50])
+
+    def drop_category_caches():
+        category_tree.invalidate_category_tree()
+        category_counts.invalidate()
+
+    return [
+        Benchmark("read.Asset.all", lambda: crud.read.Asset.all(requesting_user_id=0), max_scale=UNBOUNDED_READ_MAX_SCALE),
+        Benchmark("read.Asset.page first", lambda: crud.read.Asset.page(requesting_user_id=0, limit=60, projection='grid')),
+        Benchmark("read.Asset.page category", lambda: crud.read.Asset.page(requesting_user_id=0, limit=60, category_ids=[root_category_id],
+                                                                           include_subcategories=True, projection='grid')),
+        Benchmark("read.Asset.search", lambda: crud.read.Asset.search(requesting_user_id=0, query_text="camera pro", limit=60, projection='grid')),
+        Benchmark("has_permission cold", lambda: permissions.has_permission(0, permissions.PermissionsType.CAN_VIEW_ARCHIVED_ASSETS.value),
+                  setup=permissions.invalidate_permissions),
+        Benchmark("has_permission warm", lambda: permissions.has_permission(0, permissions.PermissionsType.CAN_VIEW_ARCHIVED_ASSETS.value)),
+        Benchmark("read.Category.all_ordered cold", crud.read.Category.all_ordered, setup=category_tree.invalidate_category_tree),
+        Benchmark("read.Category.all_ordered warm", crud.read.Category.all_ordered),
+        Benchmark("read.Category.asset_counts cold", crud.read.Category.asset_counts, setup=drop_category_caches),
+        Benchmark("availability.free_assets cold", lambda: availability.free_assets(sample_asset_ids, window_start, window_start + timedelta(days=3)),
+                  setup=availability.invalidate),
+        Benchmark("GET /app", lambda: client.get('/app')),
+        Benchmark("GET /api/assets", lambda: client.get('/api/assets?limit=60')),
+        Benchmark("GET /api/assets columnar", lambda: client.get('/api/assets?limit=60&format=columnar')),
+        Benchmark("GET /api/assets detail", lambda: client.get('/api/assets?limit=60&fields=detail')),
+        Benchmark("GET /api/search", lambda: client.get('/api/search?q=camera%20pro')),
+        Benchmark("GET /api/availability", lambda: client.get(f'/api/availability?{availability_query}&start={window_start.isoformat()}')),
+    ]
+
+
+def _time_benchmark(app, benchmark: Benchmark, repeat: int) -> dict:
+    timings = []
+    queries = 0
+
+    for attempt in range(repeat + 1):
+        with app.app_context():
+            if benchmark.setup:
+                benchmark.setup()
+
+            with instrumentation.count_queries() as stats:
+                started_at = time.perf_counter()
+                benchmark.run()
+                elapsed = time.perf_counter() - started_at
+
+            model.db.session.rollback()
+
+        # The first call only warms up connections and imports
+        if attempt:
+            timings.append(elapsed * 1000)
+            queries = stats.count
+
+    return {"min_ms": round(min(timings), 3),
+            "median_ms": round(statistics.median(timings), 3),
+            "max_ms": round(max(timings), 3),
+            "queries": queries}
+
+
+def _current_commit() -> Optional[str]:
+    try:
+        return subprocess.run(["git", "rev-parse", "HEAD"], capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run(app, scales: List[int], seed: int = 0, repeat: int = DEFAULT_REPEAT, only: Optional[List[str]] = None) -> dict:
+    """Grow the database through each scale and time every benchmark there."""
+
+    client = app.test_client()
+    client.set_cookie('localhost', 'email', 'benchmark@example.com')
+    client.set_cookie('localhost', 'password', 'benchmark')
+
+    results = []
+    for scale in sorted(scales):
+        with app.app_context():
+            synthetic_data.generate(scale, seed=seed)
+            benchmarks = _benchmarks(client)
+
+        for benchmark in benchmarks:
+            if only and benchmark.name not in only:
+                continue
+            if benchmark.max_scale is not None and scale > benchmark.max_scale:
+                continue
+
+            timing = _time_benchmark(app, benchmark, repeat)
+            results.append(dict(timing, scale=scale, benchmark=benchmark.name))
+            print(f"{scale:>9,}  {benchmark.name:<36} {timing['median_ms']:>10.2f} ms  {timing['queries']:>4} queries")
+
+    return {"commit": _current_commit(),
+            "created_at": datetime.utcnow().isoformat(),
+            "seed": seed,
+            "repeat": repeat,
+            "results": results}
+
+
+def compare(baseline: dict, current: dict):
+    """Print median timings side by side with a baseline run."""
+
+    baseline_medians = {(result["scale"], result["benchmark"]): result["median_ms"] for result in baseline["results"]}
+
+    print(f"\nCompared with {baseline.get('commit') or 'baseline'}:")
+    for result in current["results"]:
+        before = baseline_medians.get((result["scale"], result["benchmark"]))
+        if before is None:
+            continue
+        ratio = result["median_ms"] / before if before else float('inf')
+        print(f"{result['scale']:>9,}  {result['benchmark']:<36} {before:>10.2f} -> {result['median_ms']:>10.2f} ms  ({ratio:.2f}x)")
+
+
+
+
+if __name__ == "__main__":
+    import server
+
+    parser = argparse.ArgumentParser(description='Time the main read paths and routes at several inventory sizes.')
+    parser.add_argument('--database_uri', default=os.getenv("BENCHMARK_DATABASE_URI", "postgresql:///parm_benchmark"), help='Database to benchmark. Synthetic data is added to it.')
+    parser.add_argument('--scales', type=int, nargs='+', default=DEFAULT_SCALES, help='Asset counts to benchmark at.')
+    parser.add_argument('--seed', type=int, default=0, help='Seed for the synthetic data.')
+    parser.add_argument('--repeat', type=int, default=DEFAULT_REPEAT, help='Timed runs per benchmark.')
+    parser.add_argument('--only', nargs='+', default=None, help='Benchmark names to run, all of them by default.')
+    parser.add_argument('--output', default=None, help='JSON file to write the results to.')
+    parser.add_argument('--compare', default=None, help='Earlier results JSON to compare against.')
+
+    args = parser.parse_args()
+
+    server.app.config['SQLALCHEMY_DATABASE_URI'] = args.database_uri
+    # Budgets are reported, not enforced, while benchmarking
+    server.app.config['QUERY_BUDGET_STRICT'] = False
+
+    results = run(server.app, args.scales, seed=args.seed, repeat=args.repeat, only=args.only)
+
+    if args.output:
+        os.makedirs(os.path.dirname(os.path.abspath(args.output)), exist_ok=True)
+        with open(args.output, 'w') as file:
+            json.dump(results, file, indent=2)
+
+    if args.compare:
+        with open(args.compare) as file:
+            compare(json.load(file), results)
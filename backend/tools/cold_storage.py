@@ -0,0 +1,42 @@
+"""Move long-archived assets and reservations to the cold <table>_archive tables, or bring some back.
+
+Safe to run on a schedule, every batch is committed on its own and rows locked by other transactions are skipped:
+
+    python -m tools.cold_storage --grace_days 30
+    python -m tools.cold_storage --restore_assets 1201 1202
+"""
+import os
+import sys
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import argparse
+
+from database import crud
+
+
+
+
+if __name__ == "__main__":
+    import server
+
+    parser = argparse.ArgumentParser(description='Move archived rows to cold storage, or restore them.')
+    parser.add_argument('--database_uri', default=os.getenv("DATABASE_URI", "postgresql:///parm"), help='Database to work on.')
+    parser.add_argument('--grace_days', type=int, default=crud.archive.COLD_STORAGE_GRACE_DAYS, help='Only move rows archived at least this many days ago.')
+    parser.add_argument('--batch_size', type=int, default=crud.archive.COLD_STORAGE_BATCH_SIZE, help='Entities moved per committed batch.')
+    parser.add_argument('--max_batches', type=int, default=None, help='Stop after this many batches per table.')
+    parser.add_argument('--restore_assets', type=int, nargs='+', default=None, help='Asset ids to move back to the hot tables instead.')
+    parser.add_argument('--restore_reservations', type=int, nargs='+', default=None, help='Reservation ids to move back to the hot tables instead.')
+
+    args = parser.parse_args()
+
+    server.app.config['SQLALCHEMY_DATABASE_URI'] = args.database_uri
+    with server.app.app_context():
+        if args.restore_assets or args.restore_reservations:
+            if args.restore_reservations:
+                print(f"Restored reservations: {crud.archive.restore_reservations(args.restore_reservations)}")
+            if args.restore_assets:
+                print(f"Restored assets: {crud.archive.restore_assets(args.restore_assets)}")
+        else:
+            moved = crud.archive.move_to_cold_storage(args.grace_days, args.batch_size, args.max_batches)
+            print(", ".join(f"{count:,} {table}" for table, count in moved.items()) + " moved to cold storage")
@@ -0,0 +1,288 @@
+"""Deterministic synthetic inventory for benchmarking: categories, manufacturers, assets, reservations, attachments.
+
+Everything goes through crud (bulk for the assets themselves), so audit entries, audit states, category counts and
+search columns are written exactly as in production. Asset i is always generated from (seed, i), and generate()
+only adds the assets missing below the target, so growing a database from 10k to 100k gives the same data as
+generating 100k straight away.
+
+Run against a seeded copy of the database, never the real one:
+
+    createdb -T parm parm_benchmark
+    python -m tools.synthetic_data --database_uri postgresql:///parm_benchmark --assets 100000
+"""
+import os
+import sys
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import argparse
+import hashlib
+import random
+
+from datetime import datetime, timedelta
+from typing import Dict, List, NamedTuple, Optional
+from sqlalchemy import or_
+
+from database import crud, model
+
+
+# Descriptions start with this, which is how already generated assets are counted
+SYNTHETIC_DESCRIPTION_PREFIX = "Synthetic benchmark asset"
+SYNTHETIC_AUDIT_DETAILS = "Generated synthetic benchmark data."
+
+CATEGORY_ROOTS = 12
+CATEGORY_CHILDREN = 6
+CATEGORY_GRANDCHILDREN = 3
+MANUFACTURER_COUNT = 500
+
+# Per generated asset
+ARCHIVED_FRACTION = 0.02
+ATTACHMENT_FRACTION = 0.05
+RESERVATION_FRACTION = 0.01
+MAX_ASSETS_PER_RESERVATION = 8
+
+# Assets written (and committed) per bulk import
+GENERATION_BATCH_SIZE = 10000
+
+_EQUIPMENT_TYPES = ["Camera", "Lens", "Tripod", "Microphone", "Light", "Stand", "Cable", "Monitor", "Recorder", "Battery",
+                    "Gimbal", "Slider", "Mixer", "Speaker", "Projector", "Drone", "Adapter", "Case", "Filter", "Clamp"]
+_MODEL_WORDS = ["Pro", "Mini", "Max", "Studio", "Field", "Cine", "Ultra", "Lite", "Compact", "Broadcast", "Mark", "Air"]
+_DESCRIPTION_WORDS = ["rugged", "lightweight", "wireless", "4K", "weather sealed", "battery powered", "modular",
+                      "carbon fiber", "low noise", "daylight balanced", "rack mounted", "portable"]
+
+# Reservation windows are spread over this period
+_RESERVATION_EPOCH = datetime(2024, 1, 1)
+_RESERVATION_SPAN_DAYS = 365
+
+
+
+
+class SyntheticContext(NamedTuple):
+    created_by_user_id: int
+    category_ids: List[int]
+    default_manufacturer_id: int
+    area_id: int
+
+
+
+
+def _rng(seed: int, *parts) -> random.Random:
+    """A generator that depends only on the seed and the given parts, e.g. an asset's index."""
+
+    return random.Random(":".join(str(part) for part in (seed,) + parts))
+
+
+def manufacturer_name(index: int) -> str:
+    return f"Synthetic Manufacturer {index:04d}"
+
+
+def asset_row(seed: int, index: int, category_ids: List[int]) -> crud.bulk.AssetImportRow:
+    """The import row for synthetic asset number index."""
+
+    rng = _rng(seed, "asset", index)
+    equipment_type = rng.choice(_EQUIPMENT_TYPES)
+    model_name = f"{equipment_type} {rng.choice(_MODEL_WORDS)} {rng.randint(1, 99)}"
+    price = round(rng.uniform(5, 25000), 2)
+
+    return crud.bulk.AssetImportRow(model_name=model_name,
+                                    inventory_number=index % 30000 + 1,
+                                    manufacturer_name=manufacturer_name(rng.randrange(MANUFACTURER_COUNT)),
+                                    model_number=f"{equipment_type[:2].upper()}-{rng.randint(100, 9999)}",
+                                    category_id=rng.choice(category_ids),
+                                    description=f"{SYNTHETIC_DESCRIPTION_PREFIX} {index}: {', '.join(rng.sample(_DESCRIPTION_WORDS, 3))}",
+                                    purchase_price=price,
+                                    msrp=round(price * 1.2, 2),
+                                    latitude=round(rng.uniform(-60, 60), 6) if rng.random() < 0.5 else None,
+                                    longitude=round(rng.uniform(-150, 150), 6) if rng.random() < 0.5 else None)
+
+
+def synthetic_asset_ids(indexes: range) -> Dict[int, int]:
+    """{index: asset id} for already generated synthetic assets, found by the index in their description."""
+
+    if not indexes:
+        return {}
+
+    rows = model.db.session.query(model.Asset.id, model.Asset.description) \
+                           .filter(or_(*(model.Asset.description.like(f"{SYNTHETIC_DESCRIPTION_PREFIX} {index}:%") for index in indexes))) \
+                           .all()
+
+    return {int(description[len(SYNTHETIC_DESCRIPTION_PREFIX):].split(":", 1)[0]): asset_id for asset_id, description in rows}
+
+
+def existing_asset_count() -> int:
+    """How many synthetic assets the database already has."""
+
+    return model.db.session.query(model.Asset.id) \
+                           .filter(model.Asset.description.like(f"{SYNTHETIC_DESCRIPTION_PREFIX} %")) \
+                           .count()
+
+
+
+
+# REFERENCE DATA
+
+
+
+
+def ensure_categories(created_by_user_id: int) -> List[int]:
+    """Create the synthetic category tree if it's missing and return every id in it."""
+
+    color = model.db.session.query(model.Color).order_by(model.Color.id).first()
+    if color is None:
+        raise ValueError("Seed the database first, synthetic categories need a color")
+
+    def ensure(name: str, parent_category_id: Optional[int]) -> int:
+        category = crud.read.Category.by_name(name)
+        if category is None:
+            category, _ = crud.create.category(name, color.id, created_by_user_id, parent_category_id,
+                                               audit_details=SYNTHETIC_AUDIT_DETAILS, commit=False)
+        return category.id
+
+    category_ids = []
+    for root in range(CATEGORY_ROOTS):
+        root_id = ensure(f"Synthetic {root:02d}", None)
+        category_ids.append(root_id)
+        for child in range(CATEGORY_CHILDREN):
+            child_id = ensure(f"Synthetic {root:02d}.{child}", root_id)
+            category_ids.append(child_id)
+            for grandchild in range(CATEGORY_GRANDCHILDREN):
+                category_ids.append(ensure(f"Synthetic {root:02d}.{child}.{grandchild}", child_id))
+
+    model.db.session.commit()
+    return category_ids
+
+
+def ensure_context(created_by_user_id: int = 0) -> SyntheticContext:
+    """Create (once) the categories, manufacturers and area the synthetic assets hang off."""
+
+    category_ids = ensure_categories(created_by_user_id)
+
+    manufacturer_ids = crud.bulk.manufacturers((manufacturer_name(index) for index in range(MANUFACTURER_COUNT)),
+                                               created_by_user_id,
+                                               SYNTHETIC_AUDIT_DETAILS)
+
+    area = model.db.session.query(model.Area).filter_by(name="Synthetic Warehouse").first()
+    if area is None:
+        area, _ = crud.create.area("Synthetic Warehouse", created_by_user_id, audit_details=SYNTHETIC_AUDIT_DETAILS, commit=False)
+
+    model.db.session.commit()
+
+    return SyntheticContext(created_by_user_id=created_by_user_id,
+                            category_ids=category_ids,
+                            default_manufacturer_id=manufacturer_ids[manufacturer_name(0)],
+                            area_id=area.id)
+
+
+
+
+# GENERATION
+
+
+
+
+def _add_attachments(seed: int, context: SyntheticContext, indexed_asset_ids: List[tuple]):
+    """Give a fraction of the assets an image attachment. Paths are placeholders, no files are written."""
+
+    for index, asset_id in indexed_asset_ids:
+        if _rng(seed, "attachment", index).random() >= ATTACHMENT_FRACTION:
+            continue
+
+        file_hash = hashlib.sha256(f"synthetic:{seed}:{index}".encode()).hexdigest()
+        crud.create.file_attachment_with_association(attachable_entity_type=model.AttachableEntityTypes.ASSET.value,
+                                                     entity_id=asset_id,
+                                                     file_path=f"synthetic/{seed}/{index}/asset_{index}_0-original.jpg",
+                                                     file_hash=file_hash,
+                                                     file_type=model.FileType.JPEG.value,
+                                                     file_category=model.FileCategory.IMAGE.value,
+                                                     created_by_user_id=context.created_by_user_id,
+                                                     audit_details=SYNTHETIC_AUDIT_DETAILS,
+                                                     commit=False)
+
+
+def _add_reservations(seed: int, context: SyntheticContext, asset_ids_by_index: Dict[int, int], indexes: range):
+    """Reserve groups of consecutive assets.
+
+    Assets are split by index into fixed blocks of MAX_ASSETS_PER_RESERVATION, and whether a block is reserved (and
+    how many of its assets, and when) depends only on (seed, block), so the data is the same however the inventory was
+    grown. Blocks don't overlap, so windows never conflict. A group is reserved in the batch its last asset is created
+    in, so asset_ids_by_index must also hold the ids of its earlier assets.
+    """
+
+    for block in range(indexes.start // MAX_ASSETS_PER_RESERVATION, (indexes.stop - 1) // MAX_ASSETS_PER_RESERVATION + 1):
+        rng = _rng(seed, "reservations", block)
+        if rng.random() >= RESERVATION_FRACTION * MAX_ASSETS_PER_RESERVATION:
+            continue
+
+        group = range(block * MAX_ASSETS_PER_RESERVATION, block * MAX_ASSETS_PER_RESERVATION + rng.randint(1, MAX_ASSETS_PER_RESERVATION))
+        if group[-1] not in indexes:
+            continue
+
+        checkout = _RESERVATION_EPOCH + timedelta(days=rng.randrange(_RESERVATION_SPAN_DAYS), hours=rng.randrange(24))
+        reservation, _ = crud.create.reservation(reserved_for=context.created_by_user_id,
+                                                 area_id=context.area_id,
+                                                 created_by_user_id=context.created_by_user_id,
+                                                 planned_checkout_time=checkout,
+                                                 planned_checkin_time=checkout + timedelta(days=rng.randint(1, 14)),
+                                                 audit_details=SYNTHETIC_AUDIT_DETAILS,
+                                                 commit=False)
+
+        for index in group:
+            crud.create.reservation_asset(reservation.id, asset_ids_by_index[index], context.created_by_user_id,
+                                          audit_details=SYNTHETIC_AUDIT_DETAILS, commit=False)
+
+
+def _archive_some(seed: int, context: SyntheticContext, indexed_asset_ids: List[tuple]):
+    for index, asset_id in indexed_asset_ids:
+        if _rng(seed, "archive", index).random() < ARCHIVED_FRACTION:
+            crud.archive.entity(model.AuditableEntityTypes.ASSET.value, asset_id, context.created_by_user_id,
+                                audit_details=SYNTHETIC_AUDIT_DETAILS, commit=False)
+
+
+def generate(asset_count: int, seed: int = 0, created_by_user_id: int = 0, batch_size: int = GENERATION_BATCH_SIZE) -> int:
+    """Grow the synthetic inventory to asset_count assets, committing per batch. Returns how many were added."""
+
+    context = ensure_context(created_by_user_id)
+    start = existing_asset_count()
+
+    # Ids of the assets in the reservation block that is still being filled, carried from one batch (or run) to the next
+    asset_ids_by_index = synthetic_asset_ids(range(start - start % MAX_ASSETS_PER_RESERVATION, start))
+
+    for batch_start in range(start, asset_count, batch_size):
+        indexes = range(batch_start, min(batch_start + batch_size, asset_count))
+
+        asset_ids = crud.bulk.assets((asset_row(seed, index, context.category_ids) for index in indexes),
+                                     created_by_user_id,
+                                     context.default_manufacturer_id,
+                                     audit_details=SYNTHETIC_AUDIT_DETAILS,
+                                     commit=False)
+        indexed_asset_ids = list(zip(indexes, asset_ids))
+        asset_ids_by_index.update(indexed_asset_ids)
+
+        _add_attachments(seed, context, indexed_asset_ids)
+        _add_reservations(seed, context, asset_ids_by_index, indexes)
+        _archive_some(seed, context, indexed_asset_ids)
+
+        open_block_start = indexes.stop - indexes.stop % MAX_ASSETS_PER_RESERVATION
+        asset_ids_by_index = {index: asset_id for index, asset_id in asset_ids_by_index.items() if index >= open_block_start}
+
+        model.db.session.commit()
+        print(f"Synthetic assets: {indexes.stop:,} / {asset_count:,}")
+
+    return max(asset_count - start, 0)
+
+
+
+
+if __name__ == "__main__":
+    import server
+
+    parser = argparse.ArgumentParser(description='Grow a database to a given number of synthetic assets.')
+    parser.add_argument('--database_uri', default=os.getenv("BENCHMARK_DATABASE_URI", "postgresql:///parm_benchmark"), help='Database to write to. Never point this at production.')
+    parser.add_argument('--assets', type=int, required=True, help='Number of synthetic assets to end up with.')
+    parser.add_argument('--seed', type=int, default=0, help='Seed for the generated data.')
+
+    args = parser.parse_args()
+
+    server.app.config['SQLALCHEMY_DATABASE_URI'] = args.database_uri
+    with server.app.app_context():
+        generate(args.assets, seed=args.seed)
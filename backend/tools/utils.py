@@ -6,8 +6,11 @@ import re
 import shutil
 import hashlib
 import io
+import threading
 
-from typing import Optional
+from typing import Optional, List, Tuple, NamedTuple, Iterable, Iterator, Container
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor, wait, FIRST_COMPLETED
 from PIL import Image
 import requests
 from io import BytesIO
@@ -179,6 +182,22 @@ class ImageURLScaping:
                 file.write(chunk)
 
 
+    @staticmethod
+    def download_image_with_hash(url, hash_type='sha256') -> Tuple[bytes, str]:
+        """Download an image, hashing the raw bytes as they arrive. Returns (image_bytes, hexdigest)."""
+
+        hasher = hashlib.new(hash_type)
+        chunks = []
+
+        with requests.get(url, stream=True) as response:
+            response.raise_for_status()
+            for chunk in response.iter_content(chunk_size=65536):
+                hasher.update(chunk)
+                chunks.append(chunk)
+
+        return b"".join(chunks), hasher.hexdigest()
+
+
     @staticmethod
     def download_image(url):
         response = requests.get(url)
@@ -467,6 +486,113 @@ class ImageProcessing:
             return output_path
 
 
+    @staticmethod
+    def scaled_size(size: Tuple[int, int], max_size: int) -> Tuple[int, int]:
+        """Width and height for a variation whose longest side is max_size."""
+
+        width, height = size
+        if width > height:
+            return max_size, int((height / width) * max_size)
+
+        return int((width / height) * max_size), max_size
+
+
+    @staticmethod
+    def cascade_variations(image: Image.Image,
+                           full_size: Optional[Tuple[int, int]] = None) -> Iterator[Tuple[str, Image.Image]]:
+        """Yields (label, resized image) for every resized size in image_size_map, largest first.
+
+        Each size is resized from the previous (larger) one instead of from the original, so small sizes cost next to nothing.
+        full_size is the original's size when `image` was decoded at reduced scale, and keeps the output dimensions exact.
+        """
+
+        full_size = full_size or image.size
+        sizes = sorted(((label, max_size) for label, max_size in ImageProcessing.image_size_map.items() if max_size is not None),
+                       key=lambda label_and_size: label_and_size[1],
+                       reverse=True)
+
+        source = image
+        for label, max_size in sizes:
+            resized = source.resize(ImageProcessing.scaled_size(full_size, max_size), Image.LANCZOS)
+            yield label, resized
+
+            # Only step down from a downscaled image. Sizes bigger than the original are upscaled from it directly.
+            source = resized if resized.width <= image.width and resized.height <= image.height else image
+
+
+    @staticmethod
+    def generate_image_variations_from_bytes(image_bytes: bytes,
+                                             original_output_dir: str,
+                                             output_dir: str,
+                                             base_name: str,
+                                             originals_only: bool = False) -> List[Tuple[str, str, str]]:
+        """Decodes an image once, saves every size in image_size_map and returns [(label, output_path, sha256)].
+
+        JPEG originals are stored byte for byte and decoded in draft mode at the smallest scale that still covers the
+        largest variation. Each variation is hashed from the encoded bytes before they are written, so nothing is read back.
+        With originals_only, only "0-original" is saved and the other sizes are left to the thumbnail cache.
+        Runs in ImageIngestion's process pool, so it must stay picklable and must not print or touch the DB.
+        """
+
+        os.makedirs(original_output_dir, exist_ok=True)
+        if not originals_only:
+            os.makedirs(output_dir, exist_ok=True)
+
+        sanitized_base_name = sanitize_name(base_name)
+        encoded_variations = {}
+
+        with Image.open(BytesIO(image_bytes)) as source:
+            full_size = source.size
+
+            if source.format == "JPEG":
+                # Already a JPEG, keep it as downloaded and let libjpeg decode at 1/2, 1/4 or 1/8 scale where it can
+                encoded_variations["0-original"] = image_bytes
+                largest_size = max(size for size in ImageProcessing.image_size_map.values() if size is not None)
+                source.draft("RGB", ImageProcessing.scaled_size(full_size, largest_size))
+
+            # A JPEG original needs no decoding at all when it's the only thing being saved
+            input_image = None if originals_only and encoded_variations else source.convert("RGB")
+
+        if "0-original" not in encoded_variations:
+            with BytesIO() as output:
+                input_image.save(output, "JPEG", quality=95)
+                encoded_variations["0-original"] = output.getvalue()
+
+        if not originals_only:
+            for label, resized_image in ImageProcessing.cascade_variations(input_image, full_size):
+                with BytesIO() as output:
+                    resized_image.save(output, "JPEG", quality=95)
+                    encoded_variations[label] = output.getvalue()
+
+        # Write in image_size_map order, the original first
+        variations = []
+        for label in (label for label in ImageProcessing.image_size_map if label in encoded_variations):
+            output_filename = f"{sanitized_base_name}_{label}.jpg"
+            output_path = os.path.join(original_output_dir if label == "0-original" else output_dir, output_filename)
+
+            encoded = encoded_variations[label]
+            with open(output_path, 'wb') as file:
+                file.write(encoded)
+
+            variations.append((label, output_path, hashlib.sha256(encoded).hexdigest()))
+
+        return variations
+
+
+    @staticmethod
+    def generate_variation_bytes(source_path: str, max_size: int) -> bytes:
+        """Returns one resized variation of the image at source_path, JPEG encoded."""
+
+        with Image.open(source_path) as source:
+            target_size = ImageProcessing.scaled_size(source.size, max_size)
+            source.draft("RGB", target_size)
+            resized_image = source.convert("RGB").resize(target_size, Image.LANCZOS)
+
+        with BytesIO() as output:
+            resized_image.save(output, "JPEG", quality=95)
+            return output.getvalue()
+
+
     @staticmethod
     def generate_image_variations(img: Image.Image,
                                   original_output_dir: str,
@@ -557,4 +683,267 @@ class ImageProcessing:
             ImageProcessing.resize_image_from_path(file_import, output_dir, label)
 
 
-        print(f"\n{GREEN_BOLD}Resizing completed!{RESET} Images saved in {GREEN}{output_dir}{RESET}\n\n")
\ No newline at end of file
+        print(f"\n{GREEN_BOLD}Resizing completed!{RESET} Images saved in {GREEN}{output_dir}{RESET}\n\n")
+
+
+
+class FileHashIndex:
+    """Dedupe index for image ingestion: file hash -> FileAttachment id, built once and updated as attachments are written.
+
+    It also remembers what each download produced (url -> source hash -> variations on disk). Only that part is
+    persisted, since attachment ids belong to the database, and it lets a later run reuse files instead of fetching
+    and processing them again.
+    """
+
+    def __init__(self, file_attachment_ids: Optional[dict] = None):
+        self._file_attachment_ids = dict(file_attachment_ids or {})
+        self._source_hashes_by_url = {}
+        self._variations_by_source_hash = {}
+
+
+    def __contains__(self, file_hash) -> bool:
+        return file_hash in self._file_attachment_ids
+
+
+    def __getitem__(self, file_hash) -> int:
+        return self._file_attachment_ids[file_hash]
+
+
+    def __setitem__(self, file_hash, file_attachment_id: int):
+        self._file_attachment_ids[file_hash] = file_attachment_id
+
+
+    def setdefault(self, file_hash, file_attachment_id: int) -> int:
+        return self._file_attachment_ids.setdefault(file_hash, file_attachment_id)
+
+
+    def record_download(self, url: str, source_hash: str, variations: List[Tuple[str, str, str]]):
+        """Remember which files a download produced, so a later run can reuse them."""
+
+        self._source_hashes_by_url[url] = source_hash
+        self._variations_by_source_hash[source_hash] = [list(variation) for variation in variations]
+
+
+    def cached_download(self, url: str, labels: Iterable[str]) -> Optional[Tuple[str, List[Tuple[str, str, str]]]]:
+        """Return (source_hash, variations) from an earlier download of url, or None unless every label is still on disk."""
+
+        source_hash = self._source_hashes_by_url.get(url)
+        variations = self._variations_by_source_hash.get(source_hash)
+        if variations is None:
+            return None
+
+        variations = [tuple(variation) for variation in variations]
+        available_labels = {label for label, output_path, _ in variations if os.path.exists(output_path)}
+        if not set(labels) <= available_labels:
+            return None
+
+        return source_hash, [variation for variation in variations if variation[0] in available_labels]
+
+
+    @staticmethod
+    def load(path: Optional[str], file_attachment_ids: Optional[dict] = None) -> "FileHashIndex":
+        """Build an index over file_attachment_ids, with the downloads persisted at path if there are any."""
+
+        index = FileHashIndex(file_attachment_ids)
+
+        if path and os.path.exists(path):
+            with open(path, 'r') as file:
+                persisted = json.load(file)
+            index._source_hashes_by_url = persisted.get("source_hashes_by_url", {})
+            index._variations_by_source_hash = persisted.get("variations_by_source_hash", {})
+
+        return index
+
+
+    def save(self, path: str):
+        """Persist the downloads (not the attachment ids) to path."""
+
+        temporary_path = f"{path}.tmp"
+        with open(temporary_path, 'w') as file:
+            json.dump({"source_hashes_by_url": self._source_hashes_by_url,
+                       "variations_by_source_hash": self._variations_by_source_hash}, file)
+        os.replace(temporary_path, path)
+
+
+
+class ImageJob(NamedTuple):
+    """One image to download and turn into variations. key is whatever the caller needs to match the result back up."""
+
+    key: object
+    url: str
+    original_output_dir: str
+    output_dir: str
+    base_name: str
+    originals_only: bool = False
+
+
+class ImageJobResult(NamedTuple):
+    job: ImageJob
+    variations: Optional[List[Tuple[str, str, str]]]  # [(label, output_path, sha256)], None if the job failed or was known
+    error: Optional[Exception] = None
+    source_hash: Optional[str] = None  # sha256 of the downloaded bytes
+
+    @property
+    def is_known(self) -> bool:
+        """The downloaded bytes matched a known hash, so nothing was decoded or written."""
+        return self.error is None and self.variations is None
+
+
+
+class ImageIngestion:
+    """Downloads images on a thread pool and resizes/encodes them on a process pool, streaming results back as they finish.
+
+    Downloads are I/O bound and release the GIL, resizing is CPU bound and doesn't, hence the two pools.
+    Results come back on the calling thread so the caller can keep doing all of its DB writes on one session.
+    """
+
+    # Concurrent downloads. Each one holds its image in memory until a process picks it up, which also bounds memory use.
+    download_workers = 16
+    # None lets ProcessPoolExecutor use one process per core
+    process_workers = None
+
+
+    @staticmethod
+    def _download_and_process(job: ImageJob,
+                              processors: ProcessPoolExecutor,
+                              known_hashes: Container[str]) -> ImageJobResult:
+        source_hash = None
+        try:
+            image_bytes, source_hash = ImageURLScaping.download_image_with_hash(job.url)
+
+            # Known content never reaches the process pool
+            if source_hash in known_hashes:
+                return ImageJobResult(job, None, source_hash=source_hash)
+
+            variations = processors.submit(ImageProcessing.generate_image_variations_from_bytes,
+                                           image_bytes,
+                                           job.original_output_dir,
+                                           job.output_dir,
+                                           job.base_name,
+                                           job.originals_only).result()
+        except Exception as e:
+            return ImageJobResult(job, None, e, source_hash)
+
+        return ImageJobResult(job, variations, source_hash=source_hash)
+
+
+    @staticmethod
+    def run(jobs: Iterable[ImageJob],
+            download_workers: Optional[int] = None,
+            process_workers: Optional[int] = None,
+            known_hashes: Container[str] = frozenset()) -> Iterator[ImageJobResult]:
+        """Yield an ImageJobResult for every job, in completion order. Failed jobs are yielded with their error, not raised.
+
+        Downloads whose sha256 is in known_hashes are yielded as is_known without being decoded. The caller may keep
+        adding to known_hashes while results stream in, later downloads are checked against it as it is then.
+        """
+
+        download_workers = download_workers or ImageIngestion.download_workers
+        process_workers = process_workers or ImageIngestion.process_workers
+
+        jobs = iter(jobs)
+        with ThreadPoolExecutor(max_workers=download_workers) as downloaders, \
+             ProcessPoolExecutor(max_workers=process_workers) as processors:
+
+            # Keep a bounded window of jobs in flight rather than queueing the whole catalog up front
+            pending = set()
+            for job in jobs:
+                pending.add(downloaders.submit(ImageIngestion._download_and_process, job, processors, known_hashes))
+                if len(pending) >= download_workers * 2:
+                    done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                    yield from (future.result() for future in done)
+
+            while pending:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                yield from (future.result() for future in done)
+
+
+
+class ThumbnailCache:
+    """Content-addressed on-disk cache of image variations made on demand, evicting the least recently used past max_bytes.
+
+    Entries are keyed on the source file's hash, the size label and `version`, so a key always names the same bytes
+    and doubles as a strong ETag. Recency is kept in file mtimes so it survives restarts. With several server
+    processes each one enforces max_bytes on its own view of the directory, so the limit is approximate.
+    """
+
+    # Bump whenever generate_variation_bytes changes its output, so stale entries stop matching
+    version = 1
+
+
+    def __init__(self, cache_dir: str, max_bytes: int):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()  # key -> size in bytes, least recently used first
+        self._total_bytes = 0
+        self._loaded = False
+        self._lock = threading.Lock()
+
+
+    def key(self, source_hash: str, label: str) -> str:
+        return hashlib.sha256(f"{self.version}:{source_hash}:{label}".encode()).hexdigest()
+
+
+    def path_for(self, key: str) -> str:
+        return os.path.join(self.cache_dir, key[:2], f"{key}.jpg")
+
+
+    def _load(self):
+        """Pick up entries left on disk by earlier runs, oldest first."""
+
+        found = []
+        for directory, _, filenames in os.walk(self.cache_dir):
+            for filename in filenames:
+                if filename.endswith(".jpg"):
+                    stat = os.stat(os.path.join(directory, filename))
+                    found.append((stat.st_mtime, filename[:-len(".jpg")], stat.st_size))
+
+        for _, key, size in sorted(found):
+            self._entries[key] = size
+            self._total_bytes += size
+
+        self._loaded = True
+
+
+    def _evict(self):
+        # Always keep the newest entry, even if it alone is over the limit
+        while self._total_bytes > self.max_bytes and len(self._entries) > 1:
+            key, size = self._entries.popitem(last=False)
+            self._total_bytes -= size
+            try:
+                os.remove(self.path_for(key))
+            except FileNotFoundError:
+                pass
+
+
+    def get_or_create(self, source_path: str, source_hash: str, label: str) -> Tuple[str, str]:
+        """Returns (path, etag) of the `label` variation of source_path, generating and caching it on first request."""
+
+        key = self.key(source_hash, label)
+        path = self.path_for(key)
+
+        with self._lock:
+            if not self._loaded:
+                self._load()
+
+            if key in self._entries and os.path.exists(path):
+                self._entries.move_to_end(key)
+                os.utime(path)
+                return path, key
+
+        # Generate outside the lock so one slow image doesn't hold up every other request
+        encoded = ImageProcessing.generate_variation_bytes(source_path, ImageProcessing.image_size_map[label])
+
+        # Write to a temporary name and rename, so a concurrent reader never sees half a file
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        temporary_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(temporary_path, 'wb') as file:
+            file.write(encoded)
+        os.replace(temporary_path, path)
+
+        with self._lock:
+            self._total_bytes += len(encoded) - self._entries.pop(key, 0)
+            self._entries[key] = len(encoded)
+            self._evict()
+
+        return path, key
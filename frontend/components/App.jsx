@@ -1,10 +1,11 @@
 const { React, ReactDOM } = window;
-const assets = window.assets;
 const categories = window.categories;
+const categoryCounts = window.categoryCounts;
 
 const App = () => {
   const [selectedAsset, setSelectedAsset] = React.useState(null);
   const [selectedCategory, setSelectedCategory] = React.useState(null);
+  const [searchQuery, setSearchQuery] = React.useState('');
   const [assetClicked, setAssetClicked] = React.useState(null);
 
   const handleAssetClick = (asset) => {
@@ -15,7 +16,7 @@ const App = () => {
   return (
     React.createElement('div', { id: 'app' },
       [
-        React.createElement(LeftPanel, { assets, categories, onAssetClick: handleAssetClick, selectedAsset, selectedCategory, setSelectedCategory }, null),
+        React.createElement(LeftPanel, { categories, categoryCounts, onAssetClick: handleAssetClick, selectedAsset, selectedCategory, setSelectedCategory, searchQuery, setSearchQuery }, null),
         React.createElement(RightPanel, { selectedAsset, assetClicked }, null)
 
       ]
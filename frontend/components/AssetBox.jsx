@@ -1,15 +1,13 @@
-
-// Function to remove unnecessary prefix from image paths
-const removePrefix = (path) => {
-  const prefix = '/home/dj/src/PARM-Production_Asset_Reservation_Manager/backend/database/data/file_attachments/';
-  return path ? path.replace(prefix, '/images/') : null;
-};
+// Sizes are generated on demand by the server, see /thumbnails in server.py
+const assetThumbnailUrl = (assetId, sizeLabel) => `/thumbnails/asset/${assetId}/${sizeLabel}`;
 
 const AssetBox = (props) => {
-  const { asset, selected, onClick, smallImagePath } = props;
-  // console.log('Small Image Path:', smallImagePath);
+  const { asset, selected, onClick } = props;
   const manufacturerName = asset.manufacturer_name || 'Unknown';
 
+  // Assets without an image 404, fall back to the manufacturer name
+  const [imageFailed, setImageFailed] = React.useState(false);
+
   const assetBoxClass = selected ? 'asset-box selected' : 'asset-box';
   
   const handleClick = () => {
@@ -20,8 +18,8 @@ const AssetBox = (props) => {
 
   return (
     <div className={assetBoxClass} onClick={handleClick}>
-      {smallImagePath ? (
-        <img src={removePrefix(smallImagePath)} alt={manufacturerName} />
+      {asset.id && !imageFailed ? (
+        <img src={assetThumbnailUrl(asset.id, '2-small')} alt={manufacturerName} loading="lazy" onError={() => setImageFailed(true)} />
       ) : (
         <p>{manufacturerName}</p>
       )}
@@ -29,4 +27,5 @@ const AssetBox = (props) => {
   );
 };
 
-window.AssetBox = AssetBox;
\ No newline at end of file
+window.AssetBox = AssetBox;
+window.assetThumbnailUrl = assetThumbnailUrl;
\ No newline at end of file
@@ -1,24 +1,108 @@
+// Number of assets requested from /api/assets per page
+const ASSET_PAGE_SIZE = 60;
+
+// The grid asks for the lean "grid" projection as one array per field, see database/projections.py
+const rowsFromColumns = (columns) => {
+  const fields = Object.keys(columns);
+  const rowCount = fields.length ? columns[fields[0]].length : 0;
+  const rows = new Array(rowCount);
+
+  for (let i = 0; i < rowCount; i++) {
+    const row = {};
+    for (const field of fields) {
+      row[field] = columns[field][i];
+    }
+    rows[i] = row;
+  }
+
+  return rows;
+};
+
+const buildAssetPageUrl = (selectedCategory, cursor, searchQuery) => {
+  const params = new URLSearchParams({ limit: ASSET_PAGE_SIZE, fields: 'grid', format: 'columnar' });
+
+  if (selectedCategory) {
+    params.append('category_id', selectedCategory);
+  }
+
+  // Searches are ranked by relevance and paged by offset instead of by (category_id, id)
+  if (searchQuery) {
+    params.append('q', searchQuery);
+    if (cursor) {
+      params.append('offset', cursor.offset);
+    }
+    return `/api/search?${params.toString()}`;
+  }
+
+  if (cursor) {
+    if (cursor.after_category_id !== null) {
+      params.append('after_category_id', cursor.after_category_id);
+    }
+    params.append('after_id', cursor.after_id);
+  }
+
+  return `/api/assets?${params.toString()}`;
+};
+
 const AssetGridContainer = (props) => {
-  const { selectedCategory, assets, onAssetClick, selectedAsset } = props;
+  const { selectedCategory, searchQuery, onAssetClick, selectedAsset } = props;
+
+  const [assets, setAssets] = React.useState([]);
+  const [nextCursor, setNextCursor] = React.useState(null);
+  const [hasMore, setHasMore] = React.useState(true);
+  const [loading, setLoading] = React.useState(false);
+
+  const sentinelRef = React.useRef(null);
+  // Bumped on every category or search change so responses for an old filter are dropped
+  const filterVersionRef = React.useRef(0);
 
-    console.log('Assets:', props.assets);
-    console.group("Category Selection");
-    console.log("%cSelected Category ID: " + props.selectedCategory, "color: green; font-size: 16px;");
-    console.groupEnd();
-    console.log(filteredAssets)
+  const loadPage = (cursor, filterVersion) => {
+    setLoading(true);
 
-    console.log('Type of selectedCategory:', typeof props.selectedCategory);
-    console.log('Type of first asset\'s category_id:', typeof props.assets[0].category_id);
+    fetch(buildAssetPageUrl(selectedCategory, cursor, searchQuery))
+      .then((response) => response.json())
+      .then((page) => {
+        if (filterVersion !== filterVersionRef.current) {
+          return;
+        }
+        const pageAssets = rowsFromColumns(page.assets);
+        setAssets((previous) => (cursor ? previous.concat(pageAssets) : pageAssets));
+        setNextCursor(page.next_cursor);
+        setHasMore(page.next_cursor !== null);
+        setLoading(false);
+      })
+      .catch((error) => {
+        console.error('Failed to load assets:', error);
+        setLoading(false);
+      });
+  };
 
-    // console.log('Assets:', assets);
+  // Start over from the first page whenever the category filter or search query changes
+  React.useEffect(() => {
+    filterVersionRef.current += 1;
+    setAssets([]);
+    setNextCursor(null);
+    setHasMore(true);
+    loadPage(null, filterVersionRef.current);
+  }, [selectedCategory, searchQuery]);
 
-    console.log('Assets in AssetGridContainer:', assets);
+  // Fetch the next page once the bottom of the grid scrolls into view
+  React.useEffect(() => {
+    const sentinel = sentinelRef.current;
+    if (!sentinel || !hasMore || loading || !nextCursor) {
+      return undefined;
+    }
 
+    const observer = new IntersectionObserver((entries) => {
+      if (entries[0].isIntersecting) {
+        observer.disconnect();
+        loadPage(nextCursor, filterVersionRef.current);
+      }
+    });
 
-  
-  const filteredAssets = (!selectedCategory || selectedCategory === "") 
-    ? assets 
-    : assets.filter(asset => asset.category_id === Number(selectedCategory));
+    observer.observe(sentinel);
+    return () => observer.disconnect();
+  }, [nextCursor, hasMore, loading]);
 
   return (
     <div className="asset-grid-container">
@@ -26,11 +110,11 @@ const AssetGridContainer = (props) => {
         <AssetBox 
           key={asset.id} 
           asset={asset} 
-          smallImagePath={asset.small_image_path}  // Pass down the small image path
           onClick={() => onAssetClick(asset)}
           selected={selectedAsset && selectedAsset.id === asset.id}
         />
       ))}
+      {hasMore && <div ref={sentinelRef} className="asset-grid-sentinel" />}
       {/* <InfoPanel asset={selectedAsset} largeImagePath={selectedAsset ? selectedAsset.large_image_path : null} /> */}
     </div>
   );
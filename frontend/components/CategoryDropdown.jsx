@@ -1,16 +1,24 @@
 function CategoryDropdown(props) {
     const categories = props.categories;
+    const categoryCounts = props.categoryCounts || {};
+
+    // Assets in the category and all of its subcategories, leaving out archived ones
+    function countLabel(id) {
+      const counts = categoryCounts[id];
+      return counts ? ` (${counts.subtree_asset_count - counts.subtree_archived_count})` : '';
+    }
       
     // Indenting the sub-categories for the dropdown list.
+    // Roots come keyed by id, children as arrays, so read the id off the node rather than the key.
     function renderOptions(tree, indent = 0) {
       const nbsp = "\u00A0".repeat(indent * 5);  // 4 spaces per indentation level
       
-      return Object.keys(tree).map((id) => (
-        <React.Fragment key={id}>
-          <option value={id}>
-            {nbsp}{tree[id].name}
+      return Object.values(tree).map((node) => (
+        <React.Fragment key={node.id}>
+          <option value={node.id}>
+            {nbsp}{node.name}{countLabel(node.id)}
           </option>
-          {tree[id].children.length > 0 && renderOptions(tree[id].children, indent + 1)}
+          {node.children.length > 0 && renderOptions(node.children, indent + 1)}
         </React.Fragment>
       ));
     }
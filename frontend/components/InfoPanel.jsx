@@ -9,9 +9,9 @@ const InfoPanel = (props) => {
 
   return React.createElement('div', { id: 'info-panel' },
     [
-      asset.large_image_path ? (
+      asset.id ? (
         React.createElement('div', { className: 'info-panel-asset-box' },
-          React.createElement('img', { src: removePrefix(asset.large_image_path), alt: asset.manufacturer_name || 'Unknown' }, null)
+          React.createElement('img', { src: assetThumbnailUrl(asset.id, '4-large'), alt: asset.manufacturer_name || 'Unknown' }, null)
         )
       ) : (
         React.createElement(AssetBox, { asset, className: 'info-panel-asset-box' }, null)
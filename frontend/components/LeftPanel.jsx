@@ -1,11 +1,11 @@
 const LeftPanel = (props) => {
-  const { assets, categories, onAssetClick, selectedAsset, selectedCategory, setSelectedCategory } = props;
+  const { categories, categoryCounts, onAssetClick, selectedAsset, selectedCategory, setSelectedCategory, searchQuery, setSearchQuery } = props;
   
   return (
     React.createElement('div', { id: 'left-panel'},
       [
-        React.createElement(UpperNavigation, { setSelectedCategory, categories }, null),
-        React.createElement(AssetGridContainer, { selectedCategory, assets, onAssetClick, selectedAsset }, null)
+        React.createElement(UpperNavigation, { setSelectedCategory, setSearchQuery, categories, categoryCounts }, null),
+        React.createElement(AssetGridContainer, { selectedCategory, searchQuery, onAssetClick, selectedAsset }, null)
       ]
     )
   );
@@ -1,8 +1,22 @@
-const SearchBar = () => {
+// Milliseconds of typing inactivity before the query is sent
+const SEARCH_DEBOUNCE_MS = 250;
+
+const SearchBar = (props) => {
+  const { onSearch } = props;
+  const [value, setValue] = React.useState('');
+
+  // Only report the query once typing pauses, so each keystroke doesn't cost a request
+  React.useEffect(() => {
+    const timeout = setTimeout(() => onSearch(value.trim()), SEARCH_DEBOUNCE_MS);
+    return () => clearTimeout(timeout);
+  }, [value]);
+
   return React.createElement('input', { 
-    type: 'text', 
+    type: 'search', 
     className: 'search-bar',
-    placeholder: 'Search...'
+    placeholder: 'Search...',
+    value,
+    onChange: (event) => setValue(event.target.value)
   }, null);
 };
 
@@ -15,8 +15,8 @@ const UpperNavigation = (props) => {
             },
             '🧀'
           ),
-          React.createElement(SearchBar, null, null),
-          React.createElement(CategoryDropdown, { setSelectedCategory: props.setSelectedCategory, categories: props.categories }, null),
+          React.createElement(SearchBar, { onSearch: props.setSearchQuery }, null),
+          React.createElement(CategoryDropdown, { setSelectedCategory: props.setSelectedCategory, categories: props.categories, categoryCounts: props.categoryCounts }, null),
         ]
       )
     );